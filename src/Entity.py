@@ -12,7 +12,8 @@ from ignifuga.Log import error, debug
 from Task import *
 
 import weakref,traceback
-from copy import deepcopy
+from collections import Mapping
+from ignifuga.SceneData import CowDict, thaw
 
 
 
@@ -125,15 +126,12 @@ class Entity(object):
         """ Initialize the required external data, take into account that this function may be called more than once if initialization fails """
         from ignifuga.components.Component import Component
         if not self._initialComponents and 'components' in self._data:
-            if isinstance(self._data['components'], dict):
+            if isinstance(self._data['components'], Mapping):
                 for c_id, c_data in self._data['components'].iteritems():
-                    c_data['id'] = c_id
-                    c_data['entity'] = self
-                    self._initialComponents.append(Component.create(**c_data))
+                    self._initialComponents.append(Component.create(**dict(c_data, id=c_id, entity=self)))
             elif isinstance(self._data['components'], list):
                 for c_data in self._data['components']:
-                    c_data['entity'] = self
-                    self._initialComponents.append(Component.create(**c_data))
+                    self._initialComponents.append(Component.create(**dict(c_data, entity=self)))
 
         failcount = {}
         while self._initialComponents:
@@ -172,7 +170,8 @@ class Entity(object):
 #        Gilbert().registerNode(self)
 
     def setup(self, **data):
-        self._data = deepcopy(data)
+        # Entities created from the same (frozen) data share it until they write to it
+        self._data = CowDict(data)
 
     def reset(self):
         Gilbert().gameLoop.stopEntity(self)
@@ -207,7 +206,8 @@ class Entity(object):
         #Load attributes from data
         for key,value in self._data.iteritems():
             if key not in ['entities', 'components']:
-                setattr(self, key, value)
+                # Attributes are the instance's own, modifiable all the way down and made of plain dicts and lists
+                setattr(self, key, thaw(value))
 
         self._initialComponents = []
 
@@ -14,6 +14,7 @@ import sys, pickle, os, weakref, gc, platform, copy, base64
 from optparse import OptionParser
 from ignifuga.rfoo import QueueInetServer, LOOPBACK, QueueWebsocketServer
 from ignifuga.rfoo.utils.rconsole import ConsoleHandler
+from ignifuga.SceneData import freeze
 import thread, socket
 
 class BACKENDS:
@@ -160,6 +161,7 @@ class Gilbert:
         from ignifuga.components import Component, Action, Text
 
         self.remoteConsole = None
+        self.profilerCSV = None
         usage = "game [options]"
         self.parser = OptionParser(usage=usage, version="Ignifuga Build Utility 1.0")
         self.parser.add_option("-d", "--display", dest="display", default=0,help="Display (default: 0)")
@@ -167,11 +169,16 @@ class Gilbert:
         self.parser.add_option("--height", dest="height", default=None,help="Resolution Height")
         self.parser.add_option("-w", "--windowed", action="store_true", dest="windowed", default=False,help="Start in windowed mode (default: no)")
         self.parser.add_option("-p", "--profile", action="store_true", dest="profile", default=False,help="Do a profile (ignored by the engine, useful for apps)")
+        self.parser.add_option("--frameprofile", dest="frameprofile", default=None,help="Profile every frame, dump the results as CSV to this file on exit")
+        self.parser.add_option("--dirtyrects", action="store_true", dest="dirtyrects", default=False,help="Redraw only the parts of the screen that changed (useful for mostly static scenes)")
+        self.parser.add_option("--framecache", dest="framecache", default=0, type="int",help="Video memory (in MB) used to share composed animation frames between sprites (default: 0, disabled)")
+        self.parser.add_option("--blurcache", dest="blurcache", default=8, type="int",help="Video memory (in MB) used to keep blurred sprite frames (default: 8, 0 blurs every frame with offset blits)")
         self.parser.add_option("-c", "--capture", action="store_true", dest="capture", default=False,help="Start paused (useful for video capture)")
         self.parser.add_option("-r", "--remote", action="store_true", dest="remote", default=False,help="Enable Remote Console (http://code.google.com/p/rfoo/)")
         self.parser.add_option("-t", "--telnetremote", action="store_true", dest="telnetremote", default=False,help="Enable A Telnet Remote Console")
         self.parser.add_option("-j", "--jsremote", action="store_true", dest="jsremote", default=False,help="Enable A Websockets Remote Console")
         self.parser.add_option("-s", "--remotescreen", action="store_true", dest="remotescreen", default=False,help="Create a MJPEG stream of the screen at port+1")
+        self.parser.add_option("--remotescreenquality", dest="remotescreenquality", default=100, type="int",help="JPEG quality of the remote screen stream, 1 to 100 (default: 100)")
 #if __LINUX__ or __OSX_ or __MINGW__
         # Dont pause by default on desktop
         self.parser.add_option("-e", "--pauseonfocuslost", action="store_true", dest="pauseonfocuslost", default=False,help="Pause the engine when input focus is lost")
@@ -240,6 +247,9 @@ class Gilbert:
         self.scenes = {}
         # A pointer to the current scene stored in self.scenes
         self.scene = None
+        # Scene prefetches by scene id, and the one whose assets the current scene is holding on to
+        self.prefetches = {}
+        self.scenePrefetch = None
         # These dictionaries keep weakrefs via WeakSet, contain the current scene entities
         self.entitiesByTag = {}
 
@@ -249,6 +259,11 @@ class Gilbert:
         self._lastEvent = None
 
         self.renderer = Renderer(width=options.width, height=options.height, fullscreen= not options.windowed, display=options.display, autoflip=not options.remotescreen)
+        if options.dirtyrects:
+            self.renderer.dirtyRendering = True
+        if options.framecache > 0:
+            self.renderer.frameCache.budget = options.framecache * 1024 * 1024
+        self.renderer.blurCache.budget = options.blurcache * 1024 * 1024
         self.dataManager = DataManager()
 
         options.port = int(options.port)
@@ -258,7 +273,10 @@ class Gilbert:
             self.startWebsocketRemoteConsole(options.ip, options.port, options.staticglobals)
         elif options.telnetremote:
             self.startSocketRemoteConsole(options.ip, options.port, options.staticglobals)
-        self.gameLoop = GameLoop(remoteConsole = self.remoteConsole, remoteScreen = options.remotescreen, ip=options.ip, port=options.port+1, pauseOnFocusLost = options.pauseonfocuslost)
+        self.gameLoop = GameLoop(remoteConsole = self.remoteConsole, remoteScreen = options.remotescreen, ip=options.ip, port=options.port+1, pauseOnFocusLost = options.pauseonfocuslost, remoteScreenQuality = options.remotescreenquality)
+
+        if options.frameprofile is not None:
+            self.startProfiler(csvFile=options.frameprofile)
 
         if options.capture:
             print "System paused, press Enter to continue"
@@ -297,6 +315,7 @@ class Gilbert:
         self.gameLoop.run()
 
         # Engine is exiting from here onwards
+        self.stopProfiler()
         debug('Saving state')
         self.saveState()
 
@@ -424,9 +443,10 @@ class Gilbert:
             return False
 
         # As scene data may be cached or still referenced when the loop ends,
-        # we iterate over a deepcopy of it to avoid a reference circle with entities
-        # that prevents them from being garbage collected
-        for scene_id, scene_data in copy.deepcopy(scenes).iteritems():
+        # we iterate over a read only copy of it to avoid a reference circle with entities
+        # that prevents them from being garbage collected. Scenes, entities and components share it from there on
+        # (precompiled data is read only already and it's not copied at all)
+        for scene_id, scene_data in freeze(scenes).iteritems():
             self.loadScene(scene_id, scene_data, data_url)
 
     def loadScene(self, scene_id, scene_data, data_url = None):
@@ -452,6 +472,9 @@ class Gilbert:
 #            self.resetScene(scene_id)
 
         self.resetScene()
+        for prefetch in self.prefetches.itervalues():
+            prefetch.release()
+        self.prefetches = {}
         self.scenes = {}
         # Clean up cache
         self.dataManager.cleanup()
@@ -475,6 +498,11 @@ class Gilbert:
         self.scene = None
         self.entitiesByTag = {}
 
+        # The assets prefetched for the scene are now only held by the cache
+        if self.scenePrefetch is not None:
+            self.scenePrefetch.release()
+            self.scenePrefetch = None
+
         # Clean up cache
         # Do not clean the cache here, there may be useful data for other scenes -> self.dataManager.cleanup()
         gc.collect()
@@ -484,9 +512,32 @@ class Gilbert:
     def changeScene(self, scene_id):
         debug("Switching scene to: %s " % scene_id)
         self.resetScene()
+        # The prefetched assets are held while the scene runs (prefetching goes on if it didn't finish)
+        self.scenePrefetch = self.prefetches.pop(scene_id, None)
         self.renderer.scrollTo(0,0)
         return self.startScene(scene_id)
 
+    def prefetchScene(self, scene_id, perFrame=4):
+        """ Start loading the assets of a scene in the background, so changing to it later doesn't stall loading them.
+        Returns the prefetch (see its progress and done properties), or None if the scene doesn't exist
+        """
+        if scene_id not in self.scenes:
+            error("COULD NOT FIND SCENE %s" % scene_id)
+            return None
+        if scene_id not in self.prefetches:
+            from ignifuga.Prefetch import ScenePrefetch, sceneAssets
+            prefetch = ScenePrefetch(scene_id, sceneAssets(self.scenes[scene_id]._data), perFrame)
+            self.prefetches[scene_id] = prefetch
+            self.gameLoop.startComponent(prefetch)
+        return self.prefetches[scene_id]
+
+    def prefetchProgress(self, scene_id):
+        """ Fraction of a scene's assets prefetched (0.0 to 1.0), None if it's not being prefetched """
+        prefetch = self.prefetches.get(scene_id)
+        if prefetch is None and self.scenePrefetch is not None and self.scenePrefetch.scene_id == scene_id:
+            prefetch = self.scenePrefetch
+        return prefetch.progress if prefetch is not None else None
+
     def startEntity(self, entity):
         # Add it to the loading queue
         self.gameLoop.startEntity(entity)
@@ -503,6 +554,23 @@ class Gilbert:
 
         return None
 
+    def startProfiler(self, frames=600, csvFile=None):
+        """ Start the frame profiler, keeping the last frames samples. If csvFile is set, they are dumped there when stopped """
+        self.profilerCSV = csvFile
+        return self.gameLoop.startProfiler(frames)
+
+    def stopProfiler(self):
+        profiler = self.gameLoop.stopProfiler()
+        if profiler is not None and self.profilerCSV is not None:
+            profiler.dumpCSV(self.profilerCSV)
+        return profiler
+
+    def profilerReport(self, top=10):
+        """ Frame profiler summary, ie from the remote console: print Gilbert().profilerReport() """
+        if self.gameLoop.profiler is None:
+            return 'Profiler is not running, start it with Gilbert().startProfiler()'
+        return self.gameLoop.profiler.report(top)
+
     def freezeRenderer(self):
         self.gameLoop.freezeRenderer = True
 
@@ -0,0 +1,89 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+
+# Ignifuga Game Engine
+# Asset pack file format
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+# A pack is a single file holding many assets, meant to be memory mapped once and read in place.
+# Everything is little endian:
+#   Header: magic (4 bytes), version (uint32), entry count (uint32), blob alignment (uint32)
+#   Index: one entry per asset, sorted by hash: url hash (uint64), offset (uint64), length (uint32), flags (uint32)
+#   Blobs: the asset contents, each one starting at a multiple of the alignment
+# Assets are found by the FNV-1a hash of their normalized url, the packer refuses urls whose hashes collide.
+# Pure Python on purpose, the packer (tools/packer.py) uses it without the engine.
+
+import os, struct
+
+PACK_MAGIC = 'IGPK'
+PACK_VERSION = 1
+PACK_ALIGNMENT = 16
+# No flags are defined in this version, the loader rejects entries that have any
+PACK_FLAGS_KNOWN = 0
+
+HEADER = struct.Struct('<4sIII')
+ENTRY = struct.Struct('<QQII')
+
+def normalizeURL(url):
+    """ The form urls are hashed in, forward slashes and no leading ./ """
+    url = url.replace('\\', '/')
+    while url.startswith('./'):
+        url = url[2:]
+    return url
+
+def urlHash(url):
+    """ 64 bit FNV-1a of the normalized url """
+    h = 14695981039346656037L
+    for c in normalizeURL(url):
+        h = ((h ^ ord(c)) * 1099511628211L) & 0xFFFFFFFFFFFFFFFFL
+    return h
+
+def readIndex(data):
+    """ Parse the header and index of a pack (any buffer), returns a list of (hash, offset, length, flags) sorted by hash """
+    if len(data) < HEADER.size:
+        raise ValueError('Not an asset pack')
+    magic, version, count, alignment = HEADER.unpack_from(data, 0)
+    if magic != PACK_MAGIC or version != PACK_VERSION:
+        raise ValueError('Not an asset pack, or unsupported version')
+    if HEADER.size + count * ENTRY.size > len(data):
+        raise ValueError('Truncated asset pack index')
+    entries = []
+    for i in range(count):
+        entry = ENTRY.unpack_from(data, HEADER.size + i * ENTRY.size)
+        if entry[1] + entry[2] > len(data):
+            raise ValueError('Asset pack entry out of bounds')
+        if entry[3] & ~PACK_FLAGS_KNOWN:
+            raise ValueError('Unsupported asset pack entry flags')
+        entries.append(entry)
+    return entries
+
+def writePack(dst, assets, alignment=PACK_ALIGNMENT):
+    """ Write a pack from a list of (url, source file path), returns the size of the file written """
+    hashes = {}
+    for url, path in assets:
+        h = urlHash(url)
+        if h in hashes and hashes[h] != normalizeURL(url):
+            raise ValueError('Hash collision between %s and %s' % (hashes[h], url))
+        hashes[h] = normalizeURL(url)
+
+    assets = sorted(dict((urlHash(url), path) for url, path in assets).items())
+    offset = HEADER.size + len(assets) * ENTRY.size
+    index = []
+    for h, path in assets:
+        offset = (offset + alignment - 1) / alignment * alignment
+        length = os.path.getsize(path)
+        index.append((h, offset, length, 0))
+        offset += length
+
+    with open(dst, 'wb') as f:
+        f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, len(index), alignment))
+        for entry in index:
+            f.write(ENTRY.pack(*entry))
+        for (h, path), entry in zip(assets, index):
+            f.write('\0' * (entry[1] - f.tell()))
+            with open(path, 'rb') as src:
+                f.write(src.read())
+        return f.tell()
@@ -0,0 +1,122 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+
+# Ignifuga Game Engine
+# Scene asset prefetching
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.Gilbert import Gilbert
+from ignifuga.Log import debug, error
+from ignifuga.backends.GameLoopBase import TASK_REQUEST_STOP
+from collections import Mapping
+import traceback
+
+def sceneAssets(data):
+    """ The assets the components of a scene (given its data) load when they are initialized, as (kind, url, size) tuples """
+    from ignifuga.components.Component import Component
+
+    components = [data.get('components')]
+    entities = data.get('entities')
+    if isinstance(entities, Mapping):
+        components += [entity_data.get('components') for entity_data in entities.itervalues() if isinstance(entity_data, Mapping)]
+
+    assets = []
+    seen = set()
+    for c_datas in components:
+        if isinstance(c_datas, Mapping):
+            c_datas = c_datas.values()
+        elif not isinstance(c_datas, list):
+            continue
+        for c_data in c_datas:
+            klass = Component.__inheritors__.get(c_data.get('type')) if isinstance(c_data, Mapping) else None
+            if klass is None:
+                continue
+            for asset in klass.assets(c_data):
+                if asset not in seen:
+                    seen.add(asset)
+                    assets.append(asset)
+    return assets
+
+class ScenePrefetch(object):
+    """ Warms up the data manager cache with the assets of a scene, so changing to it doesn't stall loading them.
+    Images are decoded in the background and only perFrame textures are uploaded (or sounds or fonts loaded) per frame.
+    The assets loaded are held until release is called.
+    """
+    def __init__(self, scene_id, assets, perFrame=4):
+        self.scene_id = scene_id
+        self.pending = list(assets)
+        self.total = len(self.pending)
+        self.perFrame = perFrame
+        self.held = []
+        self.failed = 0
+        self.released = False
+        self.started = False
+
+    @property
+    def progress(self):
+        """ Fraction of the assets loaded (or given up on), from 0.0 to 1.0 """
+        if self.total == 0:
+            return 1.0
+        return float(self.total - len(self.pending)) / self.total
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def tick(self, now):
+        if self.released:
+            return TASK_REQUEST_STOP
+
+        dataManager = Gilbert().dataManager
+        if not self.started:
+            # Every image starts decoding right away, only uploading them is spread over frames
+            for kind, url, size in self.pending:
+                if kind == 'image':
+                    dataManager.requestImage(url)
+            self.started = True
+
+        loaded = 0
+        pending = []
+        for asset in self.pending:
+            kind, url, size = asset
+            if loaded >= self.perFrame or (kind == 'image' and not dataManager.requestImage(url)):
+                pending.append(asset)
+                continue
+            try:
+                if kind == 'image':
+                    data = dataManager.getImage(url)
+                elif kind == 'chunk':
+                    data = dataManager.getChunk(url)
+                elif kind == 'music':
+                    data = dataManager.getMusic(url)
+                elif kind == 'font':
+                    data = dataManager.getFont(url, size)
+                else:
+                    data = None
+            except:
+                error('Error prefetching %s %s' % (kind, url))
+                error(traceback.format_exc())
+                data = None
+            if data is not None:
+                self.held.append(data)
+            else:
+                self.failed += 1
+            loaded += 1
+        self.pending = pending
+
+        if not self.pending:
+            debug('Prefetched scene %s (%d assets, %d failed)' % (self.scene_id, self.total, self.failed))
+            return TASK_REQUEST_STOP
+
+    def release(self):
+        """ Stop prefetching and give back the assets loaded, the data manager keeps them while they fit in its budget """
+        if not self.released:
+            dataManager = Gilbert().dataManager
+            for data in self.held:
+                dataManager.release(data)
+            self.held = []
+            self.pending = []
+            self.released = True
@@ -0,0 +1,199 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Read only scene data and its precompiled binary form
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+# This module doesn't depend on the rest of the engine, tools/scenecompiler.py uses it offline
+
+import marshal
+from copy import deepcopy
+from collections import MutableMapping
+
+try:
+    # Safe marshal, refuses code objects
+    from ignifuga.rfoo.marsh import loads as _loads
+except ImportError:
+    _loads = marshal.loads
+
+COMPILED_MAGIC = 'IGSC\x01'
+
+def _readOnly(self, *args, **kwargs):
+    raise TypeError('Scene data is read only, use copyData to get a modifiable copy')
+
+class FrozenDict(dict):
+    """ A dict that can't be modified, so it can be shared between scenes, entities and components without copying it """
+    __slots__ = ()
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readOnly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+class FrozenList(list):
+    """ A list that can't be modified """
+    __slots__ = ()
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _readOnly
+    append = extend = insert = pop = remove = reverse = sort = _readOnly
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+_MISSING = object()
+
+class CowDict(MutableMapping):
+    """ Copy on write mapping, reads come from a frozen base that copies share and writes go to an overlay of its own.
+    Values inside the base stay read only, mutable(key) swaps one of them for a modifiable version the first time.
+    It isn't a dict, thaw it for code that needs one (isinstance checks, json)
+    """
+    def __init__(self, base=None, **overlay):
+        if isinstance(base, CowDict):
+            self._base = base._base
+            self._overlay = dict((key, value if value is _MISSING else copyData(value)) for key, value in base._overlay.iteritems())
+        else:
+            self._base = freeze(base) if base is not None else FrozenDict()
+            self._overlay = {}
+        if overlay:
+            self._overlay.update(overlay)
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            value = self._overlay[key]
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return self._base[key]
+
+    def __setitem__(self, key, value):
+        self._overlay[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._base:
+            # Keys deleted from the base are overlaid with a marker that hides them
+            self._overlay[key] = _MISSING
+        else:
+            del self._overlay[key]
+
+    def __contains__(self, key):
+        if key in self._overlay:
+            return self._overlay[key] is not _MISSING
+        return key in self._base
+
+    def __iter__(self):
+        overlay = self._overlay
+        for key, value in overlay.iteritems():
+            if value is not _MISSING:
+                yield key
+        for key in self._base:
+            if key not in overlay:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return 'CowDict(%r)' % dict(self.iteritems())
+
+    def mutable(self, key):
+        """ The value for key, made modifiable without touching the shared base if it's frozen """
+        value = self[key]
+        if isinstance(value, FrozenDict):
+            value = self[key] = CowDict(value)
+        elif isinstance(value, FrozenList):
+            value = self[key] = list(value)
+        return value
+
+    def copy(self):
+        return CowDict(self)
+
+    def __copy__(self):
+        return CowDict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return CowDict, (dict(self.iteritems()),)
+
+def sanitizeData (k,v, p=True):
+    """ Sanitize data, convert keys in the data to str"""
+    key = str(k)
+    if isinstance(v, dict):
+        value = {}
+        for k1, v1 in v.items():
+            key1, value1 = sanitizeData(k1,v1)
+            value[key1] = value1
+    elif isinstance(v, list):
+        value = []
+        for v1 in v:
+            k1,v1 =  sanitizeData(key, v1)
+            value.append(v1)
+    else:
+        value = v
+
+    return key, value
+
+def freeze(data):
+    """ Read only version of plain data (dicts, lists and scalars) """
+    if isinstance(data, (FrozenDict, FrozenList)):
+        return data
+    if isinstance(data, (dict, CowDict)):
+        return FrozenDict((key, freeze(value)) for key, value in data.iteritems())
+    if isinstance(data, list):
+        return FrozenList(freeze(value) for value in data)
+    return data
+
+def thaw(data):
+    """ Modifiable deep copy of data, frozen or not. CowDict come out as plain dicts """
+    if data is None or isinstance(data, (basestring, int, long, float)):
+        return data
+    if isinstance(data, (dict, CowDict)):
+        return dict((key, thaw(value)) for key, value in data.iteritems())
+    if isinstance(data, list):
+        return [thaw(value) for value in data]
+    return deepcopy(data)
+
+def copyData(data):
+    """ Copy data so the copy can be kept without the original changing under it. Frozen parts are shared as they are,
+    for anything else this is a deepcopy
+    """
+    if isinstance(data, (FrozenDict, FrozenList)):
+        return data
+    if isinstance(data, CowDict):
+        return data.copy()
+    if isinstance(data, dict):
+        return dict((key, copyData(value)) for key, value in data.iteritems())
+    if isinstance(data, list):
+        return [copyData(value) for value in data]
+    if data is None or isinstance(data, (basestring, int, long, float)):
+        return data
+    return deepcopy(data)
+
+def compileData(data):
+    """ Binary form of sanitized data """
+    return COMPILED_MAGIC + marshal.dumps(data, 1)
+
+def loadCompiled(contents):
+    """ Frozen data from its binary form, None if it's not valid """
+    if contents is None or not contents.startswith(COMPILED_MAGIC):
+        return None
+    try:
+        return freeze(_loads(contents[len(COMPILED_MAGIC):]))
+    except ValueError:
+        return None
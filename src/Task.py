@@ -9,7 +9,7 @@
 # Author: Gabriel Jacobo <gabriel@mdqinc.com>
 
 import greenlet
-from ignifuga.backends.GameLoopBase import TASK_REQUEST_DONE, TASK_REQUEST_LOADIMAGE, TASK_REQUEST_ERROR, TASK_REQUEST_STOP, TASK_REQUEST_SKIP
+from ignifuga.backends.GameLoopBase import TASK_REQUEST_DONE, TASK_REQUEST_LOADIMAGE, TASK_REQUEST_ERROR, TASK_REQUEST_STOP, TASK_REQUEST_SKIP, TASK_REQUEST_SLEEP
 
 def DONE(data=None):
     g = greenlet.getcurrent()
@@ -31,3 +31,6 @@ def LOAD_IMAGE(url):
     g = greenlet.getcurrent()
     return g.parent.switch((TASK_REQUEST_LOADIMAGE, {'url': url}))
 
+def SLEEP(ms):
+    g = greenlet.getcurrent()
+    return g.parent.switch((TASK_REQUEST_SLEEP, ms))
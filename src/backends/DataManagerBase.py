@@ -70,50 +70,210 @@ class WRDict(dict):
 #        """ Compare against the data"""
 #        return self.data == other
 from ignifuga.Log import *
+from collections import OrderedDict
+from os.path import normpath
 
 class DataManagerBase(object):
+    # Bytes of unreferenced assets kept around for each kind of asset, the least recently used are evicted past them.
+    # Scene data ('data') isn't reference counted, it's always evictable and its size is that of the file it was read from
+    budgets = {
+        'image': 32*1024*1024,
+        'chunk': 8*1024*1024,
+        'music': 4*1024*1024,
+        'font': 2*1024*1024,
+        'data': 1024*1024
+    }
+
     def __init__(self):
         self.cache = {}
+        # Listeners by the normalized url of the file they want reloads of
         self.notifications = {}
+        # Cached urls by the normalized url of the file their data comes from, and the other way around
+        self.sources = {}
+        self.origins = {}
+        # Files changed since the last flush, by normalized url in the order they changed
+        self.pendingReloads = OrderedDict()
+        self.budgets = dict(self.budgets)
+        # Counted assets: url -> kind, url -> references, asset -> url (scene data only has a kind)
+        self.kinds = {}
+        self.refs = {}
+        self.urls = {}
+        # Unreferenced assets by kind, url -> size in LRU order, and their total size
+        self.unused = {}
+        self.unusedSize = {}
 
     def __del__(self):        
         self.cleanup(True)
 
     def cleanup(self, force = False):
-        #debug('Releasing Data Manager contents %s' % ('(forced)' if force else '',))
-        keys = []
-        for url in self.cache.iterkeys():
-            refCnt = len(gc.get_referrers(self.cache[url]))
-            if force or refCnt <= 1:
-                keys.append(url)
-
-        if keys:
-            debug( "DataManager will release: %s" % keys)
-        for url in keys:
-            refCnt = len(gc.get_referrers(self.cache[url]))
-            if refCnt > 1:
-                error('Error: Releasing data for %s with ref count: %d' % (url, refCnt))
-            del self.cache[url]
+        """ Evict the unreferenced assets that don't fit in their budget, or everything if forced """
+        if force:
+            #debug('Releasing Data Manager contents (forced)')
+            for url in self.refs.keys():
+                if self.refs[url] > 0:
+                    error('Error: Releasing data for %s with ref count: %d' % (url, self.refs[url]))
+            self.cache.clear()
+            self.sources.clear()
+            self.origins.clear()
+            self.kinds.clear()
+            self.refs.clear()
+            self.urls.clear()
+            self.unused.clear()
+            self.unusedSize.clear()
+            return
+
+        for kind in self.unused.keys():
+            self._evict(kind)
+
+    def normalizeURL(self, url):
+        """ The form urls are indexed in, to find what depends on a file when it changes """
+        return normpath(url).replace('\\', '/')
+
+    def _source(self, url, source=None):
+        """ Index a cached url under the file its data comes from (the url itself by default) """
+        source = self.normalizeURL(source if source is not None else url)
+        if source not in self.sources:
+            self.sources[source] = set()
+        self.sources[source].add(url)
+        self.origins[url] = source
+
+    def _store(self, url, kind, asset, source=None):
+        """ Add an unreferenced asset to the cache, the first get takes a reference on it """
+        self.cache[url] = asset
+        self._source(url, source)
+        self.kinds[url] = kind
+        self.refs[url] = 0
+        self.urls[asset] = url
+        self._unused(url)
+        return asset
+
+    def _storeData(self, url, data, size, source=None):
+        """ Add scene data to the cache, it's evicted in LRU order with the unreferenced assets when it's past the 'data' budget """
+        self.cache[url] = data
+        self._source(url, source)
+        self.kinds[url] = 'data'
+        if 'data' not in self.unused:
+            self.unused['data'] = OrderedDict()
+            self.unusedSize['data'] = 0
+        self.unused['data'][url] = size
+        self.unusedSize['data'] += size
+        self._evict('data')
+        return data
+
+    def _touch(self, url):
+        """ Move cached scene data to the most recently used end, returns it """
+        unused = self.unused.get(self.kinds.get(url))
+        if unused is not None and url in unused:
+            unused[url] = unused.pop(url)
+        return self.cache[url]
+
+    def _acquire(self, url):
+        """ Take a reference on a cached asset and return it """
+        if url not in self.refs:
+            # Not a counted asset
+            return self.cache[url]
+        if self.refs[url] == 0:
+            self.unusedSize[self.kinds[url]] -= self.unused[self.kinds[url]].pop(url)
+        self.refs[url] += 1
+        return self.cache[url]
+
+    def release(self, asset):
+        """ Give back a reference on an asset returned by getImage, getChunk, getMusic or getFont """
+        url = self.urls.get(asset)
+        if url is None or self.refs[url] == 0:
+            # Dropped already (reloaded or released too many times)
+            return
+        self.refs[url] -= 1
+        if self.refs[url] == 0:
+            self._unused(url)
+            self._evict(self.kinds[url])
+
+    def _unused(self, url):
+        kind = self.kinds[url]
+        if kind not in self.unused:
+            self.unused[kind] = OrderedDict()
+            self.unusedSize[kind] = 0
+        size = getattr(self.cache[url], 'size', 0)
+        self.unused[kind][url] = size
+        self.unusedSize[kind] += size
+
+    def _evict(self, kind):
+        """ Drop the least recently used unreferenced assets until they fit in the budget """
+        budget = self.budgets.get(kind, 0)
+        unused = self.unused.get(kind)
+        while unused and self.unusedSize[kind] > budget:
+            url, size = unused.popitem(last=False)
+            self.unusedSize[kind] -= size
+            self._drop(url)
+
+    def _drop(self, url):
+        """ Forget a cached asset """
+        asset = self.cache.pop(url, None)
+        source = self.origins.pop(url, None)
+        if source is not None:
+            self.sources[source].discard(url)
+            if not self.sources[source]:
+                del self.sources[source]
+        if url in self.kinds:
+            kind = self.kinds.pop(url)
+            if self.refs.pop(url, 0) == 0 and url in self.unused[kind]:
+                self.unusedSize[kind] -= self.unused[kind].pop(url)
+            if kind != 'data':
+                self.urls.pop(asset, None)
+
+    def setBudget(self, kind, size):
+        """ Set the bytes of unreferenced assets of a kind ('image', 'chunk', 'music', 'font' or 'data') kept in the cache """
+        self.budgets[kind] = size
+        self._evict(kind)
+
+    @property
+    def stats(self):
+        return dict((kind, {'unused': len(self.unused[kind]), 'unusedSize': self.unusedSize[kind], 'budget': self.budgets.get(kind, 0),
+                            'referenced': len([url for url in self.refs if self.kinds[url] == kind and self.refs[url] > 0])})
+                    for kind in self.unused)
 
     def loadJsonFile(self, name):
         raise Exception('method not implemented')
 
+    def loadCompiledFile(self, name, sourceName=None):
+        raise Exception('method not implemented')
+
     def getImage(self, url):
         raise Exception('method not implemented')
 
+    def requestImage(self, url):
+        """ Returns True when getImage can serve url without stalling. Backends that can't load in the background are always ready """
+        return True
+
     def getFont(self, url, size):
         raise Exception('method not implemented')
 
     def urlReloaded(self, url):
+        """ A file changed, what depends on it is reloaded on the next flushReloads, once however many times it changed """
+        self.pendingReloads[self.normalizeURL(url)] = None
+
+    def flushReloads(self):
+        """ Reload what depends on the files that changed since the last flush (the game loop flushes every frame) """
+        pending = self.pendingReloads
+        self.pendingReloads = OrderedDict()
+        for url in pending:
+            self._urlReloaded(url)
+
+    def _urlReloaded(self, url):
         raise Exception('method not implemented')
 
     def addListener(self, url, obj):
+        url = self.normalizeURL(url)
         if url not in self.notifications:
-            self.notifications[url] = []
-
-        if obj not in self.notifications[url]:
-            self.notifications[url].append(obj)
+            self.notifications[url] = set()
+        self.notifications[url].add(obj)
 
     def removeListener(self, url, obj):
-        if url in self.notifications and obj in self.notifications[url]:
-            self.notifications[url].remove(obj)
+        if url is None:
+            return
+        url = self.normalizeURL(url)
+        listeners = self.notifications.get(url)
+        if listeners is not None:
+            listeners.discard(obj)
+            if not listeners:
+                del self.notifications[url]
@@ -22,6 +22,7 @@ from libc.string cimport *
 from libcpp.map cimport *
 from libcpp.deque cimport *
 from libcpp.pair cimport *
+from libcpp.vector cimport *
 
 cdef extern from "Python.h":
     struct _frame
@@ -57,6 +58,7 @@ ctypedef enum REQUESTS:
     REQUEST_STOP = 0x00000004
     REQUEST_LOADIMAGE = 0x0000008
     REQUEST_ERROR = 0x0000010
+    REQUEST_SLEEP = 0x0000020
 
 cdef struct _Task:
     PyGreenlet *greenlet
@@ -65,9 +67,17 @@ cdef struct _Task:
     PyObject *runnable
     PyObject *data
     bint release
+    unsigned long wakeup
 
 ctypedef _Task*  _Task_p
 
+cdef struct _Tick:
+    PyObject *entity
+    PyObject *tick
+    bint release
+
+ctypedef _Tick* _Tick_p
+
 ctypedef PyObject* PyObject_p
 
 ctypedef deque[_Task].iterator task_iterator
@@ -77,17 +87,28 @@ cdef class GameLoopBase(object):
     cdef public double _fps
     cdef str platform
     cdef deque[_Task] *loading, *loading_tmp, *running, *running_tmp
+    cdef vector[_Tick] *ticking, *ticking_tmp
+    cdef vector[_Task] *sleeping
     cdef readonly unsigned long frame_time, _interval, ticks_second
     cdef PyGreenlet *main_greenlet
     cdef bint updateRemoteConsole
     cdef object remoteConsole
     cdef bint enableRemoteScreen, pauseOnFocusLost
+    cdef bint profiling
     cdef object remoteScreenServer, remoteScreenHandlers
 
 
     cpdef startEntity(self, entity, bint load_phase=*)
     cpdef startComponent(self, component)
     cdef startRunnable(self, entity, bint load_phase=*, runnable=*)
+    cdef startTick(self, entity, tick)
+    cdef _updateTicks(self, unsigned long now, bint wrapup)
+    cdef _sleepTask(self, _Task *taskp)
+    cdef _wakeTasks(self, unsigned long now, bint wrapup)
+    cdef _siftUp(self, size_t pos)
+    cdef _siftDown(self, size_t pos)
+    cdef _profileTaskStart(self)
+    cdef _profileTaskEnd(self, PyObject *entity)
     cpdef bint stopEntity(self, entity)
     cpdef bint stopComponent(self, component)
     cpdef update(self, unsigned long now=*, bint wrapup=*)
@@ -19,7 +19,7 @@ class MultiThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     pass
 
 import thread, threading
-#import traceback
+import traceback
 
 # Python enum exports
 EVENT_TYPE_TOUCH_DOWN = EVENT_TOUCH_DOWN
@@ -36,6 +36,7 @@ TASK_REQUEST_SKIP = REQUEST_SKIP
 TASK_REQUEST_STOP = REQUEST_STOP
 TASK_REQUEST_LOADIMAGE = REQUEST_LOADIMAGE
 TASK_REQUEST_ERROR = REQUEST_ERROR
+TASK_REQUEST_SLEEP = REQUEST_SLEEP
 
 
 cdef bint isdead(PyGreenlet* greenlet):
@@ -52,9 +53,18 @@ cdef bint isdead(PyGreenlet* greenlet):
     return True
 
 class HTTPRemoteScreenHandler(BaseHTTPRequestHandler):
+    """ Streams the screen as MJPEG. At /tiles only the tiles that changed are sent, every part carries an X-Tile: x,y,w,h header
+    and the first one is the whole screen
+    """
+    MAX_PENDING_FRAMES = 10
+
     def do_GET(self):
         self.screen = None
         self.screenSize = 0
+        self.tiles = self.path.startswith('/tiles')
+        self.pending = []
+        self.needsFull = True
+        self.lock = threading.Lock()
         self.sem = threading.Semaphore(0)
         Gilbert().gameLoop.addRemoteScreenHandler(self)
         BOUNDARY = 'IGNIFUGA-FRAME'
@@ -66,7 +76,18 @@ class HTTPRemoteScreenHandler(BaseHTTPRequestHandler):
 
             while True:
                 self.sem.acquire()
-                if self.screen is not None:
+                if self.tiles:
+                    with self.lock:
+                        frames = self.pending
+                        self.pending = []
+                    for frame in frames:
+                        for x, y, w, h, jpeg in frame:
+                            self.wfile.write('--%s\r\n' % BOUNDARY)
+                            self.wfile.write('Content-Type: image/jpeg\r\n')
+                            self.wfile.write('X-Tile: %d,%d,%d,%d\r\n' % (x, y, w, h))
+                            self.wfile.write('Content-Length: %d\r\n\r\n' % len(jpeg))
+                            self.wfile.write(jpeg)
+                elif self.screen is not None:
                     self.wfile.write('--%s\r\n' % BOUNDARY)
                     self.wfile.write('Content-Type: image/jpeg\r\n')
                     self.wfile.write('Content-Length: %d\r\n\r\n' % self.screenSize)
@@ -76,6 +97,22 @@ class HTTPRemoteScreenHandler(BaseHTTPRequestHandler):
             pass
         Gilbert().gameLoop.removeRemoteScreenHandler(self)
 
+    def pushScreen(self, screen):
+        """ Replace the frame waiting to be sent, if any """
+        self.screen = screen
+        self.screenSize = len(screen)
+        self.sem.release()
+
+    def pushTiles(self, tiles):
+        """ Queue the changed tiles of a frame, a client that falls too far behind starts over from a full frame """
+        with self.lock:
+            if len(self.pending) >= self.MAX_PENDING_FRAMES:
+                self.pending = []
+                self.needsFull = True
+                return
+            self.pending.append(tiles)
+        self.sem.release()
+
 cdef class GameLoopBase(object):
     def __init__(self, fps = 30.0, remoteConsole = None, remoteScreen = False, ip='127.0.0.1', port=54322, pauseOnFocusLost=False):
         # SDL should be initialized at this point when Renderer was instantiated
@@ -84,6 +121,7 @@ cdef class GameLoopBase(object):
         self.frame_time = 0
         self.freezeRenderer = True
         self.released = False
+        self.profiling = False
         self.enableRemoteScreen = remoteScreen
         self.pauseOnFocusLost = pauseOnFocusLost
 
@@ -91,6 +129,9 @@ cdef class GameLoopBase(object):
         self.loading_tmp = new deque[_Task]()
         self.running = new deque[_Task]()
         self.running_tmp = new deque[_Task]()
+        self.ticking = new vector[_Tick]()
+        self.ticking_tmp = new vector[_Tick]()
+        self.sleeping = new vector[_Task]()
 
         PyGreenlet_Import()
         self.main_greenlet = PyGreenlet_GetCurrent()
@@ -122,6 +163,7 @@ cdef class GameLoopBase(object):
     cpdef free(self):
         cdef _Task *task
         cdef task_iterator iter
+        cdef size_t i
 
         if not self.released:
             debug("Releasing Game Loop data")
@@ -150,12 +192,26 @@ cdef class GameLoopBase(object):
                 self.taskDecRef(task)
                 inc(iter)
 
+            for i in range(self.sleeping.size()):
+                self.taskDecRef(&self.sleeping[0][i])
+
+            for i in range(self.ticking.size()):
+                Py_XDECREF(self.ticking[0][i].entity)
+                Py_XDECREF(self.ticking[0][i].tick)
+
+            for i in range(self.ticking_tmp.size()):
+                Py_XDECREF(self.ticking_tmp[0][i].entity)
+                Py_XDECREF(self.ticking_tmp[0][i].tick)
+
             Py_CLEAR(self.main_greenlet)
 
             del self.loading
             del self.loading_tmp
             del self.running
             del self.running_tmp
+            del self.ticking
+            del self.ticking_tmp
+            del self.sleeping
 
             self.released = True
 
@@ -180,11 +236,19 @@ cdef class GameLoopBase(object):
         self.startRunnable(component, False)
 
     cdef startRunnable(self, entity, bint load_phase=True, runnable=None):
-        """ Put an entity in the loading or running queue"""
+        """ Put an entity in the loading or running queue.
+        Entities and components whose class declares a plain tick(now) method skip the greenlet machinery and go
+        to the tick queue once they are running.
+        """
         cdef _Task new_task, *taskp
 
+        if runnable is None and not load_phase and hasattr(entity.__class__, 'tick'):
+            self.startTick(entity, entity.tick)
+            return
+
         new_task.release = False
         new_task.req = REQUEST_NONE
+        new_task.wakeup = 0
         new_task.entity = <PyObject*> entity
         Py_XINCREF(new_task.entity)
 
@@ -209,11 +273,27 @@ cdef class GameLoopBase(object):
 
         del runnable
 
+    cdef startTick(self, entity, tick):
+        """ Put an entity in the tick queue, tick(now) will be called once per frame without switching greenlets.
+        tick can not yield (no SKIP/STOP/etc calls), instead it may return TASK_REQUEST_STOP to stop ticking
+        """
+        cdef _Tick new_tick
+
+        new_tick.release = False
+        new_tick.entity = <PyObject*> entity
+        Py_XINCREF(new_tick.entity)
+        new_tick.tick = <PyObject*> tick
+        Py_XINCREF(new_tick.tick)
+
+        # Same as with tasks, new ticks are added to a temporary list which will be processed in self.update
+        self.ticking_tmp.push_back(new_tick)
+
     cpdef bint stopEntity(self, entity):
         cdef _Task *taskp
         cdef task_iterator iter
         cdef PyObject *obj = <PyObject*> entity
         cdef bint eraseEntity = True
+        cdef size_t i
 
         # Release tasks in use
         iter = self.loading.begin()
@@ -232,6 +312,21 @@ cdef class GameLoopBase(object):
 
             inc(iter)
 
+        for i in range(self.sleeping.size()):
+            if self.sleeping[0][i].entity == obj:
+                # Wake it up right away so it can run its course
+                self.sleeping[0][i].release = True
+                self.sleeping[0][i].wakeup = 0
+                self._siftUp(i)
+
+        for i in range(self.ticking.size()):
+            if self.ticking[0][i].entity == obj:
+                self.ticking[0][i].release = True
+
+        for i in range(self.ticking_tmp.size()):
+            if self.ticking_tmp[0][i].entity == obj:
+                self.ticking_tmp[0][i].release = True
+
     cpdef bint stopComponent(self, component):
         return self.stopEntity(component)
 
@@ -262,6 +357,9 @@ cdef class GameLoopBase(object):
             self.running.push_back(self.running_tmp.back())
             self.running_tmp.pop_back()
 
+        # Wake up sleeping tasks that are due
+        self._wakeTasks(now, wrapup)
+
         # Initialize objects
         iter = self.loading.begin()
         iter_end = self.loading.end()
@@ -304,18 +402,123 @@ cdef class GameLoopBase(object):
                 self.taskDecRef(taskp)
                 iter = self.running.erase(iter)
                 iter_end = self.running.end()
+            elif taskp.wakeup > now and not taskp.release and not wrapup:
+                # The task went to sleep, move it out of the way until it's due
+                self._sleepTask(taskp)
+                iter = self.running.erase(iter)
+                iter_end = self.running.end()
             else:
                 # Someone may have deleted a running task in the middle of this!
                 if iter == self.running.end():
                     break
                 inc(iter)
 
+        self._updateTicks(now, wrapup)
+
+    cdef _updateTicks(self, unsigned long now, bint wrapup):
+        """ Call tick(now) on every ticking entity in a tight loop, released ticks are compacted away as we go """
+        cdef _Tick *tickp
+        cdef size_t i, n, alive = 0
+        cdef bint profiled
+
+        for i in range(self.ticking_tmp.size()):
+            self.ticking.push_back(self.ticking_tmp[0][i])
+        self.ticking_tmp.clear()
+
+        n = self.ticking.size()
+        for i in range(n):
+            tickp = &self.ticking[0][i]
+            if wrapup:
+                tickp.release = True
+            elif not tickp.release:
+                profiled = self.profiling
+                if profiled:
+                    self._profileTaskStart()
+                try:
+                    if (<object>tickp.tick)(now) == REQUEST_STOP:
+                        tickp.release = True
+                except:
+                    error('Error ticking %s, removing it from the tick queue' % (<object>tickp.entity))
+                    error(traceback.format_exc())
+                    tickp.release = True
+                finally:
+                    # Ticks that raise are profiled too
+                    if profiled:
+                        self._profileTaskEnd(tickp.entity)
+
+            if tickp.release:
+                Py_XDECREF(tickp.entity)
+                Py_XDECREF(tickp.tick)
+            else:
+                if alive != i:
+                    self.ticking[0][alive] = tickp[0]
+                alive += 1
+
+        self.ticking.resize(alive)
+
+    cdef _sleepTask(self, _Task *taskp):
+        """ Move a task to the sleeping heap, the reference to its data travels with it """
+        self.sleeping.push_back(taskp[0])
+        self._siftUp(self.sleeping.size()-1)
+
+    cdef _wakeTasks(self, unsigned long now, bint wrapup):
+        """ Move the tasks that are due back to the running queue, only the due ones are touched """
+        while not self.sleeping.empty() and (wrapup or self.sleeping.front().wakeup <= now):
+            self.running.push_back(self.sleeping.front())
+            self.sleeping[0][0] = self.sleeping.back()
+            self.sleeping.pop_back()
+            if not self.sleeping.empty():
+                self._siftDown(0)
+
+    cdef _siftUp(self, size_t pos):
+        """ Restore the min heap (keyed on wakeup) after the task at pos got an earlier wakeup """
+        cdef _Task task = self.sleeping[0][pos]
+        cdef size_t parent
+
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if self.sleeping[0][parent].wakeup <= task.wakeup:
+                break
+            self.sleeping[0][pos] = self.sleeping[0][parent]
+            pos = parent
+        self.sleeping[0][pos] = task
+
+    cdef _siftDown(self, size_t pos):
+        """ Restore the min heap (keyed on wakeup) after the task at pos got a later wakeup """
+        cdef _Task task = self.sleeping[0][pos]
+        cdef size_t child, n = self.sleeping.size()
+
+        while True:
+            child = 2 * pos + 1
+            if child >= n:
+                break
+            if child + 1 < n and self.sleeping[0][child+1].wakeup < self.sleeping[0][child].wakeup:
+                child += 1
+            if self.sleeping[0][child].wakeup >= task.wakeup:
+                break
+            self.sleeping[0][pos] = self.sleeping[0][child]
+            pos = child
+        self.sleeping[0][pos] = task
+
+    cdef _profileTaskStart(self):
+        """ Called before running a task when profiling, backends implement the actual timing """
+        pass
+
+    cdef _profileTaskEnd(self, PyObject *entity):
+        """ Called after running a task when profiling """
+        pass
+
     cdef bint _doSwitch(self, _Task *task, PyObject *args, PyObject *kwargs):
         cdef PyObject *retp = NULL
         #cdef PyObject *exc_type=NULL, *exc_value=NULL, *exc_tb=NULL
 
         # Switch to the greenlet
-        retp = PyGreenlet_Switch(task.greenlet, args, kwargs)
+        if self.profiling:
+            self._profileTaskStart()
+            retp = PyGreenlet_Switch(task.greenlet, args, kwargs)
+            self._profileTaskEnd(task.entity)
+        else:
+            retp = PyGreenlet_Switch(task.greenlet, args, kwargs)
         if task.release:
             # The task was marked for release at some point during the switch, don't use it further
             Py_XDECREF(retp)
@@ -386,8 +589,12 @@ cdef class GameLoopBase(object):
             # Load an image
             data = <object>task.data
             if isinstance(data, dict) and data.has_key('url') and data['url'] != None:
+                dataManager = Gilbert().dataManager
+                if not dataManager.requestImage(data['url']):
+                    # The image is still being decoded in the background, check again on the next frame
+                    return True
                 # Try to load an image
-                img = (Gilbert().dataManager.getImage(data['url']),)
+                img = (dataManager.getImage(data['url']),)
                 if img is not None:
                     args = <PyObject*>img
                     kwargs = NULL
@@ -416,6 +623,13 @@ cdef class GameLoopBase(object):
                 # Stop entity from updating
                 task.release = True
                 task.req = REQUEST_NONE
+            elif task.req == REQUEST_SLEEP:
+                # Don't switch to the task until the requested amount of ms have passed (only running tasks sleep)
+                wait = <object>task.data
+                if wait is not None and wait > 0:
+                    task.wakeup = now + <unsigned long> wait
+                Py_CLEAR(task.data)
+                task.req = REQUEST_NONE
         else:
             return False
 
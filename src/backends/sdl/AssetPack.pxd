@@ -0,0 +1,31 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Memory mapped asset pack
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.backends.sdl.SDL cimport *
+from libcpp.vector cimport *
+
+ctypedef struct PackEntry:
+    Uint64 hash, offset
+    Uint32 length, flags
+
+cdef class AssetPack:
+    cdef bint released
+    cdef object _map
+    cdef const char *base
+    # Index entries sorted by url hash
+    cdef vector[PackEntry] *entries
+    cdef readonly bytes path, root
+    cdef readonly unsigned long hits, misses
+
+    cdef PackEntry *_find(self, url)
+    cdef SDL_RWops *open(self, url)
+    cpdef bint contains(self, url)
+    cpdef long length(self, url)
+    cpdef bytes read(self, url)
+    cpdef free(self)
@@ -0,0 +1,119 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Memory mapped asset pack
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.Log import debug, error
+from ignifuga.PackFile import readIndex, normalizeURL
+import mmap, os.path
+
+cdef extern from "Python.h":
+    int PyObject_AsReadBuffer(object obj, const void **buffer, Py_ssize_t *buffer_len) except -1
+
+cdef Uint64 _urlHash(const char *url, Py_ssize_t length) nogil:
+    """ 64 bit FNV-1a, as PackFile.urlHash (the url must be normalized already) """
+    cdef Uint64 h = 14695981039346656037ULL
+    cdef Py_ssize_t i
+    for i in range(length):
+        h = (h ^ <unsigned char>url[i]) * 1099511628211ULL
+    return h
+
+cdef class AssetPack:
+    """ A pack file (see PackFile.py) mapped once, assets are read in place through read only RWops over the mapping.
+    Urls are relative to the directory the pack is in. The mapping lives as long as the pack object, assets that keep reading from their RWops (music) hold a reference to it
+    """
+    def __init__(self, path):
+        cdef const void *base
+        cdef Py_ssize_t size
+        cdef PackEntry entry
+
+        self.released = False
+        self.path = bytes(path)
+        self.root = os.path.dirname(os.path.abspath(self.path))
+        self.entries = new vector[PackEntry]()
+        self.hits = self.misses = 0
+        with open(self.path, 'rb') as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        PyObject_AsReadBuffer(self._map, &base, &size)
+        self.base = <const char*>base
+
+        for h, offset, length, flags in readIndex(self._map):
+            entry.hash = h
+            entry.offset = offset
+            entry.length = length
+            entry.flags = flags
+            self.entries.push_back(entry)
+        debug('Mapped asset pack %s (%d assets, %d bytes)' % (self.path, self.entries.size(), size))
+
+    def __dealloc__(self):
+        self.free()
+
+    cdef PackEntry *_find(self, url):
+        """ Binary search the index for an url, NULL if it's not in the pack """
+        cdef bytes burl
+        cdef Uint64 h
+        cdef int lo = 0, hi, mid
+
+        if self.released:
+            return NULL
+        if os.path.isabs(url):
+            # Absolute paths are taken relative to the directory the pack is in
+            url = os.path.relpath(url, self.root)
+        burl = bytes(normalizeURL(url))
+        h = _urlHash(burl, len(burl))
+        hi = self.entries.size() - 1
+        while lo <= hi:
+            mid = (lo + hi) / 2
+            if self.entries[0][mid].hash < h:
+                lo = mid + 1
+            elif self.entries[0][mid].hash > h:
+                hi = mid - 1
+            else:
+                self.hits += 1
+                return &self.entries[0][mid]
+        self.misses += 1
+        return NULL
+
+    cdef SDL_RWops *open(self, url):
+        """ A read only RWops over the mapped asset, NULL if it's not in the pack """
+        cdef PackEntry *entry = self._find(url)
+        if entry == NULL:
+            return NULL
+        return SDL_RWFromConstMem(<void*>(self.base + entry.offset), entry.length)
+
+    cpdef bint contains(self, url):
+        cdef PackEntry *entry = self._find(url)
+        return entry != NULL
+
+    cpdef long length(self, url):
+        """ Size of the asset in bytes, -1 if it's not in the pack """
+        cdef PackEntry *entry = self._find(url)
+        if entry == NULL:
+            return -1
+        return entry.length
+
+    cpdef bytes read(self, url):
+        """ A copy of the asset contents, None if it's not in the pack """
+        cdef PackEntry *entry = self._find(url)
+        if entry == NULL:
+            return None
+        return self.base[entry.offset:entry.offset+entry.length]
+
+    property stats:
+        def __get__(self):
+            return {'assets': self.entries.size() if not self.released else 0, 'hits': self.hits, 'misses': self.misses}
+
+    cpdef free(self):
+        """ Unmap the pack, only safe once nothing reads from it """
+        if not self.released:
+            del self.entries
+            self.entries = NULL
+            self.base = NULL
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self.released = True
@@ -0,0 +1,22 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Blurred sprite frames cache
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.backends.sdl.SDL cimport *
+from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.TextureCache cimport TextureCache
+
+cdef class BlurCache(TextureCache):
+    # Keys are (atlas texture, frame, radius, width, height)
+    # (w, h) -> Canvas, the reduced resolution render targets the frames are blurred in
+    cdef object scratch
+    cdef readonly unsigned long blurs
+
+    cpdef Canvas get(self, Canvas atlas, int frame, int radius, int w, int h)
+    cpdef Canvas put(self, Canvas atlas, int frame, int radius, Canvas source, int w, int h)
+    cpdef blur(self, Canvas source, Canvas dst, int radius)
@@ -0,0 +1,156 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Blurred sprite frames cache
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from libc.stdlib cimport malloc, free
+from ignifuga.Log import error
+
+# Largest downscale applied before blurring
+DEF MAX_SCALE = 4
+
+cdef inline Uint32 _premultiply(Uint32 p) nogil:
+    cdef Uint32 a = p >> 24
+    return (a << 24) | ((((p >> 16) & 0xff) * a + 127) / 255 << 16) | ((((p >> 8) & 0xff) * a + 127) / 255 << 8) | (((p & 0xff) * a + 127) / 255)
+
+cdef inline Uint32 _unpremultiply(Uint32 p) nogil:
+    cdef Uint32 a = p >> 24, r, g, b
+    if a == 0:
+        return 0
+    r = (((p >> 16) & 0xff) * 255 + a / 2) / a
+    g = (((p >> 8) & 0xff) * 255 + a / 2) / a
+    b = ((p & 0xff) * 255 + a / 2) / a
+    return (a << 24) | ((r if r < 255 else 255) << 16) | ((g if g < 255 else 255) << 8) | (b if b < 255 else 255)
+
+cdef void _boxLine(Uint32 *pixels, int stride, int n, int radius, Uint32 *line) nogil:
+    """ Average every pixel of a row or column with the radius pixels at each side, pixels past the ends are transparent """
+    cdef int i, div = 2 * radius + 1
+    cdef Uint32 p, sa = 0, sr = 0, sg = 0, sb = 0
+
+    for i in range(n):
+        line[i] = pixels[i * stride]
+    for i in range(radius if radius < n else n):
+        p = line[i]
+        sa += p >> 24
+        sr += (p >> 16) & 0xff
+        sg += (p >> 8) & 0xff
+        sb += p & 0xff
+    for i in range(n):
+        if i + radius < n:
+            p = line[i + radius]
+            sa += p >> 24
+            sr += (p >> 16) & 0xff
+            sg += (p >> 8) & 0xff
+            sb += p & 0xff
+        pixels[i * stride] = ((sa + div / 2) / div << 24) | ((sr + div / 2) / div << 16) | ((sg + div / 2) / div << 8) | ((sb + div / 2) / div)
+        if i - radius >= 0:
+            p = line[i - radius]
+            sa -= p >> 24
+            sr -= (p >> 16) & 0xff
+            sg -= (p >> 8) & 0xff
+            sb -= p & 0xff
+
+cdef bint _boxBlur(Uint32 *pixels, int w, int h, int radius) nogil:
+    """ Box blur ARGB pixels in place along both axis. Colors are averaged premultiplied by alpha, so alpha is blurred
+    as well and transparent pixels don't darken the edges
+    """
+    cdef int x, y
+    cdef Uint32 *line = <Uint32*>malloc((w if w > h else h) * sizeof(Uint32))
+    if line == NULL:
+        return False
+    for x in range(w * h):
+        pixels[x] = _premultiply(pixels[x])
+    for y in range(h):
+        _boxLine(pixels + y * w, 1, w, radius, line)
+    for x in range(w):
+        _boxLine(pixels + x, w, h, radius, line)
+    for x in range(w * h):
+        pixels[x] = _unpremultiply(pixels[x])
+    free(line)
+    return True
+
+cdef class BlurCache(TextureCache):
+    """ Blurred frames of each atlas, so static or looping frames are only blurred once. Frames are scaled down to a render
+    target, read back and box blurred in both axis, then scaled up to the requested size
+    """
+    def __init__(self, Uint64 budget=0):
+        TextureCache.__init__(self, budget)
+        self.scratch = {}
+        self.blurs = 0
+
+    cpdef Canvas get(self, Canvas atlas, int frame, int radius, int w, int h):
+        """ Get the w x h blurred frame of an atlas, or None if it's not cached """
+        return self._lookup((<size_t>atlas._surfacehw, frame, radius, w, h))
+
+    cpdef Canvas put(self, Canvas atlas, int frame, int radius, Canvas source, int w, int h):
+        """ Blur a frame (source holds it) scaled to w x h and store it, returns the blurred canvas (or None if it doesn't fit in the budget) """
+        cdef Canvas canvas = self._store((<size_t>atlas._surfacehw, frame, radius, w, h), atlas, w, h)
+        if canvas is not None:
+            self.blur(source, canvas, radius)
+        return canvas
+
+    cpdef blur(self, Canvas source, Canvas dst, int radius):
+        """ Blur source into dst (they can be the same canvas), radius is in dst pixels """
+        cdef int scale = 1, w, h
+        cdef float r, g, b, a
+        cdef Canvas down
+        cdef Uint32 *pixels
+        cdef bint blurred = False
+
+        if radius <= 0:
+            return
+        # The box blur costs the same at any radius, wide blurs are done at lower resolution so there's less to read back
+        while scale < MAX_SCALE and radius >= scale * 4:
+            scale *= 2
+        w = dst._width / scale if dst._width >= scale else 1
+        h = dst._height / scale if dst._height >= scale else 1
+        radius = (radius + scale / 2) / scale
+
+        down = self.scratch.get((w,h))
+        if down is None:
+            down = Canvas(width=w, height=h, isRenderTarget = True)
+            self.scratch[(w,h)] = down
+
+        r, g, b, a = source._r, source._g, source._b, source._a
+        source.mod(1.0, 1.0, 1.0, 1.0)
+        down.blitCanvas(source, 0, 0, w, h, 0, 0, source._width, source._height, down.BLENDMODE_NONE)
+        source.mod(r, g, b, a)
+
+        pixels = <Uint32*>malloc(w * h * 4)
+        if pixels != NULL:
+            down.beginBatch()
+            try:
+                blurred = SDL_RenderReadPixels(down._sdlRenderer, NULL, SDL_PIXELFORMAT_ARGB8888, pixels, w * 4) == 0
+            finally:
+                down.endBatch()
+            if blurred:
+                with nogil:
+                    blurred = _boxBlur(pixels, w, h, radius)
+            if blurred:
+                SDL_UpdateTexture(down._surfacehw, NULL, pixels, w * 4)
+            free(pixels)
+        if not blurred:
+            error('Could not blur a %dx%d frame' % (w, h))
+
+        dst.blitCanvas(down, 0, 0, dst._width, dst._height, 0, 0, w, h, dst.BLENDMODE_NONE)
+        self.blurs += 1
+
+    cdef dict _stats(self):
+        stats = TextureCache._stats(self)
+        stats['blurs'] = self.blurs
+        stats['scratch'] = len(self.scratch)
+        return stats
+
+    cpdef clear(self):
+        """ Drop the blurred frames and the scratch render targets """
+        TextureCache.clear(self)
+        self.scratch.clear()
+
+    cpdef free(self):
+        if not self.released:
+            self.scratch = None
+            TextureCache.free(self)
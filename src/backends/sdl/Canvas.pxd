@@ -9,9 +9,19 @@
 # Author: Gabriel Jacobo <gabriel@mdqinc.com>
 
 from ignifuga.backends.CanvasBase cimport CanvasBase
-from ignifuga.backends.sdl.Font cimport Font
+from ignifuga.backends.sdl.Font cimport Font, TextRun
+from ignifuga.backends.sdl.SurfacePool cimport SurfacePool
+from ignifuga.backends.sdl.AssetPack cimport AssetPack
 from SDL cimport *
 
+cdef class DecodedImage:
+    cdef SDL_Surface * surface
+    cdef readonly bytes srcURL, embedded_data
+    cdef readonly AssetPack pack
+    cdef public bint done
+
+    cpdef decode(self)
+
 cdef class Canvas (CanvasBase):
     cdef object __weakref__
     cdef SDL_Renderer * _sdlRenderer
@@ -21,11 +31,27 @@ cdef class Canvas (CanvasBase):
     cdef readonly bint _isRenderTarget, _hw
     cdef readonly int _width, _height, _fontSize, _req_width, _req_height
     cdef bytes embedded_data
+    cdef DecodedImage _decoded
+    # Pack srcURL is read from, if it was packed
+    cdef AssetPack _pack
     cdef Font _font
+    # What the text canvas shows, to skip redrawing it
+    cdef object _textKey
     cdef readonly object spriteData
+    # Hardware canvas pixels wrapped in a pooled surface while the texture is locked for software blits
+    cdef SurfacePool _pool
+    cdef SDL_Surface * _locked
+    cdef int _lockDepth
+    # Render target canvas keep the renderer target set while batching, and restore the target the renderer had before at the end
+    cdef int _targetDepth
+    cdef SDL_Texture * _prevTarget
     
     cpdef blitCanvas(self, CanvasBase canvas, int dx=*, int dy=*, int dw=*, int dh=*, int sx=*, int sy=*, int sw=*, int sh=*, int blend=*)
     cdef blitCanvasHW(self, Canvas canvas, int dx, int dy, int dw, int dh, int sx, int sy, int sw, int sh, int blend)
     cdef blitCanvasSW(self, Canvas canvas, int dx, int dy, int dw, int dh, int sx, int sy, int sw, int sh, int blend)
+    cdef SDL_Surface *_lockSurface(self)
+    cdef _unlockSurface(self)
+    cpdef beginBatch(self)
+    cpdef endBatch(self)
     cpdef mod(self, float r, float g, float b, float a)
     cpdef text(self, text, color, fontURL, fontSize)
\ No newline at end of file
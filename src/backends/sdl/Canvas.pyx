@@ -18,32 +18,94 @@ from sys import exit
 from SDL cimport *
 import platform, os.path, json
 
+cdef class DecodedImage:
+    """ An image decoded to a software surface, decoding doesn't hold the GIL so it can happen in a worker thread.
+    The surface is later handed over to a Canvas, which uploads it as a texture in the render thread
+    """
+    def __init__(self, srcURL = None, embedded = None, AssetPack pack = None):
+        self.surface = NULL
+        self.done = False
+        self.srcURL = bytes(srcURL) if srcURL is not None else None
+        self.embedded_data = bytes(embedded) if embedded is not None else None
+        self.pack = pack
+
+    def __dealloc__(self):
+        if self.surface != NULL:
+            SDL_FreeSurface(self.surface)
+            self.surface = NULL
+
+    cpdef decode(self):
+        cdef SDL_Surface *ss = NULL
+        cdef SDL_RWops *rwops
+        cdef char *srcURL, *bindata
+        cdef int src_len
+
+        if self.pack is not None:
+            # The pack is mapped, reading it doesn't need the GIL either
+            rwops = self.pack.open(self.srcURL)
+            with nogil:
+                if rwops != NULL:
+                    ss = IMG_Load_RW(rwops, 1)
+        elif self.srcURL is not None:
+            srcURL = self.srcURL
+            with nogil:
+                ss = IMG_Load(srcURL)
+        elif self.embedded_data is not None:
+            src_len = len(self.embedded_data)
+            bindata = self.embedded_data
+            with nogil:
+                rwops = SDL_RWFromConstMem(<void*>bindata, src_len )
+                if rwops != NULL:
+                    ss = IMG_Load_RW(rwops, 1)
+
+        self.surface = ss
+        self.done = True
+
+    property failed:
+        def __get__(self):
+            return self.done and self.surface == NULL
+
 cdef class Canvas (CanvasBase):
     BLENDMODE_BLEND = SDL_BLENDMODE_BLEND
     BLENDMODE_NONE = SDL_BLENDMODE_NONE
     BLENDMODE_ADD = SDL_BLENDMODE_ADD
     BLENDMODE_MOD = SDL_BLENDMODE_MOD
-    def __init__ (self, width=None, height=None, hw=True, srcURL = None, embedded=None, isRenderTarget = False):
+    def __init__ (self, width=None, height=None, hw=True, srcURL = None, embedded=None, isRenderTarget = False, DecodedImage decoded=None, AssetPack pack=None):
         """
         hw = True -> Hardware Canvas (Texture in SDL)
         hw = False -> Software Canvas (Surface in SDL)
         isRenderTarget -> if True, then other canvases with hw=True can be rendered on top of this canvas via hw rendering
         srclURL != None -> Load image into software canvas
+        decoded != None -> Upload an image that was already decoded (srcURL and embedded are taken from it)
+        pack != None -> srcURL is read from the asset pack, not from its own file
         """
 
         renderer = getRenderer()
         self._sdlRenderer = (<Renderer>renderer).renderer
+        self._pool = (<Renderer>renderer).surfacePool
+        self._locked = NULL
+        self._lockDepth = 0
+        self._targetDepth = 0
+        self._prevTarget = NULL
 
         self._isRenderTarget = isRenderTarget
         self._fontURL = None
         self._fontSize = 0
         self._font = None
+        self._textKey = None
         self._r = self._g = self_b = self._a = 1.0
         self.spriteData = None
         self._req_width = width if width != None else -1
         self._req_height = height if height != None else -1
         self._hw = hw
 
+        self._decoded = decoded
+        if decoded is not None:
+            srcURL = decoded.srcURL
+            embedded = decoded.embedded_data
+            pack = decoded.pack
+        self._pack = pack
+
         if srcURL is not None:
             self._srcURL = bytes(srcURL)
         else:
@@ -60,10 +122,20 @@ cdef class Canvas (CanvasBase):
         cdef SDL_Surface *ss = NULL
         cdef char *bindata
         cdef int src_len
+        cdef SDL_RWops *rwops
 
         if self._srcURL is not None or self.embedded_data is not None:
             # Initialize a software surface with contents loaded from the image
-            if self._srcURL is not None:
+            if self._decoded is not None:
+                # Take ownership of the surface decoded in the background
+                ss = self._decoded.surface
+                self._decoded.surface = NULL
+                self._decoded = None
+            elif self._pack is not None:
+                rwops = self._pack.open(self._srcURL)
+                if rwops != NULL:
+                    ss = IMG_Load_RW(rwops, 1)
+            elif self._srcURL is not None:
                 ss = IMG_Load(self._srcURL)
             elif self.embedded_data is not None:
                 src_len = len(self.embedded_data)
@@ -116,13 +188,25 @@ cdef class Canvas (CanvasBase):
     cpdef reload(self, url):
         cdef SDL_Texture * oldsurface = self._surfacehw
         cdef Renderer renderer = <Renderer>Gilbert().renderer
+        if oldsurface != NULL:
+            renderer.frameCache._invalidate(oldsurface)
+            renderer.blurCache._invalidate(oldsurface)
         self.free()
+        # Reloads come from edited files, not from the pack
+        self._pack = None
         self._srcURL = bytes(url)
         self.load()
         if oldsurface != NULL and self._surfacehw != NULL and self._surfacehw != oldsurface:
             renderer.updateTexture(oldsurface, self._surfacehw)
 
     cdef free(self):
+        if self._lockDepth > 0:
+            self._lockDepth = 1
+            self._unlockSurface()
+        if self._targetDepth > 0:
+            self._targetDepth = 1
+            self.endBatch()
+
         if self._surfacehw != NULL:
             SDL_DestroyTexture(self._surfacehw)
             self._surfacehw = NULL
@@ -134,6 +218,16 @@ cdef class Canvas (CanvasBase):
     def __dealloc__(self):
         #debug( ">>>CANVAS DEALLOC %s (URL: %s) <<<" % (self, self._srcURL))
         self.free()
+        if self._font is not None:
+            dataManager = getattr(Gilbert(), 'dataManager', None)
+            if dataManager is not None:
+                dataManager.release(self._font)
+            self._font = None
+
+    property size:
+        def __get__(self):
+            """ Bytes of pixel data """
+            return self._width * self._height * 4
 
     cpdef blitCanvas(self, CanvasBase canvasbase, int dx=0, int dy=0, int dw=-1, int dh=-1, int sx=0, int sy=0, int sw=-1, int sh=-1, int blend=-1):
         if sw == -1:
@@ -155,8 +249,56 @@ cdef class Canvas (CanvasBase):
             return self.blitCanvasSW(<Canvas>canvasbase,dx,dy,dw,dh,sx,sy,sw,sh, blend)
             
             
+    cdef SDL_Surface *_lockSurface(self):
+        """ Get the canvas pixels as a surface, hardware canvas stay locked until the matching _unlockSurface """
+        cdef void *pixels
+        cdef int pitch
+
+        if not self._hw:
+            return self._surfacesw
+
+        if self._lockDepth == 0:
+            if self._surfacehw == NULL or SDL_LockTexture(self._surfacehw, NULL, &pixels, &pitch) != 0:
+                return NULL
+            self._locked = self._pool.acquire(self._width, self._height, pixels, pitch)
+            if self._locked == NULL:
+                SDL_UnlockTexture(self._surfacehw)
+                return NULL
+        self._lockDepth += 1
+        return self._locked
+
+    cdef _unlockSurface(self):
+        if self._lockDepth > 0:
+            self._lockDepth -= 1
+            if self._lockDepth == 0:
+                self._pool.release(self._locked)
+                self._locked = NULL
+                SDL_UnlockTexture(self._surfacehw)
+
+    cpdef beginBatch(self):
+        """ Start a batch of hardware blits on this canvas, render targets stay set as the renderer target for the whole batch.
+        Batches nest (on the same or on other canvas), every beginBatch needs its endBatch, which sets back whatever the
+        renderer was targeting when the batch began. Returns False (and endBatch does nothing) for other canvas
+        """
+        if not self._hw or not self._isRenderTarget or self._surfacehw == NULL:
+            return False
+
+        if self._targetDepth == 0:
+            self._prevTarget = SDL_GetRenderTarget(self._sdlRenderer)
+            SDL_SetRenderTarget(self._sdlRenderer, self._surfacehw)
+        self._targetDepth += 1
+        return True
+
+    cpdef endBatch(self):
+        """ Finish a batch of blits started with beginBatch """
+        if self._targetDepth > 0:
+            self._targetDepth -= 1
+            if self._targetDepth == 0:
+                SDL_SetRenderTarget(self._sdlRenderer, self._prevTarget)
+                self._prevTarget = NULL
+
     cdef blitCanvasSW(self, Canvas canvas, int dx, int dy, int dw, int dh, int sx, int sy, int sw, int sh, int blend):
-        """ Blit between canvas using an intermediary software surface """
+        """ Blit between canvas in software, hardware canvas are locked and their pixels wrapped in pooled surfaces """
         cdef SDL_BlendMode prevbmode
         cdef SDL_Rect srcRect, dstRect
         cdef SDL_Surface *src, *dst
@@ -169,50 +311,28 @@ cdef class Canvas (CanvasBase):
         dstRect.y = dy
         dstRect.w = dw
         dstRect.h = dh
-        
-        if blend != -1:
-            SDL_GetTextureBlendMode(canvas._surfacehw, &prevbmode)
-            SDL_SetTextureBlendMode(canvas._surfacehw, <SDL_BlendMode>blend)
-        
-        if self._hw:
-            # Convert our surface to software surface
-            #if BIG_ENDIAN
-            dst = SDL_CreateRGBSurface(0, dw, dh, 32, 0xFF000000, 0x00FF0000, 0x0000FF00, 0x000000FF)
-            #else
-            dst = SDL_CreateRGBSurface(0, dw, dh, 32, 0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000 )
-            #endif
-            SDL_LockTexture(self._surfacehw, &dstRect, &dst.pixels, &dst.pitch)
-        else:
-            dst = self._surfacesw
-            
-        if canvas._hw:
-            # Convert the other surface to software surface
-            #if BIG_ENDIAN
-            src = SDL_CreateRGBSurface(0, sw, sh, 32, 0xFF000000, 0x00FF0000, 0x0000FF00, 0x000000FF)
-            #else
-            src = SDL_CreateRGBSurface(0, sw, sh, 32, 0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000 )
-            #endif
-            SDL_LockTexture(canvas._surfacehw, &srcRect, &src.pixels, &src.pitch)
-        else:
-            src = canvas._surfacesw
-   
-        SDL_UpperBlit(src, &srcRect, dst, &dstRect)
-        
-        if self._hw:
-            SDL_FreeSurface(dst)
-            SDL_UnlockTexture(self._surfacehw)
-            
-        if canvas._hw:
-            SDL_FreeSurface(src)
-            SDL_UnlockTexture(canvas._surfacehw)
-            
-        if blend != -1:
-            SDL_SetTextureBlendMode(canvas._surfacehw, prevbmode)
+
+        dst = self._lockSurface()
+        if dst == NULL:
+            return
+        src = canvas._lockSurface()
+        if src != NULL:
+            if blend != -1:
+                SDL_GetSurfaceBlendMode(src, &prevbmode)
+                SDL_SetSurfaceBlendMode(src, <SDL_BlendMode>blend)
+
+            SDL_UpperBlit(src, &srcRect, dst, &dstRect)
+
+            if blend != -1:
+                SDL_SetSurfaceBlendMode(src, prevbmode)
+            canvas._unlockSurface()
+        self._unlockSurface()
             
     cdef blitCanvasHW(self, Canvas canvas, int dx, int dy, int dw, int dh, int sx, int sy, int sw, int sh, int blend):
         """ Blit between two hardware canvas"""
         cdef SDL_BlendMode prevbmode
         cdef SDL_Rect srcRect, dstRect
+        cdef SDL_Texture *target
 
         srcRect.x = sx
         srcRect.y = sy
@@ -227,9 +347,14 @@ cdef class Canvas (CanvasBase):
             SDL_GetTextureBlendMode(canvas._surfacehw, &prevbmode)
             SDL_SetTextureBlendMode(canvas._surfacehw, <SDL_BlendMode>blend)
             
-        SDL_SetRenderTarget(self._sdlRenderer, self._surfacehw)
-        SDL_RenderCopy(self._sdlRenderer, canvas._surfacehw, &srcRect, &dstRect)
-        SDL_SetRenderTarget(self._sdlRenderer, NULL)
+        target = SDL_GetRenderTarget(self._sdlRenderer)
+        if target == self._surfacehw:
+            # Batching, the target is already set
+            SDL_RenderCopy(self._sdlRenderer, canvas._surfacehw, &srcRect, &dstRect)
+        else:
+            SDL_SetRenderTarget(self._sdlRenderer, self._surfacehw)
+            SDL_RenderCopy(self._sdlRenderer, canvas._surfacehw, &srcRect, &dstRect)
+            SDL_SetRenderTarget(self._sdlRenderer, target)
         
         if blend != -1:
             SDL_SetTextureBlendMode(canvas._surfacehw, prevbmode)
@@ -263,9 +388,10 @@ cdef class Canvas (CanvasBase):
             SDL_SetTextureAlphaMod(self._surfacehw, A)
 
     cpdef text(self, text, color, fontURL, fontSize):
-        """ Replaces the surface with a text created from TTF"""
+        """ Draw a line of text with quads from the font glyph atlas. The texture is only replaced when the text size changes """
         if self._font != None:
             if self._fontURL != fontURL or self._fontSize != fontSize:
+                Gilbert().dataManager.release(self._font)
                 self._font = None
         if self._font == None:
             self._font = Gilbert().dataManager.getFont(fontURL, fontSize)
@@ -276,26 +402,62 @@ cdef class Canvas (CanvasBase):
 
         self._fontURL = fontURL
         self._fontSize = fontSize
-        cdef SDL_Surface *ss
-        cdef SDL_Color sdl_color
-        cdef bytes btext = bytes(text)
-        sdl_color.r, sdl_color.g, sdl_color.b = color
-        ss = TTF_RenderUTF8_Solid(self._font.ttf_font, btext, sdl_color)
-        if ss != NULL:
-            if self._hw and self._surfacehw != NULL:
-                SDL_DestroyTexture(self._surfacehw)
-            elif self._surfacesw != NULL:
-                SDL_FreeSurface(self._surfacesw)
+        cdef TextRun run
+        cdef SDL_Texture *atlas = NULL
+        cdef SDL_Texture *oldsurface = self._surfacehw
+        cdef SDL_Texture *target
+        cdef Renderer renderer = <Renderer>Gilbert().renderer
+        cdef Uint8 r, g, b
+        cdef int w, h
+        cdef size_t i
+
+        textKey = (text, tuple(color), fontURL, fontSize)
+        if textKey == self._textKey and self._surfacehw != NULL:
+            return
+
+        run = self._font.layout(text)
+        if not run.src.empty():
+            atlas = self._font.uploadAtlas(self._sdlRenderer)
+            if atlas == NULL:
+                error("Could not upload the glyph atlas for font %s" % fontURL)
+                return
+        w = run.width if run.width > 0 else 1
+        h = run.height if run.height > 0 else 1
 
-            self._surfacehw = SDL_CreateTextureFromSurface(self._sdlRenderer, ss)
+        if not self._hw or not self._isRenderTarget or self._surfacehw == NULL or w != self._width or h != self._height:
+            if self._surfacesw != NULL:
+                SDL_FreeSurface(self._surfacesw)
+                self._surfacesw = NULL
+            if self._surfacehw != NULL:
+                SDL_DestroyTexture(self._surfacehw)
+            self._surfacehw = SDL_CreateTexture(self._sdlRenderer, SDL_PIXELFORMAT_ARGB8888, SDL_TEXTUREACCESS_TARGET, w, h)
             if self._surfacehw == NULL:
                 error(">>> Problem creating Text HW Surface!! <<<")
                 exit(1)
-
+            SDL_SetTextureBlendMode(self._surfacehw, SDL_BLENDMODE_BLEND)
             self._hw = True
-            self._width = ss.w
-            self._height = ss.h
-            SDL_FreeSurface(ss)
+            self._isRenderTarget = True
+            self._width = w
+            self._height = h
+
+        r, g, b = color
+        target = SDL_GetRenderTarget(self._sdlRenderer)
+        SDL_SetRenderTarget(self._sdlRenderer, self._surfacehw)
+        SDL_SetRenderDrawColor(self._sdlRenderer, 0, 0, 0, 0)
+        SDL_RenderClear(self._sdlRenderer)
+        if atlas != NULL:
+            SDL_SetTextureColorMod(atlas, r, g, b)
+            for i in range(run.src.size()):
+                SDL_RenderCopy(self._sdlRenderer, atlas, &run.src[0][i], &run.dst[0][i])
+        SDL_SetRenderTarget(self._sdlRenderer, target)
+        self._textKey = textKey
+
+        if oldsurface != NULL and self._surfacehw != oldsurface:
+            # Sprites showing this canvas switch to the new texture
+            renderer.updateTexture(oldsurface, self._surfacehw)
+        else:
+            # Redrawn in place
+            renderer.textureDamage(self._surfacehw)
         self.mod(self._r, self._g, self._b, self._a)
 
 
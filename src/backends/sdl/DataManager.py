@@ -8,15 +8,18 @@
 # Data Manager
 # Author: Gabriel Jacobo <gabriel@mdqinc.com>
 
-import json, gc
+import json, gc, thread
+from Queue import Queue
 from ignifuga.Gilbert import Gilbert
 from ignifuga.Log import debug, error
 from SDL import *
 from ignifuga.backends.DataManagerBase import *
-from Canvas import Canvas
+from Canvas import Canvas, DecodedImage
 from Sound import MixChunk, MixMusic
 from Font import Font
-from os.path import abspath, join, dirname, getmtime, isfile, isdir
+from AssetPack import AssetPack
+from ignifuga.SceneData import sanitizeData, loadCompiled
+from os.path import abspath, join, dirname, getmtime, getsize, isfile, isdir
 
 #if __LINUX__ or __OSX__ or __MINGW__
 ROOT_DIR = abspath(dirname(sys.argv[0]))
@@ -24,30 +27,94 @@ ROOT_DIR = abspath(dirname(sys.argv[0]))
 ROOT_DIR = ''
 #endif
 
-
-def sanitizeData (k,v, p=True):
-    """ Sanitize data, convert keys in the data to str"""
-    key = str(k)
-    if isinstance(v, dict):
-        value = {}
-        for k1, v1 in v.items():
-            key1, value1 = sanitizeData(k1,v1)
-            value[key1] = value1
-    elif isinstance(v, list):
-        value = []
-        for v1 in v:
-            k1,v1 =  sanitizeData(key, v1)
-            value.append(v1)
-    else:
-        value = v
-
-    return key, value
+# Assets are read from this pack (see tools/packer.py) when it's found in ROOT_DIR, anything not packed comes from its own file
+PACK_FILE = 'assets.pack'
+
+class ImageLoader(object):
+    """ A small pool of worker threads that decode images into software surfaces in the background """
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.queue = Queue()
+        self.started = False
+
+    def decode(self, image):
+        if not self.started:
+            # Workers are started on demand, a game that never loads images asynchronously doesn't pay for them
+            for i in range(self.workers):
+                thread.start_new_thread(self._worker, ())
+            self.started = True
+        self.queue.put(image)
+
+    def _worker(self):
+        while True:
+            image = self.queue.get()
+            try:
+                image.decode()
+            except:
+                error('Error decoding image %s' % image.srcURL)
+                image.done = True
 
 class DataManager(DataManagerBase):
+    # Decode images requested by tasks in background threads
+    asyncImages = True
+    # Sound chunks with bigger sources are decoded when they are first played, not when they are loaded
+    lazyChunkSize = 512*1024
+
     def __init__(self):
         super(DataManager, self).__init__()
-        self.watches = []
+        self.watches = set()
         self.mtimes = {}
+        # Watched files by the normalized url of their directory, where directories are watched instead of files
+        self.watchedFiles = {}
+        self.imageLoader = ImageLoader()
+        self.pendingImages = {}
+        self.pack = None
+        if isfile(join(ROOT_DIR, PACK_FILE)):
+            self.openPack(join(ROOT_DIR, PACK_FILE))
+
+    def openPack(self, path):
+        """ Serve assets from a pack, mapped once and read in place. Assets already loaded keep their source """
+        try:
+            self.pack = AssetPack(path)
+        except (EnvironmentError, ValueError), ex:
+            error('Could not open asset pack %s: %s' % (path, ex))
+            return False
+        return True
+
+    def _packed(self, url):
+        """ The pack url is read from, None if it's not packed """
+        if self.pack is None or not self.pack.contains(url):
+            return None
+#if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
+        # Files edited after packing them take precedence, so they can be hot reloaded
+        path = join(ROOT_DIR, url)
+        if isfile(path) and getmtime(path) > getmtime(self.pack.path):
+            return None
+#endif
+        return self.pack
+
+    def cleanup(self, force = False):
+        if force:
+            for asset in self.cache.values():
+                self._dropFrames(asset)
+        super(DataManager, self).cleanup(force)
+
+    def _drop(self, url):
+        self._dropFrames(self.cache.get(url))
+        super(DataManager, self)._drop(url)
+
+    def _dropFrames(self, asset):
+        """ The composed and blurred frames the renderer cached for an atlas keep it alive, they go when the atlas leaves the cache """
+        renderer = getattr(Gilbert(), 'renderer', None) if isinstance(asset, Canvas) else None
+        if renderer is not None:
+            renderer.frameCache.drop(asset)
+            renderer.blurCache.drop(asset)
+
+    def _readFile(self, url):
+        pack = self._packed(url)
+        if pack is not None:
+            return pack.read(url)
+        return readFile(join(ROOT_DIR, url))
 
     def _urlToWatchUrl(self, url):
         #if DEBUG and __LINUX__
@@ -62,17 +129,16 @@ class DataManager(DataManagerBase):
             return None
         self.mtimes[url] = getmtime(watchURL)
         watchURL = dirname(watchURL)
+        watchDir = self.normalizeURL(watchURL)
+        if watchDir not in self.watchedFiles:
+            self.watchedFiles[watchDir] = set()
+        self.watchedFiles[watchDir].add(url)
         #endif
 
         return watchURL
 
     def addListener(self, url, obj):
-        #if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
-        watchURL = self._urlToWatchUrl(url)
-        if watchURL is not None and watchURL not in self.watches:
-            Gilbert().gameLoop.addWatch(watchURL)
-            self.watches.append(watchURL)
-        #endif
+        self._watch(url)
         super(DataManager, self).addListener(url, obj)
 
     def removeListener(self, url, obj):
@@ -80,135 +146,183 @@ class DataManager(DataManagerBase):
         super(DataManager, self).removeListener(url, obj)
 
     def loadSceneData(self, filename):
+        """ Scene data comes precompiled (read only, see tools/scenecompiler.py) if available, and from the JSON source otherwise """
         url = join('data','scenes',filename+'.json')
+        data = self.loadCompiledFile(join('data','scenes',filename+'.scene'), url)
+        if data is not None:
+            return url, data
         return url, self.loadJsonFile(url)
 
+    def loadCompiledFile(self, url, sourceURL=None):
+        """ Load precompiled data, None if there isn't any (or if the source it came from was edited after compiling it) """
+        if url not in self.cache:
+#if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
+            sourcePath = join(ROOT_DIR, sourceURL) if sourceURL is not None else None
+            if sourcePath is not None and isfile(sourcePath) and (not isfile(join(ROOT_DIR, url)) or getmtime(sourcePath) > getmtime(join(ROOT_DIR, url))):
+                return None
+#endif
+            raw = self._readFile(url)
+            data = loadCompiled(raw)
+            if data is None:
+                return None
+            return self._storeData(url, data, len(raw))
+        return self._touch(url)
+
     def loadJsonFile(self, url):
         if url not in self.cache:
-            data = json.loads(readFile(join(ROOT_DIR, url)))
+            raw = self._readFile(url)
+            data = json.loads(raw)
             ret_data = {}
             for k,v in data.items():
                 key, value = sanitizeData(k,v)
                 ret_data[key] = value
 
-            self.cache[url] = ret_data
+            self._watch(url)
+            return self._storeData(url, ret_data, len(raw))
+        return self._touch(url)
+
+    def requestImage(self, url):
+        """ Decode the image in the background, returns True once getImage can serve it without stalling """
+        if url in self.cache or not self.asyncImages:
+            return True
 
+        if url not in self.pendingImages:
+            pack = self._packed(url)
+            if url.startswith('embedded:') and pack is None:
+                data = Gilbert().getEmbedded(url[9:])
+                if data == None:
+                    # Let getImage report the error
+                    return True
+                image = DecodedImage(embedded=data)
+            else:
+                image = DecodedImage(srcURL=join(ROOT_DIR, url), pack=pack)
+            self.pendingImages[url] = image
+            self.imageLoader.decode(image)
+            return False
+
+        image = self.pendingImages[url]
+        if not image.done:
+            return False
+
+        del self.pendingImages[url]
+        if not image.failed:
+            # Only the texture upload happens here, in the render thread, it stays unreferenced until getImage
+            self._store(url, 'image', Canvas(decoded=image))
+            self._watch(url)
+
+        # If decoding failed, getImage will try again and report the error
+        return True
+
+    def _watch(self, url):
+        """ Watch the file of an asset, to reload it when it's edited """
 #if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
-            watchURL = self._urlToWatchUrl(url)
-            if watchURL not in self.watches:
-                Gilbert().gameLoop.addWatch(watchURL)
-                self.watches.append(watchURL)
+        if url.startswith('embedded:'):
+            return
+        watchURL = self._urlToWatchUrl(url)
+        if watchURL is not None and watchURL not in self.watches:
+            Gilbert().gameLoop.addWatch(watchURL)
+            self.watches.add(watchURL)
 #endif
-        return self.cache[url]
+        pass
 
     def getImage(self, url):
+        """ Get an image and take a reference on it, give it back with release """
         if url not in self.cache:
-            if url.startswith('embedded:'):
+            if url in self.pendingImages:
+                # Being decoded in the background, but it's needed right now
+                del self.pendingImages[url]
+
+            pack = self._packed(url)
+            if url.startswith('embedded:') and pack is None:
                 data = Gilbert().getEmbedded(url[9:])
                 if data != None:
-                    self.cache[url] = Canvas(embedded=data)
+                    self._store(url, 'image', Canvas(embedded=data))
                 else:
                     error('Error loading embedded data with id: %s', url)
                     return None
             else:
-                self.cache[url] = Canvas(srcURL=join(ROOT_DIR, url))
+                self._store(url, 'image', Canvas(srcURL=join(ROOT_DIR, url), pack=pack))
+                self._watch(url)
 
-#if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
-                watchURL = self._urlToWatchUrl(url)
-                if watchURL not in self.watches:
-                    Gilbert().gameLoop.addWatch(watchURL)
-                    self.watches.append(watchURL)
-#endif
-
-        return self.cache[url]
+        return self._acquire(url)
 
     def getChunk(self, url):
+        """ Get a sound chunk and take a reference on it, give it back with release """
         if url not in self.cache:
-            if url.startswith('embedded:'):
+            pack = self._packed(url)
+            if url.startswith('embedded:') and pack is None:
                 data = Gilbert().getEmbedded(url[9:])
                 if data != None:
-                    self.cache[url] = MixChunk(embedded=data)
+                    self._store(url, 'chunk', MixChunk(embedded=data, lazy=len(data) > self.lazyChunkSize))
                 else:
                     error('Error loading embedded data with id: %s', url)
                     return None
             else:
-                self.cache[url] = MixChunk(srcURL=join(ROOT_DIR, url))
-
-#if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
-                watchURL = self._urlToWatchUrl(url)
-                if watchURL not in self.watches:
-                    Gilbert().gameLoop.addWatch(watchURL)
-                    self.watches.append(watchURL)
-#endif
+                path = join(ROOT_DIR, url)
+                if pack is not None:
+                    size = pack.length(url)
+                else:
+                    size = getsize(path) if isfile(path) else 0
+                self._store(url, 'chunk', MixChunk(srcURL=path, pack=pack, lazy=size > self.lazyChunkSize))
+                self._watch(url)
 
-        return self.cache[url]
+        return self._acquire(url)
 
     def getMusic(self, url):
+        """ Get a music track and take a reference on it, give it back with release """
         if url not in self.cache:
-            if url.startswith('embedded:'):
+            pack = self._packed(url)
+            if url.startswith('embedded:') and pack is None:
                 data = Gilbert().getEmbedded(url[9:])
                 if data != None:
-                    self.cache[url] = MixMusic(embedded=data)
+                    self._store(url, 'music', MixMusic(embedded=data))
                 else:
                     error('Error loading embedded data with id: %s', url)
                     return None
             else:
-                self.cache[url] = MixMusic(srcURL=join(ROOT_DIR, url))
+                self._store(url, 'music', MixMusic(srcURL=join(ROOT_DIR, url), pack=pack))
+                self._watch(url)
 
-#if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
-                watchURL = self._urlToWatchUrl(url)
-                if watchURL not in self.watches:
-                    Gilbert().gameLoop.addWatch(watchURL)
-                    self.watches.append(watchURL)
-#endif
-
-        return self.cache[url]
+        return self._acquire(url)
 
     def getFont(self, url, size):
+        """ Get a font and take a reference on it, give it back with release """
         cache_url = '%s+%d' % (url, size)
         if cache_url not in self.cache:
-            self.cache[cache_url] = Font(url, size)
-        return self.cache[cache_url]
+            self._store(cache_url, 'font', Font(url, size, self._packed(url)), url)
+        return self._acquire(cache_url)
+
+    def normalizeURL(self, url):
+        """ Urls relative to ROOT_DIR """
+        if ROOT_DIR and url.startswith(ROOT_DIR):
+            url = url[len(ROOT_DIR)+1:]
+        return super(DataManager, self).normalizeURL(url)
 
     def urlReloaded(self, url):
 #if  __MINGW__
         # On Windows and OSX, we monitor directories, not individual files, so from the files that we know exist in that dir
         # we check which ones where modified
-        if url.startswith(ROOT_DIR):
-            url = url[len(ROOT_DIR)+1:]
-
-        reload = []
-        for cache_url in self.cache.iterkeys():
-            if dirname(cache_url) == url:
-                reload.append(cache_url)
-
-        for cache_url in reload:
-            new_mtime = getmtime(join(ROOT_DIR, cache_url))
-            if new_mtime > self.mtimes[cache_url]:
-                self.mtimes[cache_url] = new_mtime
-                self._urlReloaded(cache_url)
+        for fileURL in self.watchedFiles.get(self.normalizeURL(url), ()):
+            new_mtime = getmtime(join(ROOT_DIR, fileURL))
+            if new_mtime > self.mtimes[fileURL]:
+                self.mtimes[fileURL] = new_mtime
+                super(DataManager, self).urlReloaded(fileURL)
 #else
-        self._urlReloaded(url)
+        super(DataManager, self).urlReloaded(url)
 #endif
 
     def _urlReloaded(self, url):
-        reload = []
-        if url.startswith(ROOT_DIR):
-            url = url[len(ROOT_DIR)+1:]
-
-        if url in self.notifications:
-            for ref in self.notifications[url]:
-                if hasattr(ref, 'reload') and ref not in reload:
-                    reload.append(ref)
-
-        if url in self.cache:
-            if isinstance(self.cache[url], Canvas):
-                # Reload the canvas before issuing the notifications
-                self.cache[url].reload(url)
+        """ Reload what comes from a file (by its normalized url), then notify its listeners """
+        for cache_url in list(self.sources.get(url, ())):
+            asset = self.cache.get(cache_url)
+            if isinstance(asset, Canvas):
+                # Reload the canvas in place before issuing the notifications, the renderer swaps its texture once
+                asset.reload(join(ROOT_DIR, url))
             else:
-                del self.cache[url]
+                self._drop(cache_url)
 
-        for ref in reload:
-            ref.reload(url)
+        for ref in list(self.notifications.get(url, ())):
+            if hasattr(ref, 'reload'):
+                ref.reload(url)
 
 
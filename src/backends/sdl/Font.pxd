@@ -11,9 +11,45 @@
 from ignifuga.backends.FontBase cimport FontBase
 from ignifuga.Log import *
 from SDL cimport *
+from ignifuga.backends.sdl.AssetPack cimport AssetPack
+from libcpp.map cimport *
+from libcpp.pair cimport *
+from libcpp.vector cimport *
+
+ctypedef struct GLYPH:
+    # Area of the glyph in the atlas (empty for blank glyphs), and its placement relative to the pen position
+    SDL_Rect src
+    int x, y, advance
+
+ctypedef map[Uint16,GLYPH].iterator glyph_iterator
+
+cdef class TextRun:
+    """ A laid out line of text, as quads copied from the glyph atlas """
+    cdef vector[SDL_Rect] *src
+    cdef vector[SDL_Rect] *dst
+    cdef readonly int width, height
 
 cdef class Font(FontBase):
     cdef object __weakref__
     cdef TTF_Font *ttf_font
     cdef char *buffer
-    cdef unsigned int buffersize
\ No newline at end of file
+    cdef unsigned int buffersize
+    # Fonts read from a pack use its mapping in place of the buffer
+    cdef AssetPack pack
+
+    # Glyph atlas, glyphs are rasterized once into the surface, which is uploaded to the texture when it changes
+    cdef SDL_Surface *atlas
+    cdef SDL_Texture *atlasTexture
+    cdef bint atlasDirty
+    cdef int shelfX, shelfY, shelfH, generation
+    cdef map[Uint16,GLYPH] *glyphs
+    # Recently laid out text, least recently used first
+    cdef object runs
+    cdef public int maxRuns
+
+    cdef GLYPH *_glyph(self, Uint16 ch)
+    cdef bint _place(self, int w, int h, SDL_Rect *rect)
+    cdef bint _growAtlas(self)
+    cdef _resetAtlas(self)
+    cdef TextRun layout(self, text, bint retried=*)
+    cdef SDL_Texture *uploadAtlas(self, SDL_Renderer *renderer)
@@ -12,27 +12,73 @@
 
 from ignifuga.Log import *
 from libc.stdlib cimport *
+from cython.operator cimport dereference as deref
+from collections import OrderedDict
+
+DEF ATLAS_SIZE = 256
+DEF ATLAS_MAX_SIZE = 2048
+DEF MAX_RUNS = 64
+
+cdef SDL_Surface *_atlasSurface(int w, int h):
+    """ Transparent ARGB surface, uploaded as is to SDL_PIXELFORMAT_ARGB8888 textures """
+    return SDL_CreateRGBSurface(0, w, h, 32, 0x00FF0000, 0x0000FF00, 0x000000FF, 0xFF000000)
+
+cdef class TextRun:
+    def __init__(self):
+        self.src = new vector[SDL_Rect]()
+        self.dst = new vector[SDL_Rect]()
+        self.width = 0
+        self.height = 0
+
+    def __dealloc__(self):
+        if self.src != NULL:
+            del self.src
+            self.src = NULL
+        if self.dst != NULL:
+            del self.dst
+            self.dst = NULL
 
 cdef class Font(FontBase):
-    def __init__(self, url, size):
+    def __init__(self, url, size, AssetPack pack=None):
         cdef bytes burl
+        cdef SDL_RWops *file
+
+        self.glyphs = new map[Uint16,GLYPH]()
+        self.atlas = NULL
+        self.atlasTexture = NULL
+        self.atlasDirty = False
+        self.shelfX = self.shelfY = self.shelfH = 0
+        self.generation = 0
+        self.runs = OrderedDict()
+        self.maxRuns = MAX_RUNS
 
         burl = bytes(url)
+        self.pack = pack
+        self.buffer = NULL
+        self.buffersize = 0
+        if pack is not None:
+            file = pack.open(burl)
+            if file != NULL:
+                self.ttf_font = TTF_OpenFontRW(file, 1, size)
+            if self.ttf_font == NULL:
+                error('Error loading font %s from pack: %s' % (url, SDL_GetError()) )
+            return
+
         #self.ttf_font = TTF_OpenFont(burl, size) -> Fails under Android (deadlocks!)
         cdef unsigned int chunk = 65536, read
-        self.buffersize = 0
         self.buffer = <char*>malloc(chunk * sizeof(char))
         if self.buffer == NULL:
             error("Could not allocate tmp buffer to load font!")
             return
 
-        cdef SDL_RWops *file = SDL_RWFromFile(burl, "rb")
+        file = SDL_RWFromFile(burl, "rb")
         if file != NULL:
             while True:
                 read = file.read(file, self.buffer+self.buffersize, sizeof(char), chunk)
                 self.buffersize += read * sizeof(char)
                 if read >= chunk:
-                    self.buffer = <char*>realloc(self.buffer, self.buffersize)
+                    # Make room for the next chunk
+                    self.buffer = <char*>realloc(self.buffer, self.buffersize + chunk)
                 else:
                     break
 
@@ -44,8 +90,22 @@ cdef class Font(FontBase):
             error('Error loading font %s: %s' % (url, SDL_GetError()) )
 
 
+    property size:
+        def __get__(self):
+            """ Bytes held by the font data and its glyph atlas (surface and texture) """
+            return self.buffersize + (self.atlas.w * self.atlas.h * 4 * 2 if self.atlas != NULL else 0)
+
     def __dealloc__(self):
         #debug('FONT DEALLOC')
+        if self.glyphs != NULL:
+            del self.glyphs
+            self.glyphs = NULL
+        if self.atlas != NULL:
+            SDL_FreeSurface(self.atlas)
+            self.atlas = NULL
+        if self.atlasTexture != NULL:
+            SDL_DestroyTexture(self.atlasTexture)
+            self.atlasTexture = NULL
         if self.ttf_font != NULL:
             #debug('Releasing TTF Font')
             TTF_CloseFont(self.ttf_font)
@@ -55,6 +115,180 @@ cdef class Font(FontBase):
             self.buffersize = 0
 
 
+    cdef GLYPH *_glyph(self, Uint16 ch):
+        """ Find a glyph, rasterizing it into the atlas the first time it's used """
+        cdef glyph_iterator iter = self.glyphs.find(ch)
+        cdef GLYPH glyph
+        cdef SDL_Rect dst
+        cdef SDL_Surface *ss
+        cdef SDL_Color white
+        cdef int minx, maxx, miny, maxy, advance
+
+        if iter != self.glyphs.end():
+            return &deref(iter).second
+
+        if self.ttf_font == NULL or TTF_GlyphMetrics(self.ttf_font, ch, &minx, &maxx, &miny, &maxy, &advance) != 0:
+            return NULL
+
+        glyph.src.x = glyph.src.y = glyph.src.w = glyph.src.h = 0
+        glyph.x = minx
+        glyph.y = 0
+        glyph.advance = advance
+
+        # Rasterize in white, the text color is applied when copying from the atlas
+        white.r = white.g = white.b = 255
+        ss = TTF_RenderGlyph_Solid(self.ttf_font, ch, white)
+        if ss != NULL:
+            if ss.w > 0 and ss.h > 0:
+                if not self._place(ss.w, ss.h, &glyph.src):
+                    # The atlas is full, start over (layout notices the generation change)
+                    self._resetAtlas()
+                    if not self._place(ss.w, ss.h, &glyph.src):
+                        SDL_FreeSurface(ss)
+                        return NULL
+                dst = glyph.src
+                SDL_UpperBlit(ss, NULL, self.atlas, &dst)
+                self.atlasDirty = True
+                # Depending on the SDL_ttf version the glyph surface is either a full line high or just the glyph bitmap
+                if ss.h < TTF_FontHeight(self.ttf_font):
+                    glyph.y = TTF_FontAscent(self.ttf_font) - maxy
+            SDL_FreeSurface(ss)
+
+        return &deref(self.glyphs.insert(pair[Uint16,GLYPH](ch, glyph)).first).second
+
+    cdef bint _place(self, int w, int h, SDL_Rect *rect):
+        """ Find room for a glyph in the atlas shelves, growing the atlas as needed """
+        if self.atlas == NULL and not self._growAtlas():
+            return False
+
+        while True:
+            if self.shelfX + w > self.atlas.w:
+                # Start a new shelf
+                self.shelfY += self.shelfH
+                self.shelfX = 0
+                self.shelfH = 0
+            if self.shelfX + w <= self.atlas.w and self.shelfY + h <= self.atlas.h:
+                break
+            if not self._growAtlas():
+                return False
+
+        rect.x = self.shelfX
+        rect.y = self.shelfY
+        rect.w = w
+        rect.h = h
+        # Leave a pixel between glyphs so filtering doesn't bleed them into each other
+        self.shelfX += w + 1
+        if h + 1 > self.shelfH:
+            self.shelfH = h + 1
+        return True
+
+    cdef bint _growAtlas(self):
+        """ Double the atlas size, the glyphs stay where they are """
+        cdef SDL_Surface *atlas
+        cdef int size = ATLAS_SIZE if self.atlas == NULL else self.atlas.w * 2
+
+        if size > ATLAS_MAX_SIZE:
+            return False
+        atlas = _atlasSurface(size, size)
+        if atlas == NULL:
+            return False
+        if self.atlas != NULL:
+            SDL_SetSurfaceBlendMode(self.atlas, SDL_BLENDMODE_NONE)
+            SDL_UpperBlit(self.atlas, NULL, atlas, NULL)
+            SDL_FreeSurface(self.atlas)
+        self.atlas = atlas
+        if self.atlasTexture != NULL:
+            SDL_DestroyTexture(self.atlasTexture)
+            self.atlasTexture = NULL
+        self.atlasDirty = True
+        return True
+
+    cdef _resetAtlas(self):
+        """ Drop every glyph and the text laid out with them """
+        self.glyphs.clear()
+        self.runs.clear()
+        if self.atlas != NULL:
+            SDL_FreeSurface(self.atlas)
+            self.atlas = NULL
+        self.shelfX = self.shelfY = self.shelfH = 0
+        self.generation += 1
+
+    cdef TextRun layout(self, text, bint retried=False):
+        """ Lay out a line of text (unicode or utf-8) as quads from the glyph atlas, recently used lines come from the LRU.
+        If the atlas is reset halfway through, the line is laid out again once from the fresh atlas
+        """
+        cdef TextRun run
+        cdef GLYPH *glyph
+        cdef SDL_Rect dst
+        cdef int pen = 0, left = 0, right = 0, generation = self.generation
+        cdef size_t i
+
+        if isinstance(text, str):
+            text = text.decode('utf-8', 'replace')
+        else:
+            text = unicode(text)
+
+        run = self.runs.pop(text, None)
+        if run is not None:
+            # Move it to the most recently used end
+            self.runs[text] = run
+            return run
+
+        run = TextRun()
+        run.height = TTF_FontHeight(self.ttf_font) if self.ttf_font != NULL else 0
+        for ch in text:
+            code = ord(ch)
+            # SDL_ttf only handles the basic multilingual plane
+            glyph = self._glyph(code if code <= 0xFFFF else 0xFFFD)
+            if self.generation != generation:
+                # The atlas filled up and was reset, what we laid out so far points to glyphs that are gone
+                if not retried:
+                    return self.layout(text, True)
+                error('Text does not fit in the glyph atlas, not drawing it: %s' % text.encode('utf-8', 'replace'))
+                return TextRun()
+            if glyph == NULL:
+                continue
+            if glyph.src.w > 0:
+                dst.x = pen + glyph.x
+                dst.y = glyph.y
+                dst.w = glyph.src.w
+                dst.h = glyph.src.h
+                run.src.push_back(glyph.src)
+                run.dst.push_back(dst)
+                if dst.x < left:
+                    left = dst.x
+                if dst.x + dst.w > right:
+                    right = dst.x + dst.w
+            pen += glyph.advance
+
+        if pen > right:
+            right = pen
+        if left < 0:
+            # Glyphs that reach to the left of the pen start (ie, italics) shift the line
+            for i in range(run.dst.size()):
+                run.dst[0][i].x -= left
+        run.width = right - left
+
+        self.runs[text] = run
+        while len(self.runs) > self.maxRuns:
+            self.runs.popitem(last=False)
+        return run
+
+    cdef SDL_Texture *uploadAtlas(self, SDL_Renderer *renderer):
+        """ Get the atlas texture, uploading the glyphs rasterized since the last time """
+        if self.atlas == NULL:
+            return NULL
+        if self.atlasTexture == NULL:
+            self.atlasTexture = SDL_CreateTexture(renderer, SDL_PIXELFORMAT_ARGB8888, SDL_TEXTUREACCESS_STATIC, self.atlas.w, self.atlas.h)
+            if self.atlasTexture == NULL:
+                return NULL
+            SDL_SetTextureBlendMode(self.atlasTexture, SDL_BLENDMODE_BLEND)
+            self.atlasDirty = True
+        if self.atlasDirty:
+            SDL_UpdateTexture(self.atlasTexture, NULL, self.atlas.pixels, self.atlas.pitch)
+            self.atlasDirty = False
+        return self.atlasTexture
+
     def __deepcopy__(self, memo):
         """ Don't allow deepcopying of the Font"""
         return self
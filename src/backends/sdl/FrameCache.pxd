@@ -0,0 +1,17 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Composed animation frames cache
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.backends.sdl.SDL cimport *
+from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.TextureCache cimport TextureCache
+
+cdef class FrameCache(TextureCache):
+    # Keys are (atlas texture, frame)
+    cpdef Canvas get(self, Canvas atlas, int frame)
+    cpdef Canvas put(self, Canvas atlas, int frame, Canvas composed)
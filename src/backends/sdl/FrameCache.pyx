@@ -0,0 +1,22 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Composed animation frames cache
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+cdef class FrameCache(TextureCache):
+    """ Fully composed animation frames, shared by every sprite animating the same atlas """
+
+    cpdef Canvas get(self, Canvas atlas, int frame):
+        """ Get the composed frame of an atlas, or None if it's not cached """
+        return self._lookup((<size_t>atlas._surfacehw, frame))
+
+    cpdef Canvas put(self, Canvas atlas, int frame, Canvas composed):
+        """ Store a copy of a composed frame, returns the copy (or None if it doesn't fit in the budget) """
+        cdef Canvas canvas = self._store((<size_t>atlas._surfacehw, frame), atlas, composed._width, composed._height)
+        if canvas is not None:
+            canvas.blitCanvas(composed, 0, 0, composed._width, composed._height, 0, 0, composed._width, composed._height, canvas.BLENDMODE_NONE)
+        return canvas
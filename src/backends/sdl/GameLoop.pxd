@@ -11,6 +11,8 @@ from ignifuga.backends.sdl.SDL cimport *
 from ignifuga.Gilbert import Gilbert, Event
 from ignifuga.backends.GameLoopBase cimport *
 from ignifuga.backends.sdl.Renderer cimport Renderer, PointD
+from ignifuga.backends.sdl.Profiler cimport *
+from ignifuga.backends.sdl.RemoteScreen cimport RemoteScreen
 from libcpp.string cimport *
 
 #if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
@@ -32,12 +34,16 @@ cdef class GameLoop(GameLoopBase):
     cdef object touchCaptor
     cdef bint touchCaptured
     cdef int active_touches
+    cdef readonly FrameProfiler profiler
+    cdef readonly RemoteScreen remoteScreen
 
     cdef handleSDLEvent(self, SDL_Event *sdlev)
     cdef normalizeFingerEvent(self, SDL_TouchFingerEvent *fev)
 
     cdef handleTouch(self, EventType action, int x, int y, int stream)
     cdef handleEthereal(self, EventType event)
+    cpdef startProfiler(self, int frames=*)
+    cpdef stopProfiler(self)
 
 
 
@@ -18,7 +18,7 @@ import time, sys
 DEF NUM_STREAMS = 20
 
 cdef class GameLoop(GameLoopBase):
-    def __init__(self, fps = 30.0, remoteConsole = None, remoteScreen = False, ip='127.0.0.1', port=54322, pauseOnFocusLost=False):
+    def __init__(self, fps = 30.0, remoteConsole = None, remoteScreen = False, ip='127.0.0.1', port=54322, pauseOnFocusLost=False, remoteScreenQuality=100):
         super(GameLoop, self).__init__(fps, remoteConsole, remoteScreen, ip, port, pauseOnFocusLost)
         self.renderer = <Renderer>Gilbert().renderer
         self._screen_w, self._screen_h = self.renderer.screenSize
@@ -41,14 +41,14 @@ cdef class GameLoop(GameLoopBase):
         self.lastTouch.x = 0
         self.lastTouch.y = 0
 
+        if self.enableRemoteScreen:
+            self.remoteScreen = RemoteScreen(self.remoteScreenHandlers, quality=remoteScreenQuality)
+
     cpdef run(self):
         cdef SDL_Event ev
         cdef Uint32 now
         cdef Sint64 remainingTime
         cdef Uint64 nowx, freqx = self.ticks_second / 1000
-        cdef char *jpegBuf
-        cdef unsigned long jpegBufSize
-        cdef bytes screenCap
 
         overlord = Gilbert()
 #        if overlord.platform in ['iphone',]:
@@ -80,12 +80,25 @@ cdef class GameLoop(GameLoopBase):
         while True:
             nowx = SDL_GetPerformanceCounter()
             now = nowx / freqx
+            if self.profiler is not None:
+                self.profiler.beginFrame(now)
 
             while SDL_PollEvent(&ev):
                 self.handleSDLEvent(&ev)
 
+#if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
+            # Bursts of file changes are coalesced, everything that changed is reloaded once
+            if overlord.dataManager.pendingReloads:
+                overlord.dataManager.flushReloads()
+#endif
+
+            if self.profiler is not None:
+                self.profiler.mark(PROFILE_EVENTS)
+
             if not self.paused:
                 self.update(now)
+                if self.profiler is not None:
+                    self.profiler.mark(PROFILE_TASKS)
                 if not self.freezeRenderer:
                     self.renderer.update(now)
 
@@ -95,20 +108,14 @@ cdef class GameLoop(GameLoopBase):
             if remainingTime > 0:
 #if DEBUG and (__LINUX__ or __OSX__ or __MINGW__)
                 self.fw.update()
+                if self.profiler is not None:
+                    # File watching is idle time, even when the remote screen presents after it
+                    self.profiler.mark(PROFILE_IDLE)
 #endif
                 if self.enableRemoteScreen:
                     if self.remoteScreenHandlers:
-                        jpegBuf = NULL
-                        jpegBufSize = 0
-                        if self.renderer.captureScreenJPEG(<unsigned char**>&jpegBuf, &jpegBufSize):
-                            screenCap = jpegBuf[:jpegBufSize]
-                            self.renderer.releaseCapturedScreenBufferJPEG(<unsigned char*>jpegBuf)
-                            jpegBuf = NULL
-
-                            for handler in self.remoteScreenHandlers:
-                                handler.screen = screenCap
-                                handler.screenSize = jpegBufSize
-                                handler.sem.release()
+                        # Only the pixels are read here, the encoding happens in the remote screen worker
+                        self.remoteScreen.capture(self.renderer)
                     # If remote screen is enabled, the renderer won't flip automatically because its waiting for us to order the screenshot
                     self.renderer.flip()
 
@@ -119,15 +126,45 @@ cdef class GameLoop(GameLoopBase):
                 # in this case, there's not enough time
                 self.renderer.flip()
 
+            if self.profiler is not None:
+                self.profiler.mark(PROFILE_IDLE)
+
             if self.quit:
                 break
 
+    cpdef startProfiler(self, int frames=600):
+        """ Start profiling every frame, keeping the last frames samples """
+        if self.profiler is None:
+            self.profiler = FrameProfiler(frames, self.ticks_second)
+            self.renderer.profiler = self.profiler
+            self.profiling = True
+        return self.profiler
+
+    cpdef stopProfiler(self):
+        """ Stop profiling, the data collected is still available in the returned profiler """
+        profiler = self.profiler
+        self.profiler = None
+        self.renderer.profiler = None
+        self.profiling = False
+        return profiler
+
+    cdef _profileTaskStart(self):
+        if self.profiler is not None:
+            self.profiler.startTask()
+
+    cdef _profileTaskEnd(self, PyObject *entity):
+        if self.profiler is not None:
+            self.profiler.endTask(<object>entity)
+
     cpdef cleanup(self):
         # Run the event loop one last time to purge any lingering messages
         cdef SDL_Event ev
         while SDL_PollEvent(&ev):
             self.handleSDLEvent(&ev)
 
+        if self.remoteScreen is not None:
+            self.remoteScreen.free()
+
     cdef handleSDLEvent(self, SDL_Event *sdlev):
         cdef SDL_MouseMotionEvent *mmev
         cdef SDL_MouseButtonEvent *mbev
@@ -0,0 +1,52 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Frame Profiler
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.backends.sdl.SDL cimport *
+from libc.stdlib cimport *
+from libc.string cimport *
+
+cdef enum ProfilePhase:
+    PROFILE_EVENTS = 0
+    PROFILE_TASKS = 1
+    PROFILE_SPRITES = 2
+    PROFILE_DRAW = 3
+    PROFILE_PRESENT = 4
+    PROFILE_IDLE = 5
+
+cdef struct _FrameSample:
+    Uint32 now
+    Uint64 total
+    Uint64 phases[6]
+    Uint64 worstTask
+
+cdef class FrameProfiler:
+    cdef bint released, started
+    # Ring buffer of finished frames
+    cdef _FrameSample *samples
+    cdef readonly int size, count
+    cdef int head
+    # The frame being measured
+    cdef _FrameSample frame
+    cdef object frameWorstTask
+    cdef Uint64 frameStart, lastMark, taskStart
+    cdef readonly Uint64 ticks_second
+    cdef list worstTasks
+    cdef dict tasks
+
+    cdef beginFrame(self, Uint32 now)
+    cdef void mark(self, ProfilePhase phase) nogil
+    cdef void startTask(self) nogil
+    cdef endTask(self, task)
+    cdef double _ms(self, Uint64 ticks)
+    cpdef free(self)
+    cpdef reset(self)
+    cpdef list frames(self)
+    cpdef list topTasks(self, int n=*)
+    cpdef report(self, int n=*)
+    cpdef dumpCSV(self, filename)
@@ -0,0 +1,160 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Frame Profiler
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+# cython: boundscheck=False
+# cython: wraparound=False
+
+from ignifuga.Log import debug, error
+import csv, os.path
+from operator import itemgetter
+
+PHASES = ['events', 'tasks', 'sprites', 'draw', 'present', 'idle']
+
+cdef _taskLabel(task):
+    """ Components are labelled as entity/component, anything else by its id """
+    if hasattr(task.__class__, 'entity') and task.entity is not None:
+        return '%s/%s' % (task.entity.id, task.id)
+    return str(getattr(task, 'id', task))
+
+cdef class FrameProfiler:
+    """ Keeps per phase timings of the last frames in a ring buffer, and per task timings attributed to their entity/component
+    Phases are: events, tasks (entities and components updates), sprites (sprite processing), draw, present (including the
+    remote screen capture if enabled) and idle (file watching and sleeping until the next frame)
+    """
+    def __init__(self, int size=600, Uint64 ticks_second=0):
+        self.released = True
+        if size < 1:
+            raise ValueError('The profiler needs room for at least one frame, got %d' % size)
+        self.released = False
+        self.size = size
+        self.ticks_second = ticks_second if ticks_second > 0 else SDL_GetPerformanceFrequency()
+        self.samples = <_FrameSample*> malloc(sizeof(_FrameSample) * size)
+        self.worstTasks = [None] * size
+        self.reset()
+
+    def __dealloc__(self):
+        self.free()
+
+    cpdef free(self):
+        if not self.released:
+            free(self.samples)
+            self.samples = NULL
+            self.released = True
+
+    cpdef reset(self):
+        self.count = 0
+        self.head = 0
+        self.started = False
+        self.tasks = {}
+        self.frameWorstTask = None
+
+    cdef beginFrame(self, Uint32 now):
+        """ Store the frame that just ended in the ring buffer and start measuring a new one """
+        cdef Uint64 t = SDL_GetPerformanceCounter()
+        if self.started:
+            self.frame.total = t - self.frameStart
+            self.samples[self.head] = self.frame
+            if self.frameWorstTask is not None:
+                self.worstTasks[self.head] = _taskLabel(self.frameWorstTask)
+            else:
+                self.worstTasks[self.head] = None
+            self.head = (self.head + 1) % self.size
+            if self.count < self.size:
+                self.count += 1
+
+        memset(&self.frame, 0, sizeof(_FrameSample))
+        self.frame.now = now
+        self.frameWorstTask = None
+        self.frameStart = self.lastMark = t
+        self.started = True
+
+    cdef void mark(self, ProfilePhase phase) nogil:
+        """ Account the time elapsed since the last mark to phase """
+        cdef Uint64 t = SDL_GetPerformanceCounter()
+        self.frame.phases[<int>phase] += t - self.lastMark
+        self.lastMark = t
+
+    cdef void startTask(self) nogil:
+        self.taskStart = SDL_GetPerformanceCounter()
+
+    cdef endTask(self, task):
+        cdef Uint64 elapsed = SDL_GetPerformanceCounter() - self.taskStart
+        if elapsed > self.frame.worstTask:
+            self.frame.worstTask = elapsed
+            self.frameWorstTask = task
+
+        label = _taskLabel(task)
+        stats = self.tasks.get(label)
+        if stats is None:
+            self.tasks[label] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            if elapsed > stats[2]:
+                stats[2] = elapsed
+
+    cdef double _ms(self, Uint64 ticks):
+        return ticks * 1000.0 / self.ticks_second
+
+    cpdef list frames(self):
+        """ Returns the stored frames, oldest first, with times in ms """
+        cdef int i, idx
+        cdef _FrameSample *sample
+        frames = []
+        for i in range(self.count):
+            idx = (self.head - self.count + i + self.size) % self.size
+            sample = &self.samples[idx]
+            frame = {'now': sample.now, 'total': self._ms(sample.total), 'worstTask': self.worstTasks[idx], 'worstTaskTime': self._ms(sample.worstTask)}
+            for p in range(len(PHASES)):
+                frame[PHASES[p]] = self._ms(sample.phases[p])
+            frames.append(frame)
+        return frames
+
+    cpdef list topTasks(self, int n=10):
+        """ Returns (label, calls, total ms, worst ms) for the n tasks that used up the most time """
+        tasks = [(label, stats[0], self._ms(stats[1]), self._ms(stats[2])) for label, stats in self.tasks.iteritems()]
+        tasks.sort(key=itemgetter(2), reverse=True)
+        return tasks[:n]
+
+    cpdef report(self, int n=10):
+        """ A human readable summary, meant to be printed from the remote console """
+        frames = self.frames()
+        if not frames:
+            return 'No frames profiled yet'
+
+        lines = ['%d frames, avg %.2f ms, worst %.2f ms' % (len(frames), sum([f['total'] for f in frames]) / len(frames), max([f['total'] for f in frames]))]
+        lines.append('Phases (avg/worst ms): ' + ', '.join(['%s %.2f/%.2f' % (p, sum([f[p] for f in frames]) / len(frames), max([f[p] for f in frames])) for p in PHASES]))
+        worst = max(frames, key=itemgetter('total'))
+        lines.append('Worst frame at %d, slowest task there: %s (%.2f ms)' % (worst['now'], worst['worstTask'], worst['worstTaskTime']))
+        lines.append('Top tasks (calls, total ms, worst ms):')
+        for label, calls, total, worstTime in self.topTasks(n):
+            lines.append('    %s: %d, %.2f, %.2f' % (label, calls, total, worstTime))
+        return '\n'.join(lines)
+
+    cpdef dumpCSV(self, filename):
+        """ Dump the frames to filename, and the per task timings to filename_tasks """
+        root, ext = os.path.splitext(filename)
+        f = open(filename, 'wb')
+        try:
+            writer = csv.writer(f)
+            writer.writerow(['now', 'total'] + PHASES + ['worst_task', 'worst_task_ms'])
+            for frame in self.frames():
+                writer.writerow([frame['now'], frame['total']] + [frame[p] for p in PHASES] + [frame['worstTask'], frame['worstTaskTime']])
+        finally:
+            f.close()
+
+        f = open(root + '_tasks' + (ext if ext else '.csv'), 'wb')
+        try:
+            writer = csv.writer(f)
+            writer.writerow(['task', 'calls', 'total_ms', 'worst_ms'])
+            for row in self.topTasks(len(self.tasks)):
+                writer.writerow(row)
+        finally:
+            f.close()
+        debug('Frame profile dumped to %s' % filename)
@@ -0,0 +1,32 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Remote Screen encoder
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.backends.sdl.SDL cimport *
+from ignifuga.backends.sdl.Renderer cimport Renderer
+from libcpp.vector cimport *
+
+cdef class RemoteScreen:
+    cdef bint released, running, stopped, ready, hashesValid
+    # The game loop captures into staging, the worker encodes from encoding, they are swapped when a frame is handed over
+    cdef SDL_Surface *staging
+    cdef SDL_Surface *encoding
+    cdef tjhandle tjh
+    cdef object cond, handlers
+    cdef int tileSize, tilesX, tilesY
+    # Per tile hashes of the last encoded frame, and the tiles that changed in the current one
+    cdef vector[Uint64] *tileHashes
+    cdef vector[int] *changedTiles
+    cdef public int quality
+    cdef readonly unsigned long framesCaptured, framesEncoded, framesSkipped
+
+    cpdef bint capture(self, Renderer renderer)
+    cdef int _hashTiles(self, SDL_Surface *surface) nogil
+    cdef bytes _compress(self, SDL_Surface *surface, int x, int y, int w, int h)
+    cdef _encode(self)
+    cpdef free(self)
@@ -0,0 +1,223 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Remote Screen encoder
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+# cython: boundscheck=False
+# cython: wraparound=False
+
+from ignifuga.Log import debug, error
+cimport cython
+import thread, threading
+
+cdef SDL_Surface *_stagingSurface(int w, int h) nogil:
+    """ RGBA in memory, as the JPEG compressor expects it """
+    #if BIG_ENDIAN
+    return SDL_CreateRGBSurface(0, w, h, 32, 0xFF000000, 0x00FF0000, 0x0000FF00, 0x000000FF)
+    #else
+    return SDL_CreateRGBSurface(0, w, h, 32, 0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000 )
+    #endif
+
+cdef class RemoteScreen:
+    """ Streams the screen to the remote screen handlers. The game loop only reads the screen pixels into a staging surface,
+    hashing (to skip unchanged frames and find the changed tiles) and JPEG compression happen in a worker thread.
+    Handlers that fall behind simply miss frames, tile handlers start over from a full frame.
+    """
+    def __init__(self, handlers, int tileSize=64, int quality=100):
+        self.released = False
+        self.handlers = handlers
+        self.tileSize = tileSize
+        self.quality = quality
+        self.staging = NULL
+        self.encoding = NULL
+        self.tilesX = self.tilesY = 0
+        self.tileHashes = new vector[Uint64]()
+        self.changedTiles = new vector[int]()
+        self.hashesValid = False
+        self.tjh = tjInitCompress()
+        self.cond = threading.Condition()
+        self.ready = False
+        self.running = True
+        self.stopped = False
+        self.framesCaptured = self.framesEncoded = self.framesSkipped = 0
+        thread.start_new_thread(self._worker, ())
+
+    def __dealloc__(self):
+        self.free()
+
+    cpdef bint capture(self, Renderer renderer):
+        """ Grab the screen into the staging surface and wake up the worker. If the worker is still busy, the frame waiting for it is replaced """
+        cdef SDL_Surface *surface
+        with self.cond:
+            if not self.running:
+                return False
+            if self.staging != NULL and (self.staging.w != renderer._width or self.staging.h != renderer._height):
+                SDL_FreeSurface(self.staging)
+                self.staging = NULL
+            if self.staging == NULL:
+                self.staging = _stagingSurface(renderer._width, renderer._height)
+                if self.staging == NULL:
+                    return False
+
+            if not renderer.readScreen(self.staging):
+                return False
+            self.ready = True
+            self.framesCaptured += 1
+            self.cond.notify()
+        return True
+
+    def _worker(self):
+        cdef SDL_Surface *surface
+        while True:
+            with self.cond:
+                while self.running and not self.ready:
+                    self.cond.wait()
+                if not self.running:
+                    break
+                surface = self.encoding
+                self.encoding = self.staging
+                self.staging = surface
+                self.ready = False
+            try:
+                self._encode()
+            except:
+                error('Remote screen encoding failed')
+
+        with self.cond:
+            if self.encoding != NULL:
+                SDL_FreeSurface(self.encoding)
+                self.encoding = NULL
+            if self.tjh != NULL:
+                tjDestroy(self.tjh)
+                self.tjh = NULL
+            self.stopped = True
+            self.cond.notify_all()
+
+    @cython.cdivision(True)
+    cdef int _hashTiles(self, SDL_Surface *surface) nogil:
+        """ Hash every tile of the surface, collect the tiles whose hash changed. Returns how many of them changed """
+        cdef int tx, ty, x, y, x0, y0, x1, y1, tile
+        cdef Uint32 *row
+        cdef Uint64 h
+
+        self.changedTiles.clear()
+        tx = (surface.w + self.tileSize - 1) / self.tileSize
+        ty = (surface.h + self.tileSize - 1) / self.tileSize
+        if tx != self.tilesX or ty != self.tilesY:
+            self.tilesX = tx
+            self.tilesY = ty
+            self.tileHashes.resize(tx*ty)
+            self.hashesValid = False
+
+        for ty in range(self.tilesY):
+            y0 = ty * self.tileSize
+            y1 = y0 + self.tileSize
+            if y1 > surface.h:
+                y1 = surface.h
+            for tx in range(self.tilesX):
+                x0 = tx * self.tileSize
+                x1 = x0 + self.tileSize
+                if x1 > surface.w:
+                    x1 = surface.w
+                # FNV-1a, one pixel at a time
+                h = 14695981039346656037ULL
+                for y in range(y0, y1):
+                    row = <Uint32*>(<unsigned char*>surface.pixels + y*surface.pitch)
+                    for x in range(x0, x1):
+                        h = (h ^ row[x]) * 1099511628211ULL
+                tile = ty*self.tilesX + tx
+                if not self.hashesValid or self.tileHashes[0][tile] != h:
+                    self.tileHashes[0][tile] = h
+                    self.changedTiles.push_back(tile)
+
+        self.hashesValid = True
+        return self.changedTiles.size()
+
+    cdef bytes _compress(self, SDL_Surface *surface, int x, int y, int w, int h):
+        """ JPEG compress a rectangle of the surface """
+        cdef unsigned char *jpegBuf = NULL
+        cdef unsigned long jpegSize = 0
+        cdef unsigned char *pixels = <unsigned char*>surface.pixels + y*surface.pitch + x*4
+        cdef int result
+        cdef bytes data
+
+        with nogil:
+            result = tjCompress2(self.tjh, pixels, w, surface.pitch, h, TJPF_RGBA, &jpegBuf, &jpegSize, TJSAMP_444, self.quality, 0)
+        if result != 0:
+            if jpegBuf != NULL:
+                tjFree(jpegBuf)
+            return None
+        data = (<char*>jpegBuf)[:jpegSize]
+        tjFree(jpegBuf)
+        return data
+
+    cdef _encode(self):
+        """ Encode the frame in the encoding surface and hand it over to the handlers that need it """
+        cdef SDL_Surface *surface = self.encoding
+        cdef int changed, i, tile, x, y, w, h
+        cdef bytes full = None
+
+        with nogil:
+            changed = self._hashTiles(surface)
+
+        handlers = list(self.handlers)
+        if changed == 0 and not [handler for handler in handlers if handler.needsFull]:
+            self.framesSkipped += 1
+            return
+
+        # The whole frame goes to the MJPEG handlers and to the tile handlers that are (re)starting
+        if [handler for handler in handlers if handler.needsFull or (changed > 0 and not handler.tiles)]:
+            full = self._compress(surface, 0, 0, surface.w, surface.h)
+            if full is None:
+                return
+
+        tiles = None
+        if changed > 0 and [handler for handler in handlers if handler.tiles and not handler.needsFull]:
+            tiles = []
+            for i in range(changed):
+                tile = self.changedTiles[0][i]
+                x = (tile % self.tilesX) * self.tileSize
+                y = (tile / self.tilesX) * self.tileSize
+                w = self.tileSize if x + self.tileSize <= surface.w else surface.w - x
+                h = self.tileSize if y + self.tileSize <= surface.h else surface.h - y
+                data = self._compress(surface, x, y, w, h)
+                if data is None:
+                    return
+                tiles.append((x, y, w, h, data))
+
+        self.framesEncoded += 1
+        for handler in handlers:
+            if handler.needsFull:
+                handler.needsFull = False
+                if handler.tiles:
+                    handler.pushTiles([(0, 0, surface.w, surface.h, full)])
+                else:
+                    handler.pushScreen(full)
+            elif handler.tiles:
+                if tiles is not None:
+                    handler.pushTiles(tiles)
+            elif changed > 0:
+                handler.pushScreen(full)
+
+    property stats:
+        def __get__(self):
+            return {'captured': self.framesCaptured, 'encoded': self.framesEncoded, 'skipped': self.framesSkipped}
+
+    cpdef free(self):
+        """ Stop the worker and wait for it, it releases the surface it's using and the compressor on its way out """
+        if not self.released:
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+                while not self.stopped:
+                    self.cond.wait()
+                if self.staging != NULL:
+                    SDL_FreeSurface(self.staging)
+                    self.staging = NULL
+            del self.tileHashes
+            del self.changedTiles
+            self.released = True
@@ -10,6 +10,10 @@
 
 from ignifuga.backends.sdl.SDL cimport *
 from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.Profiler cimport *
+from ignifuga.backends.sdl.FrameCache cimport FrameCache
+from ignifuga.backends.sdl.BlurCache cimport BlurCache
+from ignifuga.backends.sdl.SurfacePool cimport SurfacePool
 from ignifuga.backends.GameLoopBase cimport EventType, EVENT_ETHEREAL_SCROLL, EVENT_TOUCH_LAST
 #if ROCKET
 from ignifuga.backends.sdl.Rocket cimport Rocket
@@ -19,8 +23,17 @@ from libc.string cimport *
 from libcpp.map cimport *
 from libcpp.deque cimport *
 from libcpp.pair cimport *
+from libcpp.vector cimport *
 from cpython cimport *
 
+cdef struct _Sprite
+
+# A z level, an intrusive doubly linked list of sprites in draw order
+cdef struct _ZLevel:
+    _Sprite *head
+    _Sprite *tail
+    int count
+
 cdef struct _Sprite:
     # sx,sy  -> are the source coordinates in the sprite (0,0 as the sprite will always handle its own compositing)
     # sw,sh  -> are the dimensions of the source material/sprite
@@ -38,7 +51,22 @@ cdef struct _Sprite:
     SDL_Rect _src, _dst
     PyObject *component
 
+    # Spatial hash cells the sprite is currently filed under (empty if hx1 < hx0), and its order inside its z level
+    int hx0, hy0, hx1, hy1
+    bint hashDirty
+    unsigned long seq
+
+    # Screen area the sprite covered when it was last drawn in dirty rectangle mode
+    SDL_Rect drawn
+    bint drawnValid, damageQueued
+
+    # Intrusive z level handle, zlevel is NULL while the sprite is not indexed
+    _ZLevel *zlevel
+    _Sprite *zprev
+    _Sprite *znext
+
 ctypedef _Sprite* Sprite_p
+ctypedef SDL_Texture* Texture_p
 
 cdef class Sprite:
     cdef Sprite_p sprite
@@ -52,7 +80,6 @@ cdef class Renderer:
     cdef tuple nativeResolution
     # Scale factor = screen/scene
     cdef double _scale_x, _scale_y
-    #cdef list dirtyRects
     # Native scene resolution
     cdef double _native_res_w, _native_res_h
     # Native scene size
@@ -69,13 +96,50 @@ cdef class Renderer:
     cdef bint renderWalkAreasRDir, renderWalkAreasGDir,  renderWalkAreasBDir
 
     # Sprites
-    cdef map[int,deque[Sprite_p]] *zmap
+    cdef map[int,_ZLevel] *zmap
     cdef deque[_Sprite] *active_sprites
     cdef deque[Sprite_p] *free_sprites
     cdef bint dirty, _userCanScroll, _userCanZoom
 
-    # JPEG compressor
-    cdef tjhandle tjh
+    # Draw batching, sprites in a z level are grouped by texture and modulation as long as that doesn't change what's on top (scratch space reused every frame)
+    cdef public bint batching
+    cdef vector[vector[Sprite_p]] *batches
+    cdef vector[SDL_Rect] *batchBounds
+    # (texture, packed r,g,b,a) -> group
+    cdef map[pair[size_t,Uint32],int] *batchIndex
+    # Texture modulation state last set, to skip redundant changes
+    cdef SDL_Texture *_lastTexture
+    cdef Uint8 _lastR, _lastG, _lastB, _lastA
+    # Stats for the last frame
+    cdef readonly int drawCalls, stateChanges, skippedStateChanges
+
+    # Uniform grid spatial hash of the interactive sprites (scene coordinates), refreshed lazily from hashMoved
+    cdef public bint spatialHashing
+    cdef int hashCellSize
+    cdef map[Uint64, vector[Sprite_p]] *spatialHash
+    cdef deque[Sprite_p] *hashMoved
+    cdef vector[Sprite_p] *hashCandidates
+    cdef unsigned long spriteSeq
+
+    # Reverse index of the sprites using each texture, so texture swaps only touch the sprites involved
+    cdef map[Texture_p, vector[Sprite_p]] *textureSprites
+
+    # Dirty rectangle rendering, the scene is kept in a persistent render target and only the damaged areas (screen coordinates) are redrawn
+    cdef bint _dirtyRendering, _damageAll, _frameDrawn
+    cdef SDL_Texture *target
+    cdef vector[SDL_Rect] *damage
+    cdef deque[Sprite_p] *damageQueue
+    cdef readonly int damagedRects
+
+    # Composed animation frames shared between sprites (disabled until given a budget)
+    cdef readonly FrameCache frameCache
+    # Blurred sprite frames (blurring falls back to offset blits when it has no budget)
+    cdef readonly BlurCache blurCache
+    # Surfaces wrapping locked canvas pixels for software blits
+    cdef readonly SurfacePool surfacePool
+
+    # Frame profiler, set by the game loop while profiling
+    cdef FrameProfiler profiler
 
 #if ROCKET
     # Rocket wrapper
@@ -85,13 +149,29 @@ cdef class Renderer:
     cdef void _processSprite(self, Sprite_p sprite, SDL_Rect *screen, bint doScale) nogil
     cdef void _processSprites(self, bint all) nogil
     cdef processEvent(self, EventType action, int x, int y)
+    cdef void _drawSprite(self, Sprite_p sprite, int offx, int offy)
+    cdef void _drawBatched(self, _ZLevel *level)
+    cdef void _hashBounds(self, Sprite_p sprite, SDL_Rect *bounds) nogil
+    cdef void _hashMark(self, Sprite_p sprite) nogil
+    cdef void _hashInsert(self, Sprite_p sprite) nogil
+    cdef void _hashRemove(self, Sprite_p sprite) nogil
+    cdef void _hashFlush(self) nogil
+    cdef int _hashQuery(self, double x, double y) nogil
+    cdef void _textureIndex(self, Sprite_p sprite) nogil
+    cdef void _textureUnindex(self, Sprite_p sprite) nogil
+    cdef bint _createTarget(self)
+    cdef bint _damageBounds(self, Sprite_p sprite, SDL_Rect *bounds) nogil
+    cdef void _damageMark(self, Sprite_p sprite) nogil
+    cdef void _damageAdd(self, SDL_Rect *rect) nogil
+    cdef void _damageCollect(self, bint before) nogil
+    cdef bint _drawDamage(self)
 
     cpdef free(self)
     cpdef update(self, Uint32 now)
+    cpdef bint setDirtyRendering(self, bint enable)
     cpdef getTimestamp(self)
     cpdef checkRate(self, Uint32 lastTime, Uint32 rate)
     cpdef checkLapse(self, Uint32 lastTime, Uint32 lapse)
-    #cpdef dirty(self, int x, int y, int w, int h)
     cpdef setNativeResolution(self, double w=*, double h=*, bint keep_aspect=*, bint autoscale=*)
     cpdef setSceneSize(self, int w, int h)
     cpdef _calculateScale(self, double scene_w, double scene_h, int screen_w, int screen_h, bint keep_aspect=*)
@@ -121,15 +201,18 @@ cdef class Renderer:
     cpdef bint spriteRot(self, Sprite sprite_w, double angle, int centerx, int centery, int flip)
     cpdef bint spriteColor(self, Sprite sprite_w, float r, float g, float b, float a)
     cpdef bint spriteInteractive(self, Sprite sprite_w, bint interactive)
+    cpdef bint spriteDamage(self, Sprite sprite_w)
     cdef bint _spriteZ(self, _Sprite *sprite, int z)
     cdef bint _spriteSrc(self, _Sprite *sprite, int x, int y, int w, int h)
     cdef bint _spriteDst(self, _Sprite *sprite, int x, int y, int w, int h) nogil
     cdef bint _spriteRot(self, _Sprite *sprite, double angle, int centerx, int centery, int flip) nogil
     cdef bint _spriteColor(self, _Sprite *sprite, Uint8 r, Uint8 g, Uint8 b, Uint8 a) nogil
     cdef bint _spriteInteractive(self, _Sprite *sprite, bint interactive) nogil
+    cdef bint _spriteDamage(self, _Sprite *sprite) nogil
+    cdef bint _spriteTexture(self, _Sprite *sprite, SDL_Texture *texture) nogil
     cdef void updateTexture(self, SDL_Texture *oldt, SDL_Texture *newt) nogil
-    cdef bint captureScreenJPEG(self, unsigned char **jpegBuffer, unsigned long *jpegSize) nogil
-    cdef bint releaseCapturedScreenBufferJPEG(self, unsigned char *jpegBuffer) nogil
+    cdef void textureDamage(self, SDL_Texture *texture) nogil
+    cdef bint readScreen(self, SDL_Surface *surface) nogil
     cdef bint _renderWalkAreas(self)
 
     cpdef cleanup(self)
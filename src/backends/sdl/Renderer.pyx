@@ -26,8 +26,22 @@ from cpython cimport *
 from ignifuga.Scene cimport _Scene, _WalkAreaVertex, WalkAreaVertexIterator, WalkAreaVertexDeque
 
 ctypedef unsigned long ULong
-ctypedef deque[Sprite_p].iterator deque_Sprite_iterator
-ctypedef map[int,deque[Sprite_p]].iterator zmap_iterator
+ctypedef map[int,_ZLevel].iterator zmap_iterator
+ctypedef map[Uint64, vector[Sprite_p]].iterator hash_iterator
+ctypedef map[Texture_p, vector[Sprite_p]].iterator texture_iterator
+
+# Past this many separate damaged areas in a frame the whole screen is redrawn
+DEF MAX_DAMAGE_RECTS = 16
+
+@cython.cdivision(True)
+cdef inline int _hashCell(int v, int size) nogil:
+    """ Floor division, so cells to the left/top of the origin don't overlap cell 0 """
+    if v >= 0:
+        return v / size
+    return -((size - 1 - v) / size)
+
+cdef inline Uint64 _hashKey(int cx, int cy) nogil:
+    return (<Uint64><unsigned int>cx << 32) | <Uint64><unsigned int>cy
 
 SDL_WINDOWPOS_CENTERED_MASK = 0x2FFF0000
 SDL_WINDOWPOS_UNDEFINED_MASK = 0x1FFF0000
@@ -169,9 +183,29 @@ cdef class Renderer:
 
 
         # _Sprite list allocation and setup
-        self.zmap = new map[int,deque[Sprite_p]]()
+        self.zmap = new map[int,_ZLevel]()
         self.active_sprites = new deque[_Sprite]()
         self.free_sprites = new deque[Sprite_p]()
+        self.batches = new vector[vector[Sprite_p]]()
+        self.batchBounds = new vector[SDL_Rect]()
+        self.batchIndex = new map[pair[size_t,Uint32],int]()
+        self.batching = True
+        self.spatialHash = new map[Uint64, vector[Sprite_p]]()
+        self.hashMoved = new deque[Sprite_p]()
+        self.hashCandidates = new vector[Sprite_p]()
+        self.textureSprites = new map[Texture_p, vector[Sprite_p]]()
+        self.damage = new vector[SDL_Rect]()
+        self.damageQueue = new deque[Sprite_p]()
+        self.frameCache = FrameCache()
+        self.blurCache = BlurCache()
+        self.surfacePool = SurfacePool()
+        self.target = NULL
+        self._dirtyRendering = False
+        self._damageAll = True
+        self._frameDrawn = True
+        self.hashCellSize = 128
+        self.spatialHashing = True
+        self.spriteSeq = 0
         self.dirty = True
         self._userCanZoom = False
         self._userCanScroll = False
@@ -181,9 +215,6 @@ cdef class Renderer:
         self.rocket.init(self.renderer, self.window)
         #endif
 
-        # JPEG Turbo
-        self.tjh = tjInitCompress()
-
         debug('Renderer initialized')
 
     @cython.cdivision(True)
@@ -302,7 +333,7 @@ cdef class Renderer:
 #            inc(iter)
 
     cpdef update(self, Uint32 now):
-        """ Renders the whole screen in every frame, ignores dirty rectangle markings completely (easier for handling rotations, etc) """
+        """ Renders the whole screen in every frame, or only the damaged areas when dirty rectangle rendering is enabled """
         self.frameTimestamp = now
 
         # In the following, screen coordinates refers to a set of coordinates that start in 0,0 and go to (screen width-1, screen height-1)
@@ -313,67 +344,364 @@ cdef class Renderer:
         # screen is the rectangle that holds the piece of scene that we will show. We still have to apply scaling to it.
 
         cdef zmap_iterator ziter, ziter_last
-        cdef deque[Sprite_p] *ds
-        cdef deque[Sprite_p].iterator iter, iter_last
+        cdef _ZLevel *level
         cdef Sprite_p sprite
+        cdef bint drawn
 
+        if self._dirtyRendering:
+            # Damage the areas the changed sprites covered before they move
+            self._damageCollect(True)
         self._processSprites(self.dirty)
         self.dirty = False
+        if self._dirtyRendering:
+            self._damageCollect(False)
+        if self.profiler is not None:
+            self.profiler.mark(PROFILE_SPRITES)
 
-        ziter = self.zmap.begin()
-        ziter_last = self.zmap.end()
-        while ziter != ziter_last:
-            ds = &deref(ziter).second
-            iter = ds.begin()
-            iter_last = ds.end()
-            while iter != iter_last:
-                sprite = deref(iter)
-                if sprite.show:
-                    SDL_SetTextureColorMod(sprite.texture, sprite.r, sprite.g, sprite.b)
-                    SDL_SetTextureAlphaMod(sprite.texture, sprite.a)
-                    SDL_RenderCopyEx(self.renderer, sprite.texture, &sprite._src, &sprite._dst, sprite.angle, &sprite.center, sprite.flip)
-                inc(iter)
-            inc (ziter)
-
-        if self.renderWalkAreas:
-            self._renderWalkAreas()
-
+        self.drawCalls = self.stateChanges = self.skippedStateChanges = 0
+        self._lastTexture = NULL
 
+        if self._dirtyRendering:
+            drawn = self._drawDamage()
 #if ROCKET
-        self.rocket.update()
-        self.rocket.render()
+            # Rocket doesn't report what changed, its documents are drawn over the scene in every frame
+            drawn = True
 #endif
+            if drawn or self.renderWalkAreas:
+                SDL_RenderCopy(self.renderer, self.target, NULL, NULL)
+                drawn = True
+            self._frameDrawn = drawn
+        else:
+            self.damagedRects = 0
+            ziter = self.zmap.begin()
+            ziter_last = self.zmap.end()
+            while ziter != ziter_last:
+                level = &deref(ziter).second
+                if self.batching:
+                    self._drawBatched(level)
+                else:
+                    sprite = level.head
+                    while sprite != NULL:
+                        if sprite.show:
+                            self._drawSprite(sprite, 0, 0)
+                        sprite = sprite.znext
+                inc (ziter)
+            self._frameDrawn = True
+
+        if self._frameDrawn:
+            if self.renderWalkAreas:
+                self._renderWalkAreas()
 
+#if ROCKET
+            self.rocket.update()
+            self.rocket.render()
+#endif
 
+        if self.profiler is not None:
+            self.profiler.mark(PROFILE_DRAW)
 
         # If remote screen is enabled, don't flip automatically, the gameloop will flip for us after it's taken the screenshot
         if self.autoflip:
             self.flip()
 
+    cdef void _drawSprite(self, Sprite_p sprite, int offx, int offy):
+        """ Render a sprite displaced by -offx,-offy, skipping the texture modulation changes that are already in effect """
+        cdef SDL_Rect dst
+        if sprite.texture != self._lastTexture or sprite.r != self._lastR or sprite.g != self._lastG or sprite.b != self._lastB:
+            SDL_SetTextureColorMod(sprite.texture, sprite.r, sprite.g, sprite.b)
+            self.stateChanges += 1
+        else:
+            self.skippedStateChanges += 1
+
+        if sprite.texture != self._lastTexture or sprite.a != self._lastA:
+            SDL_SetTextureAlphaMod(sprite.texture, sprite.a)
+            self.stateChanges += 1
+        else:
+            self.skippedStateChanges += 1
+
+        self._lastTexture = sprite.texture
+        self._lastR = sprite.r
+        self._lastG = sprite.g
+        self._lastB = sprite.b
+        self._lastA = sprite.a
+        if offx != 0 or offy != 0:
+            dst = sprite._dst
+            dst.x -= offx
+            dst.y -= offy
+            SDL_RenderCopyEx(self.renderer, sprite.texture, &sprite._src, &dst, sprite.angle, &sprite.center, sprite.flip)
+        else:
+            SDL_RenderCopyEx(self.renderer, sprite.texture, &sprite._src, &sprite._dst, sprite.angle, &sprite.center, sprite.flip)
+        self.drawCalls += 1
+
+    cdef void _drawBatched(self, _ZLevel *level):
+        """ Render a z level grouping its sprites by texture and color/alpha modulation, so each group sets the texture state
+        once. A sprite only joins the last group of its kind if none of the groups opened after that one covers it, so the result
+        is the same as drawing the sprites in order (as _drawDamage does). Levels are drawn one after the other, sprites never
+        move across them
+        """
+        cdef map[pair[size_t,Uint32],int].iterator bi
+        cdef pair[size_t,Uint32] key
+        cdef Sprite_p sprite = level.head
+        cdef SDL_Rect bounds, merged
+        cdef int groups = 0, g, h
+        cdef size_t i
+
+        while sprite != NULL:
+            if sprite.show:
+                if not self._damageBounds(sprite, &bounds):
+                    bounds = sprite._dst
+                g = -1
+                key.first = <size_t>sprite.texture
+                key.second = (<Uint32>sprite.r << 24) | (<Uint32>sprite.g << 16) | (<Uint32>sprite.b << 8) | sprite.a
+                bi = self.batchIndex.find(key)
+                if bi != self.batchIndex.end():
+                    g = deref(bi).second
+                    # Joining the group draws the sprite before the groups opened after it, none of them may overlap it
+                    for h in range(g+1, groups):
+                        if SDL_HasIntersection(&bounds, &self.batchBounds[0][h]):
+                            g = -1
+                            break
+                if g == -1:
+                    g = groups
+                    groups += 1
+                    if <size_t>groups > self.batches.size():
+                        self.batches.push_back(vector[Sprite_p]())
+                        self.batchBounds.push_back(bounds)
+                    else:
+                        self.batchBounds[0][g] = bounds
+                    self.batchIndex[0][key] = g
+                else:
+                    SDL_UnionRect(&self.batchBounds[0][g], &bounds, &merged)
+                    self.batchBounds[0][g] = merged
+                self.batches[0][g].push_back(sprite)
+            sprite = sprite.znext
+
+        for g in range(groups):
+            for i in range(self.batches[0][g].size()):
+                self._drawSprite(self.batches[0][g][i], 0, 0)
+            self.batches[0][g].clear()
+        self.batchIndex.clear()
+
+    property stats:
+        def __get__(self):
+            """ Rendering stats for the last frame """
+            return {'drawCalls': self.drawCalls, 'stateChanges': self.stateChanges, 'skippedStateChanges': self.skippedStateChanges, 'batching': self.batching,
+                    'dirtyRendering': self._dirtyRendering, 'damagedRects': self.damagedRects, 'frameDrawn': self._frameDrawn,
+                    'frameCache': self.frameCache.stats, 'blurCache': self.blurCache.stats, 'surfacePool': self.surfacePool.stats}
+
+    property dirtyRendering:
+        def __get__(self):
+            """ Redraw only the damaged parts of the screen into a persistent render target, and nothing at all if there's no damage """
+            return self._dirtyRendering
+        def __set__(self, value):
+            self.setDirtyRendering(value)
+
+    cpdef bint setDirtyRendering(self, bint enable):
+        """ Enable or disable dirty rectangle rendering, returns False if the renderer can't render to a texture """
+        cdef Sprite_p sprite
+        if enable == self._dirtyRendering:
+            return True
+
+        if enable:
+            if not self._createTarget():
+                error('Dirty rectangle rendering is not available, the %s renderer does not support render targets' % bytes(self.render_info.name))
+                return False
+            self._dirtyRendering = True
+        else:
+            self._dirtyRendering = False
+            if self.target != NULL:
+                SDL_DestroyTexture(self.target)
+                self.target = NULL
+            while not self.damageQueue.empty():
+                sprite = self.damageQueue.back()
+                sprite.damageQueued = False
+                self.damageQueue.pop_back()
+            self.damage.clear()
+        self._frameDrawn = True
+        return True
+
+    cdef bint _createTarget(self):
+        """ (Re)create the persistent render target at the screen size, it starts fully damaged """
+        if self.target != NULL:
+            SDL_DestroyTexture(self.target)
+            self.target = NULL
+        if not SDL_RenderTargetSupported(self.renderer):
+            return False
+        self.target = SDL_CreateTexture(self.renderer, SDL_PIXELFORMAT_ARGB8888, SDL_TEXTUREACCESS_TARGET, self._width, self._height)
+        if self.target == NULL:
+            error(SDL_GetError())
+            return False
+        self._damageAll = True
+        return True
+
+    cdef bint _damageBounds(self, Sprite_p sprite, SDL_Rect *bounds) nogil:
+        """ Screen area covered by a sprite as of its last processing, rotated sprites get a generous box. Returns False if it's not on screen """
+        cdef int extra
+        if sprite.free or not sprite.show:
+            return False
+        bounds[0] = sprite._dst
+        if sprite.angle != 0:
+            extra = bounds.w if bounds.w > bounds.h else bounds.h
+            bounds.x -= extra
+            bounds.y -= extra
+            bounds.w += extra * 2
+            bounds.h += extra * 2
+        return True
+
+    cdef void _damageMark(self, Sprite_p sprite) nogil:
+        """ Queue a sprite so both the area it covered and the one it will cover get redrawn """
+        if self._dirtyRendering and not sprite.damageQueued:
+            sprite.damageQueued = True
+            self.damageQueue.push_back(sprite)
+
+    cdef void _damageAdd(self, SDL_Rect *rect) nogil:
+        """ Add a screen area to the damage, merging it with the damaged areas it overlaps so nothing is drawn twice """
+        cdef SDL_Rect screen, area, merged
+        cdef size_t i = 0
+
+        if self._damageAll:
+            return
+        screen.x = screen.y = 0
+        screen.w = self._width
+        screen.h = self._height
+        if not SDL_IntersectRect(&screen, rect, &area):
+            return
+
+        while i < self.damage.size():
+            if SDL_HasIntersection(&area, &self.damage[0][i]):
+                SDL_UnionRect(&area, &self.damage[0][i], &merged)
+                area = merged
+                self.damage[0][i] = self.damage.back()
+                self.damage.pop_back()
+                # The area grew, it may overlap the ones already checked
+                i = 0
+            else:
+                i += 1
+
+        self.damage.push_back(area)
+        if self.damage.size() > MAX_DAMAGE_RECTS:
+            self._damageAll = True
+
+    cdef void _damageCollect(self, bint before) nogil:
+        """ Damage the areas queued sprites covered (before processing them) or cover now (after processing them) """
+        cdef Sprite_p sprite
+        cdef size_t i
+        cdef int n, numsprites
+
+        for i in range(self.damageQueue.size()):
+            sprite = self.damageQueue[0][i]
+            if sprite.free:
+                # Its area was damaged when it was removed
+                continue
+            if before:
+                if sprite.drawnValid:
+                    self._damageAdd(&sprite.drawn)
+            else:
+                sprite.damageQueued = False
+                sprite.drawnValid = self._damageBounds(sprite, &sprite.drawn)
+                if sprite.drawnValid:
+                    self._damageAdd(&sprite.drawn)
+
+        if not before:
+            self.damageQueue.clear()
+            if self._damageAll:
+                # Everything is redrawn, the areas of the sprites that didn't change may have moved too (scrolling, scaling)
+                numsprites = self.active_sprites.size()
+                for n in range(numsprites):
+                    sprite = &self.active_sprites.at(n)
+                    sprite.drawnValid = self._damageBounds(sprite, &sprite.drawn)
+
+    cdef bint _drawDamage(self):
+        """ Redraw the damaged areas into the render target, returns False if there was nothing to redraw """
+        cdef SDL_Rect area, clear, bounds
+        cdef zmap_iterator ziter, ziter_last
+        cdef Sprite_p sprite
+        cdef size_t i
+
+        if self._damageAll:
+            self.damage.clear()
+            area.x = area.y = 0
+            area.w = self._width
+            area.h = self._height
+            self.damage.push_back(area)
+            self._damageAll = False
+
+        self.damagedRects = self.damage.size()
+        if self.damage.empty():
+            return False
+
+        SDL_SetRenderTarget(self.renderer, self.target)
+        SDL_SetRenderDrawBlendMode(self.renderer, SDL_BLENDMODE_NONE)
+        SDL_SetRenderDrawColor(self.renderer, 0, 0, 0, 255)
+        for i in range(self.damage.size()):
+            # The viewport clips the drawing to the damaged area, coordinates inside it are relative to its origin
+            area = self.damage[0][i]
+            SDL_RenderSetViewport(self.renderer, &area)
+            clear.x = clear.y = 0
+            clear.w = area.w
+            clear.h = area.h
+            SDL_RenderFillRect(self.renderer, &clear)
+
+            ziter = self.zmap.begin()
+            ziter_last = self.zmap.end()
+            while ziter != ziter_last:
+                sprite = deref(ziter).second.head
+                while sprite != NULL:
+                    if self._damageBounds(sprite, &bounds) and SDL_HasIntersection(&area, &bounds):
+                        self._drawSprite(sprite, area.x, area.y)
+                    sprite = sprite.znext
+                inc (ziter)
+
+        SDL_RenderSetViewport(self.renderer, NULL)
+        SDL_SetRenderTarget(self.renderer, NULL)
+        self.damage.clear()
+        return True
+
     cdef bint _indexSprite(self, _Sprite* sprite):
+        """ Append the sprite at the end of its z level """
         cdef zmap_iterator ziter
+        cdef _ZLevel level
+        cdef _ZLevel *levelp
         ziter = self.zmap.find(sprite.z)
         if ziter == self.zmap.end():
-            self.zmap.insert(pair[int,deque[Sprite_p]](sprite.z,deque[Sprite_p]()))
+            level.head = level.tail = NULL
+            level.count = 0
+            self.zmap.insert(pair[int,_ZLevel](sprite.z,level))
             ziter = self.zmap.find(sprite.z)
-        deref(ziter).second.push_back(sprite)
+        # Map nodes are never moved around, so the level pointer stays valid
+        levelp = &deref(ziter).second
+        sprite.zlevel = levelp
+        sprite.zprev = levelp.tail
+        sprite.znext = NULL
+        if levelp.tail != NULL:
+            levelp.tail.znext = sprite
+        else:
+            levelp.head = sprite
+        levelp.tail = sprite
+        levelp.count += 1
+        sprite.seq = self.spriteSeq
+        self.spriteSeq += 1
         self.dirty = True
         return True
 
     cdef bint _unindexSprite(self, _Sprite *sprite):
-        cdef deque[Sprite_p] *ds
-        cdef deque_Sprite_iterator iter
-        cdef zmap_iterator ziter = self.zmap.find(sprite.z)
-        if ziter != self.zmap.end():
-            ds = &deref(ziter).second
-            iter = ds.begin()
-            while iter != ds.end():
-                if deref(iter) == sprite:
-                    ds.erase(iter)
-                    self.dirty = True
-                    return True
-                inc(iter)
-        return False
+        """ Unlink the sprite from its z level """
+        cdef _ZLevel *level = sprite.zlevel
+        if level == NULL:
+            return False
+        if sprite.zprev != NULL:
+            sprite.zprev.znext = sprite.znext
+        else:
+            level.head = sprite.znext
+        if sprite.znext != NULL:
+            sprite.znext.zprev = sprite.zprev
+        else:
+            level.tail = sprite.zprev
+        level.count -= 1
+        sprite.zlevel = NULL
+        sprite.zprev = sprite.znext = NULL
+        self.dirty = True
+        return True
 
     cdef _Sprite* _addSprite(self,  obj, bint interactive, Canvas canvas, int z, int sx, int sy, int sw, int sh, int dx, int dy, int dw, int dh, double angle, int centerx, int centery, int flip, float r, float g, float b, float a):
         cdef _Sprite sprite, *spritep
@@ -402,6 +730,12 @@ cdef class Renderer:
         sprite.interactive = interactive
         sprite.component = <PyObject*> obj
         Py_XINCREF(sprite.component)
+        sprite.zlevel = NULL
+        sprite.zprev = sprite.znext = NULL
+        sprite.drawnValid = sprite.damageQueued = False
+        sprite.hx0 = sprite.hy0 = 0
+        sprite.hx1 = sprite.hy1 = -1
+        sprite.hashDirty = False
 
 
         if self.free_sprites.size() > 0:
@@ -413,6 +747,10 @@ cdef class Renderer:
             spritep = &self.active_sprites.back()
 
         self._indexSprite(spritep)
+        self._textureIndex(spritep)
+        self._damageMark(spritep)
+        if interactive:
+            self._hashMark(spritep)
 
         return spritep
 
@@ -424,6 +762,11 @@ cdef class Renderer:
     cdef bint _removeSprite(self, _Sprite *sprite):
         cdef deque[_Sprite].iterator iter
         if self._unindexSprite(sprite):
+            self._hashRemove(sprite)
+            self._textureUnindex(sprite)
+            if sprite.drawnValid:
+                self._damageAdd(&sprite.drawn)
+                sprite.drawnValid = False
             Py_XDECREF(sprite.component)
             self.free_sprites.push_back(sprite)
             sprite.free = True
@@ -434,23 +777,13 @@ cdef class Renderer:
         return self._removeSprite(sprite)
 
     cdef bint _spriteZ(self, _Sprite *sprite, int z):
-        cdef deque[Sprite_p] *ds
-        cdef deque_Sprite_iterator iter
-        cdef zmap_iterator ziter = self.zmap.begin()
-
+        """ Move the sprite to the end of the z level """
+        self._damageMark(sprite)
+        if not self._unindexSprite(sprite):
+            sprite.z = z
+            return False
         sprite.z = z
-        while ziter != self.zmap.end():
-            ds = &deref(ziter).second
-            iter = ds.begin()
-            while iter != ds.end():
-                if deref(iter) == sprite:
-                    ds.erase(iter)
-                    self._indexSprite(sprite)
-                    self.dirty = True
-                    return True
-                inc(iter)
-            inc(ziter)
-        return False
+        return self._indexSprite(sprite)
 
     cpdef bint spriteZ(self, Sprite sprite_w, int z):
         cdef _Sprite *sprite = sprite_w.sprite
@@ -461,14 +794,20 @@ cdef class Renderer:
         return self._spriteSrc(sprite, x, y, w, h)
 
     cdef bint _spriteRot(self, _Sprite *sprite, double angle, int centerx, int centery, int flip) nogil:
+        if sprite.angle != angle or sprite.center.x != centerx or sprite.center.y != centery or sprite.flip != flip:
+            self._damageMark(sprite)
         sprite.angle = angle
         sprite.center.x = centerx
         sprite.center.y = centery
         sprite.flip = <SDL_RendererFlip>flip
         sprite.dirty = True
+        if sprite.interactive:
+            self._hashMark(sprite)
         return True
 
     cdef bint _spriteColor(self, _Sprite *sprite, Uint8 r, Uint8 g, Uint8 b, Uint8 a) nogil:
+        if sprite.r != r or sprite.g != g or sprite.b != b or sprite.a != a:
+            self._damageMark(sprite)
         sprite.r = r
         sprite.g = g
         sprite.b = b
@@ -476,6 +815,8 @@ cdef class Renderer:
         return True
 
     cdef bint _spriteSrc(self, _Sprite *sprite, int x, int y, int w, int h):
+        if sprite.src.x != x or sprite.src.y != y or sprite.src.w != w or sprite.src.h != h:
+            self._damageMark(sprite)
         sprite.src.x = x
         sprite.src.y = y
         sprite.src.w = w
@@ -484,15 +825,35 @@ cdef class Renderer:
         return True
 
     cdef bint _spriteDst(self, _Sprite *sprite, int x, int y, int w, int h) nogil:
+        if sprite.dst.x != x or sprite.dst.y != y or sprite.dst.w != w or sprite.dst.h != h:
+            self._damageMark(sprite)
         sprite.dst.x = x
         sprite.dst.y = y
         sprite.dst.w = w
         sprite.dst.h = h
         sprite.dirty = True
+        if sprite.interactive:
+            self._hashMark(sprite)
         return True
 
     cdef bint _spriteInteractive(self, _Sprite *sprite, bint interactive) nogil:
         sprite.interactive = interactive
+        self._hashMark(sprite)
+        return True
+
+    cdef bint _spriteDamage(self, _Sprite *sprite) nogil:
+        """ The sprite contents changed in place (ie, its canvas was drawn on), redraw it """
+        self._damageMark(sprite)
+        return True
+
+    cdef bint _spriteTexture(self, _Sprite *sprite, SDL_Texture *texture) nogil:
+        """ Point a single sprite to a different texture of the same size (ie, a cached animation frame) """
+        if sprite.texture == texture:
+            return False
+        self._textureUnindex(sprite)
+        sprite.texture = texture
+        self._textureIndex(sprite)
+        self._damageMark(sprite)
         return True
 
     cpdef bint spriteDst(self, Sprite sprite_w, int x, int y, int w, int h):
@@ -531,14 +892,73 @@ cdef class Renderer:
         cdef _Sprite *sprite = sprite_w.sprite
         return self._spriteInteractive(sprite, interactive)
 
+    cpdef bint spriteDamage(self, Sprite sprite_w):
+        cdef _Sprite *sprite = sprite_w.sprite
+        return self._spriteDamage(sprite)
+
     cdef void updateTexture(self, SDL_Texture *oldt, SDL_Texture *newt) nogil:
-        cdef int i, numsprites = self.active_sprites.size()
+        """ Point the sprites using oldt to newt """
+        cdef texture_iterator olditer, newiter
+        cdef vector[Sprite_p] *oldsprites
+        cdef vector[Sprite_p] *newsprites
         cdef Sprite_p sprite
+        cdef size_t i
 
-        for i in prange(numsprites, nogil=True):
-            sprite = &self.active_sprites.at(i)
-            if sprite.texture == oldt:
-                sprite.texture = newt
+        if oldt == newt:
+            return
+        olditer = self.textureSprites.find(oldt)
+        if olditer == self.textureSprites.end():
+            return
+
+        newiter = self.textureSprites.find(newt)
+        if newiter == self.textureSprites.end():
+            self.textureSprites.insert(pair[Texture_p, vector[Sprite_p]](newt, vector[Sprite_p]()))
+            newiter = self.textureSprites.find(newt)
+
+        oldsprites = &deref(olditer).second
+        newsprites = &deref(newiter).second
+        for i in range(oldsprites.size()):
+            sprite = oldsprites[0][i]
+            sprite.texture = newt
+            self._damageMark(sprite)
+            newsprites.push_back(sprite)
+        self.textureSprites.erase(olditer)
+
+    cdef void textureDamage(self, SDL_Texture *texture) nogil:
+        """ The texture contents were redrawn in place, redraw the sprites using it """
+        cdef texture_iterator titer = self.textureSprites.find(texture)
+        cdef vector[Sprite_p] *sprites
+        cdef size_t i
+
+        if titer == self.textureSprites.end():
+            return
+        sprites = &deref(titer).second
+        for i in range(sprites.size()):
+            self._damageMark(sprites[0][i])
+
+    cdef void _textureIndex(self, Sprite_p sprite) nogil:
+        """ File the sprite under its texture """
+        cdef texture_iterator titer = self.textureSprites.find(sprite.texture)
+        if titer == self.textureSprites.end():
+            self.textureSprites.insert(pair[Texture_p, vector[Sprite_p]](sprite.texture, vector[Sprite_p]()))
+            titer = self.textureSprites.find(sprite.texture)
+        deref(titer).second.push_back(sprite)
+
+    cdef void _textureUnindex(self, Sprite_p sprite) nogil:
+        """ Remove the sprite from its texture users, order among them doesn't matter """
+        cdef vector[Sprite_p] *sprites
+        cdef size_t i
+        cdef texture_iterator titer = self.textureSprites.find(sprite.texture)
+        if titer == self.textureSprites.end():
+            return
+        sprites = &deref(titer).second
+        for i in range(sprites.size()):
+            if sprites[0][i] == sprite:
+                sprites[0][i] = sprites.back()
+                sprites.pop_back()
+                break
+        if sprites.empty():
+            self.textureSprites.erase(titer)
 
     property screenSize:
         def __get__(self):
@@ -621,6 +1041,7 @@ cdef class Renderer:
     cpdef _calculateScale(self, double scene_w, double scene_h, int screen_w, int screen_h, bint keep_aspect=1):
         cdef double sx, sy
         self.dirty = True
+        self._damageAll = True
         if scene_w > 0.0 and scene_h > 0.0:
             sx = <double>screen_w/scene_w
             sy = <double>screen_h/scene_h
@@ -645,6 +1066,8 @@ cdef class Renderer:
         debug('windowResized: new window size is %d x %d' % (self._width, self._height))
 
         if screen_w != self._width or screen_h != self._height:
+            if self._dirtyRendering and not self._createTarget():
+                self.setDirtyRendering(False)
             new_sx = <int>(self._scroll_x * self._width/screen_w if screen_w != 0 else 0)
             new_sy = <int>(self._scroll_y * self._height/screen_h if screen_h != 0 else 0)
             # Adjust scaling
@@ -685,6 +1108,7 @@ cdef class Renderer:
 
         if self._scroll_x != sx or self._scroll_y != sy:
             self.dirty = True
+            self._damageAll = True
             #print "SCROLL", sx, sy
             self._scroll_x = sx
             self._scroll_y = sy
@@ -718,6 +1142,7 @@ cdef class Renderer:
         self._scale_x = scale_x
         self._scale_y = scale_y
         self.dirty = True
+        self._damageAll = True
 
         #print "SCALE", self._scale_x,self._scale_y
         # Adjust scrolling if needed
@@ -730,6 +1155,10 @@ cdef class Renderer:
         cdef int i, numsprites
         cdef deque[_Sprite].iterator iter, iter_end
 
+        # Frames composed for the previous scene are unlikely to be shown again
+        self.frameCache.clear()
+        self.blurCache.clear()
+
         if self.active_sprites.size() == self.free_sprites.size():
             # All active sprites are freed, so we can modify pointers at will
             iter = self.active_sprites.begin()
@@ -753,8 +1182,23 @@ cdef class Renderer:
             del self.active_sprites
             del self.free_sprites
             del self.zmap
+            del self.batches
+            del self.batchBounds
+            del self.batchIndex
+            del self.spatialHash
+            del self.hashMoved
+            del self.hashCandidates
+            del self.textureSprites
+            del self.damage
+            del self.damageQueue
+            self.frameCache.free()
+            self.blurCache.free()
+            self.surfacePool.free()
 
             debug('Releasing SDL renderer')
+            if self.target != NULL:
+                SDL_DestroyTexture(self.target)
+                self.target = NULL
             if self.renderer != NULL:
                 SDL_DestroyRenderer(self.renderer)
                 self.renderer = NULL
@@ -801,10 +1245,17 @@ cdef class Renderer:
 
     cdef flip(self):
         """ Show the contents of the window in a coordinated manner"""
+        if self._dirtyRendering and not self._frameDrawn:
+            # Nothing changed, what's on screen is still valid
+            if self.profiler is not None:
+                self.profiler.mark(PROFILE_PRESENT)
+            return
         SDL_RenderPresent(self.renderer)
         if self._doublebuffered:
             SDL_SetRenderDrawColor(self.renderer, 0, 0, 0, 255);
             SDL_RenderClear(self.renderer);
+        if self.profiler is not None:
+            self.profiler.mark(PROFILE_PRESENT)
 
 
     cpdef isVisible(self):
@@ -814,25 +1265,157 @@ cdef class Renderer:
         return False
 
 
+    cdef void _hashBounds(self, Sprite_p sprite, SDL_Rect *bounds) nogil:
+        """ Scene space bounding box used for hashing and hit testing, rotated sprites get the same generous box _processSprite uses """
+        cdef int extra
+        bounds[0] = sprite.dst
+        if sprite.angle != 0:
+            extra = bounds.w if bounds.w > bounds.h else bounds.h
+            bounds.x -= extra
+            bounds.y -= extra
+            bounds.w += extra * 2
+            bounds.h += extra * 2
+
+    cdef void _hashMark(self, Sprite_p sprite) nogil:
+        """ Queue a sprite to have its cells refreshed before the next hit test """
+        if not sprite.hashDirty:
+            sprite.hashDirty = True
+            self.hashMoved.push_back(sprite)
+
+    cdef void _hashInsert(self, Sprite_p sprite) nogil:
+        cdef SDL_Rect bounds
+        cdef int cx, cy
+        cdef Uint64 key
+        cdef hash_iterator hiter
+
+        self._hashBounds(sprite, &bounds)
+        sprite.hx0 = _hashCell(bounds.x, self.hashCellSize)
+        sprite.hy0 = _hashCell(bounds.y, self.hashCellSize)
+        sprite.hx1 = _hashCell(bounds.x + bounds.w - 1, self.hashCellSize)
+        sprite.hy1 = _hashCell(bounds.y + bounds.h - 1, self.hashCellSize)
+        for cx in range(sprite.hx0, sprite.hx1+1):
+            for cy in range(sprite.hy0, sprite.hy1+1):
+                key = _hashKey(cx, cy)
+                hiter = self.spatialHash.find(key)
+                if hiter == self.spatialHash.end():
+                    self.spatialHash.insert(pair[Uint64, vector[Sprite_p]](key, vector[Sprite_p]()))
+                    hiter = self.spatialHash.find(key)
+                deref(hiter).second.push_back(sprite)
+
+    cdef void _hashRemove(self, Sprite_p sprite) nogil:
+        cdef int cx, cy
+        cdef size_t i
+        cdef vector[Sprite_p] *cell
+        cdef hash_iterator hiter
+
+        for cx in range(sprite.hx0, sprite.hx1+1):
+            for cy in range(sprite.hy0, sprite.hy1+1):
+                hiter = self.spatialHash.find(_hashKey(cx, cy))
+                if hiter != self.spatialHash.end():
+                    cell = &deref(hiter).second
+                    for i in range(cell.size()):
+                        if cell[0][i] == sprite:
+                            # Order inside a cell doesn't matter, queries sort by z
+                            cell[0][i] = cell.back()
+                            cell.pop_back()
+                            break
+                    if cell.empty():
+                        self.spatialHash.erase(hiter)
+        sprite.hx0 = sprite.hy0 = 0
+        sprite.hx1 = sprite.hy1 = -1
+
+    cdef void _hashFlush(self) nogil:
+        """ Refile the sprites that moved (or changed interactivity) since the last hit test """
+        cdef Sprite_p sprite
+        cdef SDL_Rect bounds
+
+        while not self.hashMoved.empty():
+            sprite = self.hashMoved.front()
+            self.hashMoved.pop_front()
+            if not sprite.hashDirty:
+                continue
+            sprite.hashDirty = False
+            if sprite.interactive and not sprite.free:
+                self._hashBounds(sprite, &bounds)
+                if sprite.hx1 >= sprite.hx0 and \
+                    sprite.hx0 == _hashCell(bounds.x, self.hashCellSize) and sprite.hx1 == _hashCell(bounds.x + bounds.w - 1, self.hashCellSize) and \
+                    sprite.hy0 == _hashCell(bounds.y, self.hashCellSize) and sprite.hy1 == _hashCell(bounds.y + bounds.h - 1, self.hashCellSize):
+                    # Still in the same cells
+                    continue
+                self._hashRemove(sprite)
+                self._hashInsert(sprite)
+            else:
+                self._hashRemove(sprite)
+
+    cdef int _hashQuery(self, double x, double y) nogil:
+        """ Fill hashCandidates with the interactive sprites whose box contains x,y, in the order processEvent would visit them """
+        cdef hash_iterator hiter
+        cdef vector[Sprite_p] *cell
+        cdef Sprite_p sprite, other
+        cdef SDL_Rect bounds
+        cdef size_t i
+        cdef int j
+
+        self._hashFlush()
+        self.hashCandidates.clear()
+        hiter = self.spatialHash.find(_hashKey(_hashCell(<int>x, self.hashCellSize), _hashCell(<int>y, self.hashCellSize)))
+        if hiter == self.spatialHash.end():
+            return 0
+
+        cell = &deref(hiter).second
+        for i in range(cell.size()):
+            sprite = cell[0][i]
+            self._hashBounds(sprite, &bounds)
+            if x >= bounds.x and x < bounds.x + bounds.w and y >= bounds.y and y < bounds.y + bounds.h:
+                # Insertion sort by z, then by order inside the z level. Candidates lists are short
+                self.hashCandidates.push_back(sprite)
+                j = self.hashCandidates.size() - 1
+                while j > 0:
+                    other = self.hashCandidates[0][j-1]
+                    if other.z < sprite.z or (other.z == sprite.z and other.seq < sprite.seq):
+                        break
+                    self.hashCandidates[0][j] = other
+                    j -= 1
+                self.hashCandidates[0][j] = sprite
+
+        return self.hashCandidates.size()
+
     cdef processEvent(self, EventType action, int x, int y):
         cdef zmap_iterator ziter, ziter_last
-        cdef deque[Sprite_p] *ds
-        cdef deque[Sprite_p].iterator iter, iter_last
-        cdef Sprite_p sprite
+        cdef Sprite_p sprite, nextSprite
         cdef bint continuePropagation = True, captureEvent = False
         cdef object captor = None
         cdef bint ethereal = action > EVENT_TOUCH_LAST
+        cdef vector[Sprite_p] candidates
+        cdef size_t i
 
         cdef PointD scenePoint = self._screenToScene(x,y)
 
+        if self.spatialHashing and not ethereal:
+            # Only the interactive sprites under the point get a chance to handle the event
+            self._hashQuery(scenePoint.x, scenePoint.y)
+            # Copy them, the event handlers may add or remove sprites
+            candidates = self.hashCandidates[0]
+            for i in range(candidates.size()):
+                sprite = candidates[i]
+                if sprite.free or not sprite.interactive:
+                    continue
+                entity = <object>sprite.component
+                continuePropagation, captureEvent = entity.event(action, scenePoint.x, scenePoint.y)
+                if captureEvent:
+                    captor = entity
+                    break
+                if not continuePropagation:
+                    break
+            return continuePropagation, captureEvent, captor
+
         ziter = self.zmap.begin()
         ziter_last = self.zmap.end()
         while ziter != ziter_last:
-            ds = &deref(ziter).second
-            iter = ds.begin()
-            iter_last = ds.end()
-            while iter != iter_last:
-                sprite = deref(iter)
+            sprite = deref(ziter).second.head
+            while sprite != NULL:
+                # Grab the next one first, the handler may move this sprite to another z level
+                nextSprite = sprite.znext
                 if sprite.interactive or ethereal:
                     entity = <object>sprite.component
                     continuePropagation, captureEvent = entity.event(action, scenePoint.x, scenePoint.y)
@@ -842,31 +1425,22 @@ cdef class Renderer:
                             break
                         if not continuePropagation:
                             break
-                inc(iter)
+                sprite = nextSprite
             inc (ziter)
 
         return continuePropagation or ethereal, captureEvent and not ethereal, captor
 
-    cdef bint captureScreenJPEG(self, unsigned char **jpegBuffer, unsigned long *jpegSize) nogil:
-        """ Capture the screen and compress it with jpeg """
-        #if BIG_ENDIAN
-        cdef SDL_Surface *surface = SDL_CreateRGBSurface(0, self._width, self._height, 32, 0xFF000000, 0x00FF0000, 0x0000FF00, 0x000000FF)
-        #else
-        cdef SDL_Surface *surface = SDL_CreateRGBSurface(0, self._width, self._height, 32, 0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000 )
-        #endif
-
-        if surface:
-            if SDL_RenderReadPixels(self.renderer, NULL, surface.format.format, surface.pixels, surface.pitch) == 0:
-                if tjCompress2(self.tjh, <unsigned char *>surface.pixels, self._width, surface.pitch, self._height, TJPF_RGBA, jpegBuffer, jpegSize, TJSAMP_444, 100, 0) == 0:
-                    SDL_FreeSurface(surface)
-                    return True
-            SDL_FreeSurface(surface)
-
-        return False
-
-    cdef bint releaseCapturedScreenBufferJPEG(self, unsigned char *jpegBuffer) nogil:
-        tjFree(jpegBuffer)
-        return True
+    cdef bint readScreen(self, SDL_Surface *surface) nogil:
+        """ Read the screen pixels into a surface of the same size """
+        cdef int read
+        if self._dirtyRendering:
+            # The screen may not have been redrawn this frame, the render target always holds the scene
+            SDL_SetRenderTarget(self.renderer, self.target)
+            read = SDL_RenderReadPixels(self.renderer, NULL, surface.format.format, surface.pixels, surface.pitch)
+            SDL_SetRenderTarget(self.renderer, NULL)
+        else:
+            read = SDL_RenderReadPixels(self.renderer, NULL, surface.format.format, surface.pixels, surface.pitch)
+        return read == 0
 
     cdef bint _renderWalkAreas(self):
         cdef _Scene scene
@@ -936,146 +1510,3 @@ cdef class Renderer:
             else:
                 inc(walkAreasIt)
                 wav2 = wav1
-
-
-
-
-#OLD UPDATE ROUTINE THAT's DIRTY RECT BASED. KEPT HERE FOR FUTURE GENERATIONS ENJOYMENT ¿?
-#    cpdef update(self):
-#    """ Update the screen by rendering the entities that intersect the dirty rectangles """
-#    cdef Rect nr, ir, r
-#    cdef int z
-#
-#    if self.frameTimestamp == 0.0:
-#    raise Exception ('You have to call preUpdate before calling update')
-#
-#    if self._target.isDoubleBuffered:
-#    # Double buffered systems force us to draw all the screen in every frame as there's no delta updating possible.
-#    self.dirtyAll()
-#
-#    # In the following, screen coordinates refers to a set of coordinates that start in 0,0 and go to (screen width-1, screen height-1)
-#    # Scene coordinates are the logical entity coordinates, which relate to the screen via scale and scroll modifiers.
-#    # What we do here is basically put everything in scene coordinates first, see what we have to render, then move those rectangles back to screen coordinates to render them.
-#
-#    # Let's start building a rectangle that holds the part of the scene we want to show
-#    # screen is the rectangle that holds the piece of scene that we will show. We still have to apply scaling to it.
-#    screen_w = self._width
-#    screen_h = self._height
-#    screen = Rect((self._scroll_x, self._scroll_y, screen_w, screen_h))
-#
-#    rects = []
-#
-#    # Apply the overall scale setting if needed.
-#    if self._scale_x != 1.0 or self._scale_y != 1.0:
-#    doScale = True
-#    # Convert screen coordinates to unscaled absolute coordinates
-#    screen.scale(1.0/self._scale_x, 1.0/self._scale_y)
-#    else:
-#    doScale = False
-#
-#    # At this point, screen contains the rectangle in scene coordinates that we will show, everything that falls inside it gets on the screen.
-#    # Now we get all the dirty rectangles reported by the entities, and we determine which ones intersect with the screen, discarding everything else.
-#    if self.dirtyRects != None:
-#    for dr in self.dirtyRects:
-#    # dr is in scene coordinates
-#    # Intersect the rect with the screen rectangle in scene coordinates
-#    ir = screen.intersection(Rect(dr))
-#    if ir != None:
-#    # There's some intersection, append it to the list of rectangles to be rendered.
-#    rects.append(ir)
-#    else:
-#    # Set all the screen as dirty
-#    rects.append(screen)
-#
-#    gilbert = Gilbert()
-#    # Get a list of the z index of the entities in the scenes, we will traverse it in increasing order
-#    zindexs = gilbert.entitiesByZ.keys()
-#    if len(zindexs) >0:
-#    zindexs.sort()
-#
-#    # Iterate over the dirty rects that fall on the viewable area and draw them
-#    for r in rects:
-#    #print "DIRTY RECTANGLE:", r
-#    # r is in scene coordinates, already intersected with the scaled & scrolled screen rectangle
-#    for z in zindexs:
-#    for entity in gilbert.entitiesByZ[z]:
-#    # Intersect the entity rectangle with the dirty rectangle
-#    # nr is in scene coordinates
-#    nr = Rect(entity.getRect())
-#    #print entity.id, 'nr: ', nr, 'r:', r
-#    # ir is the intersection, in scene coordinates
-#    ir = r.intersection(nr)
-#    #print "Intersect r ", r, " with nr ", nr, " results in ", ir
-#    if ir != None:
-#    # There's an intersection, go over the entity areas, and see what parts of those fall inside the intersected rect.
-#    # This areas is what we end up rendering.
-#    nx, ny = entity.position
-#    for a in entity.getFrameAreas():
-#    # a is a frame area, it's format is [sx, sy, dx, dy, w, h]
-#    # sx,sy -> coordinates in the atlas
-#    # dx,dy -> entity coordinates where to put this
-#    # w,h -> size of the rectangle to blit
-#    sx,sy,dx,dy,w,h = a
-#
-#
-#    # Create nr, a rectangle with the destination location in scene coordinates  (scene coords = entity coords+entity position)
-#    nr = Rect((dx+nx, dy+ny, w, h))
-#
-#    #print entity.id, ' r:', r, ' nr :', nr, 'Frame Area:', sx,sy,dx,dy,w,h
-#
-#    ir = r.intersection(nr)
-#    if ir != None:
-#    # ir is now the intersection of the frame area (moved to the proper location in the scene) with the dirty rectangle, in scene coordinates
-#    src_r = ir.copy()
-#    dst_r = ir.copy()
-#
-#    # src_r is in scene coordinates, created by intersecting the destination rectangle with the dirty rectangle in scene coordinates
-#    # We need to move it to the proper position on the source canvas
-#    # We adjust it to entity coordinates by substracting the entity position
-#    # Then, we substract the dx,dy coordinates (as they were used to construct nr and we don't need those)
-#    # Finally we add sx,sy to put the rectangle in the correct position in the canvas
-#    # This operations as completed in one step, and we end up with a source rectangle properly intersected with r, in source canvas coordinates
-#    src_r.move(sx-nx-dx, sy-ny-dy)
-#
-#    # dst_r is in scene coordinates, we will adjust it to screen coordinates
-#    # Now we apply the scale factor
-#    if doScale:
-#    #Scale the dst_r values
-#    dst_r.scale(self._scale_x, self._scale_y)
-#
-#    # Apply scrolling
-#    dst_r.move(-self._scroll_x, -self._scroll_y)
-#
-#    # Perform the blitting if the src and dst rectangles have w,h > 0
-#    if src_r.width > 0 and src_r.height >0 and dst_r.width>0 and dst_r.height > 0:
-#    if entity.center == None:
-#    self._target.blitCanvas(entity.canvas, dst_r.left, dst_r.top, dst_r.width, dst_r.height, src_r.left, src_r.top, src_r.width, src_r.height, entity.angle, False, 0, 0, (1 if entity.fliph else 0) + (2 if entity.flipv else 0) )
-#    else:
-#    self._target.blitCanvas(entity.canvas, dst_r.left, dst_r.top, dst_r.width, dst_r.height, src_r.left, src_r.top, src_r.width, src_r.height, entity.angle, True, entity.center[0], entity.center[1], (1 if entity.fliph else 0) + (2 if entity.flipv else 0))
-#    #raw_input("Press Enter to continue...")
-#    self._target.flip()
-#    self.dirtyNone()
-#    # Calculate how long it's been since the pre update until now.
-#    self.frameLapse = getTime() - self.frameTimestamp
-#    self.frameTimestamp = 0.0
-#
-#   def reset(self):
-#            """ Reset the renderer, mark everything as clean """
-#        self.dirtyNone()
-#
-#   cpdef dirty(self, int x, int y, int w, int h):
-#        """ Mark the area that starts at x,y with size w,h as dirty """
-#        if self.dirtyRects != None:
-#            self.dirtyRects.append((x,y,w,h))
-#
-#   def dirtyAll(self):
-#        """ Dirty up all the screen """
-#        self.dirtyRects = None
-#
-#   def dirtyNone(self):
-#        """ Remove all dirty rectangles """
-#        self.dirtyRects = []
-#    property needsRects:
-#        def __get__(self):
-#            """ Answer whether dirty rectangles are needed or discarded (due to double buffering for example) """
-#            return not self._target.isDoubleBuffered
@@ -359,10 +359,14 @@ cdef extern from "SDL.h":
     cdef int SDL_RenderCopyEx(SDL_Renderer * renderer, SDL_Texture * texture, SDL_Rect * srcrect, SDL_Rect * dstrect, double angle, SDL_Point *center, SDL_RendererFlip flip)
     cdef void SDL_RenderPresent(SDL_Renderer * renderer)
     cdef SDL_bool SDL_RenderTargetSupported(SDL_Renderer *renderer)
-    cdef int SDL_SetRenderTarget(SDL_Renderer *renderer, SDL_Texture *texture)
+    cdef int SDL_SetRenderTarget(SDL_Renderer *renderer, SDL_Texture *texture) nogil
+    cdef SDL_Texture * SDL_GetRenderTarget(SDL_Renderer *renderer) nogil
     cdef void SDL_DestroyTexture(SDL_Texture * texture)
     cdef void SDL_FreeSurface(SDL_Surface * surface) nogil
     cdef int SDL_UpperBlit (SDL_Surface * src, SDL_Rect * srcrect, SDL_Surface * dst, SDL_Rect * dstrect)
+    cdef int SDL_SetSurfaceBlendMode(SDL_Surface * surface, SDL_BlendMode blendMode)
+    cdef int SDL_GetSurfaceBlendMode(SDL_Surface * surface, SDL_BlendMode *blendMode)
+    cdef int SDL_UpdateTexture(SDL_Texture * texture, SDL_Rect * rect, void *pixels, int pitch)
     cdef int SDL_LockTexture(SDL_Texture * texture, SDL_Rect * rect, void **pixels, int *pitch)
     cdef void SDL_UnlockTexture(SDL_Texture * texture)
     cdef void SDL_GetWindowSize(SDL_Window * window, int *w, int *h)
@@ -382,7 +386,7 @@ cdef extern from "SDL.h":
     cdef int SDL_PollEvent(SDL_Event * event)
     cdef SDL_RWops * SDL_RWFromFile(char *file, char *mode)
     cdef SDL_RWops * SDL_RWFromMem(void *mem, int size)
-    cdef SDL_RWops * SDL_RWFromConstMem(void *mem, int size)
+    cdef SDL_RWops * SDL_RWFromConstMem(void *mem, int size) nogil
     cdef void SDL_FreeRW(SDL_RWops *area)
     cdef int SDL_GetRendererInfo(SDL_Renderer *renderer, SDL_RendererInfo *info)
     cdef int SDL_RenderSetViewport(SDL_Renderer * renderer, SDL_Rect * rect)
@@ -402,6 +406,8 @@ cdef extern from "SDL.h":
     cdef void SDL_UnionRect(SDL_Rect * A, SDL_Rect * B, SDL_Rect * result) nogil
     cdef Uint64 SDL_GetPerformanceCounter() nogil
     cdef Uint64 SDL_GetPerformanceFrequency() nogil
+    cdef Uint16 SDL_SwapLE16(Uint16 x) nogil
+    cdef Uint32 SDL_SwapLE32(Uint32 x) nogil
     cdef int SDL_GL_SetAttribute(SDL_GLattr attr, int value)
     cdef int SDL_GetNumRenderDrivers()
     cdef int SDL_GetRenderDriverInfo(int index, SDL_RendererInfo* info)
@@ -410,6 +416,7 @@ cdef extern from "SDL.h":
     cdef int SDL_RenderReadPixels(SDL_Renderer * renderer, SDL_Rect * rect, Uint32 format, void *pixels, int pitch) nogil
     cdef int SDL_PushEvent(SDL_Event * event) nogil
     cdef int SDL_RenderDrawLine(SDL_Renderer* renderer, int x1, int y1, int x2, int y2) nogil
+    cdef int SDL_RenderFillRect(SDL_Renderer * renderer, SDL_Rect * rect)
     cdef int SDL_SetRenderDrawColor(SDL_Renderer* renderer, Uint8 r, Uint8 g, Uint8 b, Uint8 a)
     cdef int SDL_SetRenderDrawBlendMode(SDL_Renderer* renderer, SDL_BlendMode blendMode)
 
@@ -431,8 +438,8 @@ cdef extern from "SDL.h":
     Uint16 AUDIO_F32	#AUDIO_F32LSB
 
 cdef extern from "SDL_image.h":
-    cdef SDL_Surface *IMG_Load(char *file)
-    cdef SDL_Surface *IMG_Load_RW(SDL_RWops *src, int freesrc)
+    cdef SDL_Surface *IMG_Load(char *file) nogil
+    cdef SDL_Surface *IMG_Load_RW(SDL_RWops *src, int freesrc) nogil
     cdef SDL_Surface *IMG_LoadTyped_RW(SDL_RWops *src, int freesrc, char *type)
 
 cdef extern from "SDL_ttf.h":
@@ -798,6 +805,7 @@ cdef extern from "turbojpeg.h":
 
     cdef int tjCompress2(tjhandle handle, unsigned char *srcBuf, int width, int pitch, int height, int pixelFormat, unsigned char **jpegBuf, unsigned long *jpegSize, int jpegSubsamp, int jpegQual, int flags) nogil
     cdef void tjFree(unsigned char *buffer) nogil
+    cdef int tjDestroy(tjhandle handle) nogil
 
 
 ctypedef enum SDL_USER_EVENT_CODES:
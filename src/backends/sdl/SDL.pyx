@@ -45,24 +45,25 @@ cpdef delay(Uint32 ms):
     SDL_Delay(ms)
 
 cpdef str readFile(str name):
-    cdef bytes contents = bytes()
+    """ Read a whole file (binary safe), None if it can't be opened """
+    cdef list chunks = []
     cdef bytes filename = <bytes>name
-    cdef SDL_RWops *ctx = SDL_RWFromFile(filename, 'r')
+    cdef SDL_RWops *ctx = SDL_RWFromFile(filename, 'rb')
     cdef char *buf
     cdef size_t bytesread
     if ctx != NULL:
-        buf = <char*>malloc(1025)
+        buf = <char*>malloc(65536)
         if buf == NULL:
             error("Could not allocate memory for temp buffer to read file!")
+            ctx.close(ctx)
             return None
 
-        bytesread = ctx.read(ctx, buf, 1, 1024)
+        bytesread = ctx.read(ctx, buf, 1, 65536)
         while bytesread > 0:
-            buf[bytesread] = 0
-            contents += buf
-            bytesread = ctx.read(ctx, buf, 1, 1024)
+            chunks.append(buf[:bytesread])
+            bytesread = ctx.read(ctx, buf, 1, 65536)
 
         ctx.close(ctx)
         free(buf)
-        return str(contents)
+        return ''.join(chunks)
     return None
@@ -7,6 +7,7 @@
 # Sound components - SDL_mixer based
 
 from ignifuga.backends.sdl.SDL cimport *
+from ignifuga.backends.sdl.AssetPack cimport AssetPack
 from cpython cimport *
 from libcpp.map cimport *
 
@@ -16,14 +17,20 @@ cdef public void MusicFinishedCallback( ) with gil
 
 cdef class MixChunk:
     cdef bytes _srcURL, embedded_data
+    cdef AssetPack _pack
     cdef Mix_Chunk *chunk
+    # Lazy chunks are decoded when they are first played
+    cdef readonly bint lazy
 
     cpdef load(self)
+    cpdef bint decode(self)
     cpdef reload(self, url)
     cdef free(self)
 
 cdef class MixMusic:
     cdef bytes _srcURL, embedded_data
+    # Music streams from the pack while it plays
+    cdef AssetPack _pack
     cdef Mix_Music *music
 
     cpdef load(self)
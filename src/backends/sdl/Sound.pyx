@@ -59,8 +59,10 @@ cdef initializeSound():
 
 
 cdef class MixChunk:
-    def __init__ (self, srcURL = None, embedded=None):
-
+    def __init__ (self, srcURL = None, embedded=None, AssetPack pack=None, bint lazy=False):
+        """ lazy = True -> Don't decode the audio until it's played (or decode is called), for big chunks that may never play """
+        self._pack = pack
+        self.lazy = lazy
         if srcURL is not None:
             self._srcURL = bytes(srcURL)
         else:
@@ -73,11 +75,23 @@ cdef class MixChunk:
         self.load()
 
     cpdef load(self):
+        self.free()
+        if not self.lazy:
+            self.decode()
+
+    cpdef bint decode(self):
+        """ Decode the audio if it isn't already, returns False if it can't be decoded """
         cdef char *bindata
         cdef int src_len
-        self.free()
+        cdef SDL_RWops *rwops
+        if self.chunk != NULL:
+            return True
         if self._srcURL is not None or self.embedded_data is not None:
-            if self._srcURL is not None:
+            if self._pack is not None:
+                rwops = self._pack.open(self._srcURL)
+                if rwops != NULL:
+                    self.chunk = Mix_LoadWAV_RW(rwops, 1)
+            elif self._srcURL is not None:
                 self.chunk = Mix_LoadWAV(self._srcURL)
             elif self.embedded_data is not None:
                 src_len = len(self.embedded_data)
@@ -88,10 +102,13 @@ cdef class MixChunk:
 
         if self.chunk == NULL:
             error("Error loading audio chunk (%s - %s)" % (self._srcURL, self.embedded_data))
+            return False
+        return True
 
     cpdef reload(self, url):
         cdef Mix_Chunk * oldchunk = self.chunk
         self.free()
+        self._pack = None
         self._srcURL = bytes(url)
         self.load()
         if oldchunk != NULL and self.chunk != NULL and self.chunk != oldchunk:
@@ -103,12 +120,18 @@ cdef class MixChunk:
             Mix_FreeChunk(self.chunk)
             self.chunk = NULL
 
+    property size:
+        def __get__(self):
+            """ Bytes of decoded audio (none for lazy chunks until they are played) """
+            return self.chunk.alen if self.chunk != NULL else 0
+
     def __dealloc__(self):
         self.free()
 
 cdef class MixMusic:
-    def __init__ (self, srcURL = None, embedded=None):
-
+    """ Music isn't decoded up front, SDL_mixer decodes it incrementally from its source (file, pack or embedded data) while it plays """
+    def __init__ (self, srcURL = None, embedded=None, AssetPack pack=None):
+        self._pack = pack
         if srcURL is not None:
             self._srcURL = bytes(srcURL)
         else:
@@ -124,9 +147,14 @@ cdef class MixMusic:
     cpdef load(self):
         cdef char *bindata
         cdef int src_len
+        cdef SDL_RWops *rwops
         self.free()
         if self._srcURL is not None or self.embedded_data is not None:
-            if self._srcURL is not None:
+            if self._pack is not None:
+                rwops = self._pack.open(self._srcURL)
+                if rwops != NULL:
+                    self.music = Mix_LoadMUSType_RW(rwops, MUS_NONE, 1)
+            elif self._srcURL is not None:
                 self.music = Mix_LoadMUS(self._srcURL)
             elif self.embedded_data is not None:
                 src_len = len(self.embedded_data)
@@ -138,6 +166,7 @@ cdef class MixMusic:
     cpdef reload(self, url):
         cdef Mix_Music * oldmusic = self.music
         self.free()
+        self._pack = None
         self._srcURL = bytes(url)
         self.load()
         if oldmusic != NULL and self.music != NULL and self.music != oldmusic:
@@ -149,6 +178,11 @@ cdef class MixMusic:
             Mix_FreeMusic(self.music)
             self.music = NULL
 
+    property size:
+        def __get__(self):
+            """ Bytes held in memory, music loaded from a file or a pack is streamed from it """
+            return len(self.embedded_data) if self.embedded_data is not None else 0
+
     def __dealloc__(self):
         self.free()
 
@@ -174,11 +208,15 @@ cdef class _SoundComponent:
 
     cpdef free(self):
         self.stop()
+        if self.chunk is not None:
+            Gilbert().dataManager.release(self.chunk)
         self.chunk = None
 
     cpdef play(self, int fadein=0, int ticks=-1):
         global channelMap
         if self.channel == -1:
+            if not self.chunk.decode():
+                return
             if fadein == 0:
                 self.channel = Mix_PlayChannelTimed(-1, self.chunk.chunk, 0, ticks)
             else:
@@ -290,6 +328,8 @@ cdef class _MusicComponent:
         self._released = True
         if self.stopOnDeactivation:
             self.stop()
+        if self.music is not None:
+            Gilbert().dataManager.release(self.music)
         self.music = None
 
     cpdef play(self, int fadein=0):
@@ -415,6 +455,12 @@ class Sound(Component, _SoundComponent):
         _SoundComponent.__init__(self)
         super(Sound, self).__init__(id, entity, active, **data)
 
+    @classmethod
+    def assets(cls, data):
+        if data.get('file') is not None:
+            return [('chunk', data['file'], None)]
+        return []
+
 
     def init(self, **data):
         """ Initialize the required external data """
@@ -453,6 +499,12 @@ class Music(Component, _MusicComponent):
         _MusicComponent.__init__(self)
         super(Music, self).__init__(id, entity, active, **data)
 
+    @classmethod
+    def assets(cls, data):
+        if data.get('file') is not None:
+            return [('music', data['file'], None)]
+        return []
+
 
     def init(self, **data):
         """ Initialize the required external data """
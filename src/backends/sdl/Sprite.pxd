@@ -15,6 +15,8 @@ from libcpp.pair cimport *
 from libcpp.vector cimport *
 from ignifuga.backends.sdl.SDL cimport *
 from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.FrameCache cimport FrameCache
+from ignifuga.backends.sdl.BlurCache cimport BlurCache
 from ignifuga.backends.sdl.Renderer cimport Renderer, _Sprite as _RendererSprite
 
 
@@ -35,6 +37,7 @@ ctypedef struct SPRITE_OVERLAY:
     PyObject *sprite
 
 ctypedef char* char_p
+ctypedef PyObject* PyObject_p
 ctypedef map[int,deque[SPRITE_FRAME]].iterator frame_iterator
 ctypedef map[int,char_p].iterator hitmap_iterator
 ctypedef map[int,SPRITE_OVERLAY].iterator overlay_iterator
@@ -44,25 +47,46 @@ cdef class _Sprite:
     cdef bint released
     cdef Canvas srcCanvas, canvas
     cdef int width, height, _frame, numFrames
+    # Frame drawn in canvas, which may lag behind _frame when the frames come from the cache
+    cdef int _composed
+    # The canvas showing the current frame, either canvas or a frame shared through the cache
+    cdef readonly Canvas current
+    cdef FrameCache cache
     cdef SPRITE_TYPE type
     cdef deque[int] *keyframes
     cdef map[int,deque[SPRITE_FRAME]] *frames
     cdef map[int,char_p] *hitmap
     cdef char_p current_hitmap
-    cdef object _hitmap
+    # Encoded hitmaps (or their spans in the mapped sidecar file), and the ones decoded so far
+    cdef object _hitmap, _hitmapDecoded, _hitmapFile
+    cdef char_p _hitmapBase
+    cdef bint rleHitmaps
+    # Boxes blitted so far, to measure how much seeking costs
+    cdef readonly unsigned long blits
 
     cpdef free(self)
+    cdef bint _blitFrame(self, int frame)
+    cdef int _keyframeBefore(self, int frame)
+    cdef bint _compose(self, int frame)
+    cdef bint _show(self, int frame)
     cdef bint nextFrame(self)
     cdef bint prevFrame(self)
     cdef frame(self, int frame)
     cdef bint hits(self, int x, int y)
+    cdef char_p _frameHitmap(self, int frame)
+    cdef bint _validHitmap(self, char_p hitmap, size_t size)
+    cdef _mapHitmaps(self, name)
 
 
+cdef class AnimationClock
+
 cdef class _SpriteComponent:
-    cdef bint _started, _dirty
+    cdef bint _started, _dirty, _sleeping
     cdef public bint forward, interactive, remainActiveOnStop, _static, _paused
     cdef public int loopMax, loop
     cdef Canvas _canvas, _atlas, _tmpcanvas
+    # The blurred frame being shown, it belongs to the renderer blur cache
+    cdef Canvas _blurred
     cdef _Sprite sprite
     cdef Renderer renderer
     cdef public _SpriteComponent parent
@@ -73,6 +97,10 @@ cdef class _SpriteComponent:
     cdef map[int,SPRITE_OVERLAY] *_overlays
     cdef int _lastBlurAmount, _blur
     cdef unsigned long lastUpdate
+    # Synced sprites share an AnimationClock with the ones playing the same atlas at the same frequency and phase
+    cdef public bint synced
+    cdef public int phase
+    cdef AnimationClock clock
 
     cpdef init(self)
     cpdef free(self)
@@ -80,11 +108,17 @@ cdef class _SpriteComponent:
     cpdef updateRenderer(self)
     cdef _updateRenderer(self)
     cpdef updateRendererZ(self)
+    cdef bint _canSync(self)
+    cdef _joinClock(self)
+    cdef _leaveClock(self)
+    cdef _frameChanged(self)
     cpdef reset(self)
     cpdef show(self)
     cpdef hide(self)
     cpdef reload(self, url)
+    cpdef canvasChanged(self)
     cdef _doCompositing(self)
+    cdef bint _showBlurred(self)
     cpdef event(self, action, sx, sy)
     cdef _updateSize(self)
     cpdef hits(self, x, y)
@@ -95,3 +129,17 @@ cdef class _SpriteComponent:
     cpdef setFrame(self, int frame)
     cpdef setPaused(self, value)
     cpdef setOverlays(self, overlays)
+
+cdef class AnimationClock:
+    cdef bint released
+    cdef readonly object key
+    cdef _Sprite sprite
+    cdef Renderer renderer
+    cdef double period
+    cdef unsigned long lastUpdate
+    # Borrowed references, members remove themselves before going away
+    cdef vector[PyObject_p] *members
+
+    cdef add(self, _SpriteComponent member)
+    cdef remove(self, _SpriteComponent member)
+    cpdef free(self)
@@ -11,16 +11,23 @@ from ignifuga.Gilbert import Gilbert
 from ignifuga.components.Viewable import Viewable
 from ignifuga.Task import *
 import sys
-from ignifuga.backends.GameLoopBase import EVENT_TYPE_TOUCH_DOWN, EVENT_TYPE_TOUCH_UP, EVENT_TYPE_TOUCH_MOTION, EVENT_TYPE_TOUCH_LAST, EVENT_TYPE_ETHEREAL_ZOOM_IN, EVENT_TYPE_ETHEREAL_ZOOM_OUT, EVENT_TYPE_ETHEREAL_SCROLL
+from ignifuga.backends.GameLoopBase import EVENT_TYPE_TOUCH_DOWN, EVENT_TYPE_TOUCH_UP, EVENT_TYPE_TOUCH_MOTION, EVENT_TYPE_TOUCH_LAST, EVENT_TYPE_ETHEREAL_ZOOM_IN, EVENT_TYPE_ETHEREAL_ZOOM_OUT, EVENT_TYPE_ETHEREAL_SCROLL, TASK_REQUEST_STOP
 from cython.operator cimport dereference as deref, preincrement as inc
 from base64 import b64decode
 from ignifuga.Log import error
+import os, mmap
 
+cdef extern from "Python.h":
+    int PyObject_AsReadBuffer(object obj, const void **buffer, Py_ssize_t *buffer_len) except -1
+
+# Shared animation clocks by (atlas, frequency, phase)
+_clocks = {}
 
 cdef class _SpriteComponent:
     def __init__(self):
         self._started = False
         self._dirty = True
+        self._sleeping = False
         self._rendererSprite = NULL
         self.forward = True
         self.interactive = False
@@ -37,28 +44,36 @@ cdef class _SpriteComponent:
         self.onLoop = None
         self.onStop = None
         self.lastBlurAmount = -1
+        self.synced = False
+        self.phase = 0
+        self.clock = None
         self._blur = 0
         self.loopMax = -1
         self.loop = 0
         self._spriteData = None
         self._atlas = None          # The "source" image where the sprite info comes from
         self._tmpcanvas = None      # An internal canvas where we perform composition of overlays and do bluring
-        self._canvas = None         # A pointer to the external "face" of the sprite, it can point to self._atlas, self._tmpcanvas or self.sprite.canvas
+        self._blurred = None
+        self._canvas = None         # A pointer to the external "face" of the sprite, it can point to self._atlas, self._tmpcanvas or self.sprite.current
         self.sprite =  None
         self._overlays = new map[int,SPRITE_OVERLAY]()
         self.lastUpdate = 0
 
     cpdef init(self):
         self.renderer = <Renderer>Gilbert().renderer
+        if self._atlas is not None:
+            # Initialization is being retried after an error, give back the atlas the failed attempt took
+            Gilbert().dataManager.release(self._atlas)
+            self._atlas = None
         if self.file != None:
             self._atlas = LOAD_IMAGE(self.file)
             Gilbert().dataManager.addListener(self.file, self)
             if self._atlas.spriteData != None:
                 self._spriteData = self._atlas.spriteData
                 self.sprite = _Sprite(self._spriteData, self._atlas)
-                self._canvas = self.sprite.canvas
                 if not self.forward:
-                    self.sprite._frame = self.sprite.numFrames - 1
+                    self.sprite.frame(self.sprite.numFrames - 1)
+                self._canvas = self.sprite.current
             else:
                 self.sprite = None
                 self._canvas = self._atlas
@@ -71,9 +86,14 @@ cdef class _SpriteComponent:
 
     cpdef free(self):
         self.hide()
+        if self.clock is not None:
+            self.clock.remove(self)
         self._tmpcanvas = None
+        self._blurred = None
         self.sprite = None
         self._canvas = None
+        if self._atlas is not None:
+            Gilbert().dataManager.release(self._atlas)
         self._atlas = None
         self._spriteData = None
         self.clearOverlays()
@@ -90,6 +110,25 @@ cdef class _SpriteComponent:
             STOP()
             return
 
+        if self.parent is None and (self.clock is not None or self._canSync()):
+            # The shared clock animates us from now on, we don't need an update loop of our own
+            if self.clock is None:
+                self._joinClock()
+            if self._dirty:
+                self._updateRenderer()
+            STOP()
+            return
+
+        if self.sprite != None and not self._paused and not self._dirty and self._overlays.empty() and (self.loopMax == -1 or self.loop < self.loopMax):
+            # Nothing to do until the next frame is due, let the game loop wake us up then
+            wait = <long>(self.lastUpdate + 1000/self.frequency) - <long>now + 1
+            if wait > 0:
+                self._sleeping = True
+                woken = SLEEP(wait)
+                self._sleeping = False
+                if woken is not None:
+                    now = woken
+
         # Update overlayed sprites that are marked inactive as they won't be updated by the entity
         iter = self._overlays.begin()
         while iter != self._overlays.end():
@@ -110,6 +149,7 @@ cdef class _SpriteComponent:
                     if self.forward:
                         if self.sprite.nextFrame():
                             self.lastUpdate = now
+                            self._frameChanged()
                             if self.sprite._frame == 0:
                                 self.loop +=1
                                 self.run(self.onLoop)
@@ -124,6 +164,7 @@ cdef class _SpriteComponent:
                     else:
                         if self.sprite.prevFrame():
                             self.lastUpdate = now
+                            self._frameChanged()
                             if self.sprite._frame == self.sprite.numFrames - 1:
                                 self.loop +=1
                                 self.run(self.onLoop)
@@ -166,7 +207,7 @@ cdef class _SpriteComponent:
             self._width_pre = self.width * (1.0 + self._z*self.zscale)
             self._height_pre = self.height * (1.0 + self._z*self.zscale)
 
-        if self._canvas == self._tmpcanvas:
+        if self._canvas == self._tmpcanvas or (self._canvas is not None and self._canvas is self._blurred):
             self._width_src = self._canvas._width
             self._height_src = self._canvas._height
         elif self._spriteData != None:
@@ -194,8 +235,8 @@ cdef class _SpriteComponent:
             self._dirty = False
 
     cpdef updateRenderer(self):
-        if self._static:
-            # No animation loop, directly update renderer
+        if self._static or self._sleeping or self.clock is not None:
+            # No animation loop (or it's sleeping until the next frame), directly update renderer
             self._updateRenderer()
         else:
             # Mark as dirty so we update on the next update
@@ -205,6 +246,55 @@ cdef class _SpriteComponent:
         if self._rendererSprite != NULL:
             self.renderer._spriteZ(self._rendererSprite,self._z)
 
+    cdef bint _canSync(self):
+        """ Synced sprites can share a clock while they play forward in an endless loop, with nothing composed on top """
+        return self.synced and self.sprite is not None and self.forward and self.loopMax == -1 and not self._paused and self._overlays.empty() and self._blur == 0
+
+    cdef _joinClock(self):
+        """ Hand our animation over to the shared clock for our atlas, frequency and phase """
+        cdef AnimationClock clock
+        key = (id(self._atlas), self.frequency, self.phase)
+        clock = _clocks.get(key)
+        if clock is None or clock.members.empty():
+            # An empty clock may have been dropped from the tick queue already (ie, when the scene ended)
+            clock = AnimationClock(key, self._spriteData, self._atlas, self.frequency, self.phase)
+            _clocks[key] = clock
+            Gilbert().gameLoop.startComponent(clock)
+        clock.add(self)
+        if self._rendererSprite != NULL:
+            self.renderer._spriteTexture(self._rendererSprite, self._canvas._surfacehw)
+        if not self._started:
+            # The update loop that would have started the animation is not going to run
+            self._started = True
+            self.run(self.onStart)
+
+    cdef _leaveClock(self):
+        """ Take our animation back from the shared clock, continuing from the frame it was at """
+        cdef AnimationClock clock = self.clock
+        if clock is None:
+            return
+        clock.remove(self)
+        self.sprite = _Sprite(self._spriteData, self._atlas)
+        self.sprite.frame(clock.sprite._frame)
+        self._canvas = self.sprite.current
+        if self._rendererSprite != NULL:
+            self.renderer._spriteTexture(self._rendererSprite, self._canvas._surfacehw)
+        if self._active:
+            Gilbert().gameLoop.startComponent(self)
+
+    cdef _frameChanged(self):
+        """ The animation moved to another frame, point the renderer to the canvas holding it """
+        if self._canvas is None or self._canvas is self._tmpcanvas or self._canvas is self._blurred:
+            # Overlays and blur are composed on top of the frame by _doCompositing
+            return
+        if self._canvas is not self.sprite.current:
+            self._canvas = self.sprite.current
+            if self._rendererSprite != NULL:
+                self.renderer._spriteTexture(self._rendererSprite, self._canvas._surfacehw)
+        elif self._rendererSprite != NULL:
+            # The frame was composed in place
+            self.renderer._spriteDamage(self._rendererSprite)
+
     cpdef reset(self):
         # Reset sprite
         cdef overlay_iterator iter
@@ -233,6 +323,12 @@ cdef class _SpriteComponent:
         cdef Canvas canvas
         cdef _SpriteComponent sprite
 
+        if self._blur > 0 and self._overlays.empty() and self._atlas is not None and self._showBlurred():
+            # The whole frame is blurred, it comes from the blur cache and there's nothing left to compose
+            self.updateRenderer()
+            return
+        self._blurred = None
+
         if self._tmpcanvas is not None and (self._width_pre != self._tmpcanvas._width or self._height_pre != self._tmpcanvas._height):
             self._tmpcanvas = None
 
@@ -241,41 +337,46 @@ cdef class _SpriteComponent:
 
         if self._tmpcanvas is not None:
             if self.sprite is not None:
-                source = self.sprite.canvas
+                source = self.sprite.current
             elif self._atlas is not None:
                 source = self._atlas
             else:
                 source = None
 
             if source is not None:
-                if not self._overlays.empty():
-
-                    use_tmpcanvas = True
-                    source.mod(1.0,1.0,1.0,1.0)
-                    self._tmpcanvas.blitCanvas(source, 0, 0, self._tmpcanvas._width, self._tmpcanvas._height, 0,0,source.width,source.height, self._tmpcanvas.BLENDMODE_NONE)
-                    iter = self._overlays.begin()
-                    while iter != self._overlays.end():
-                        _sprite = &deref(iter).second
-                        sprite = <_SpriteComponent> _sprite.sprite
-
-                        w = sprite._width_pre
-                        h = sprite._height_pre
-                        canvas = sprite._canvas
-                        if canvas is not None:
-                            r = sprite._red
-                            g = sprite._green
-                            b = sprite._blue
-                            a = sprite._alpha
-                            canvas.mod(_sprite.r if _sprite.r >= 0.0 else r, _sprite.g if _sprite.g >= 0.0 else g, _sprite.b if _sprite.b >= 0.0 else b, _sprite.a if _sprite.a >= 0.0 else a)
-                            self._tmpcanvas.blitCanvas(canvas,0,0,w,h,_sprite.x,_sprite.y,canvas._width,canvas._height,_sprite.op)
-                            canvas.mod(r,g,b,a)
-                        inc(iter)
-
-                if self._blur > 0:
-                    if self._blur != self._lastBlurAmount:
-                        self._doBluring(source, not use_tmpcanvas)
-                    use_tmpcanvas = True
-
+                # The temporary canvas is a render target, the batch keeps it set as the renderer target for all the
+                # hardware blits below
+                self._tmpcanvas.beginBatch()
+                try:
+                    if not self._overlays.empty():
+
+                        use_tmpcanvas = True
+                        source.mod(1.0,1.0,1.0,1.0)
+                        self._tmpcanvas.blitCanvas(source, 0, 0, self._tmpcanvas._width, self._tmpcanvas._height, 0,0,source.width,source.height, self._tmpcanvas.BLENDMODE_NONE)
+                        iter = self._overlays.begin()
+                        while iter != self._overlays.end():
+                            _sprite = &deref(iter).second
+                            sprite = <_SpriteComponent> _sprite.sprite
+
+                            w = sprite._width_pre
+                            h = sprite._height_pre
+                            canvas = sprite._canvas
+                            if canvas is not None:
+                                r = sprite._red
+                                g = sprite._green
+                                b = sprite._blue
+                                a = sprite._alpha
+                                canvas.mod(_sprite.r if _sprite.r >= 0.0 else r, _sprite.g if _sprite.g >= 0.0 else g, _sprite.b if _sprite.b >= 0.0 else b, _sprite.a if _sprite.a >= 0.0 else a)
+                                self._tmpcanvas.blitCanvas(canvas,0,0,w,h,_sprite.x,_sprite.y,canvas._width,canvas._height,_sprite.op)
+                                canvas.mod(r,g,b,a)
+                            inc(iter)
+
+                    if self._blur > 0:
+                        if self._blur != self._lastBlurAmount:
+                            self._doBluring(source, not use_tmpcanvas)
+                        use_tmpcanvas = True
+                finally:
+                    self._tmpcanvas.endBatch()
                 source.mod(self._red, self._green, self._blue, self._alpha)
 
         if use_tmpcanvas:
@@ -283,11 +384,14 @@ cdef class _SpriteComponent:
                 self._canvas = self._tmpcanvas
                 self.hide()
                 self.show()
+            elif self._rendererSprite != NULL:
+                # The composed image was redrawn in place
+                self.renderer._spriteDamage(self._rendererSprite)
         else:
             #
             if self.sprite is not None:
-                if self._canvas != self.sprite.canvas:
-                    self._canvas = self.sprite.canvas
+                if self._canvas != self.sprite.current:
+                    self._canvas = self.sprite.current
                     self.hide()
                     self.show()
             elif self._atlas is not None:
@@ -302,6 +406,38 @@ cdef class _SpriteComponent:
 
         self.updateRenderer()
 
+    cdef bint _showBlurred(self):
+        """ Show the current frame blurred at its displayed size, as kept by the renderer blur cache. Returns False if the cache can't hold it """
+        cdef BlurCache cache = self.renderer.blurCache
+        cdef Canvas source, blurred
+        cdef int frame = 0
+
+        if self._width_pre <= 0 or self._height_pre <= 0:
+            return False
+        if self.sprite is not None:
+            source = self.sprite.current
+            frame = self.sprite._frame
+        else:
+            source = self._atlas
+
+        blurred = cache.get(self._atlas, frame, self._blur, self._width_pre, self._height_pre)
+        if blurred is None:
+            blurred = cache.put(self._atlas, frame, self._blur, source, self._width_pre, self._height_pre)
+            if blurred is None:
+                return False
+
+        self._blurred = blurred
+        self._tmpcanvas = None
+        self._lastBlurAmount = self._blur
+        if self._canvas is not blurred:
+            self._canvas = blurred
+            self._updateSize()
+            if self._rendererSprite != NULL:
+                self.renderer._spriteTexture(self._rendererSprite, blurred._surfacehw)
+            else:
+                self.show()
+        return True
+
     cpdef hits(self, x, y):
         """ x,y are in sprite coords"""
         if self.interactive and x>=0 and x <= self._width_src and y >= 0 and y <= self._height_src:
@@ -327,6 +463,9 @@ cdef class _SpriteComponent:
         if self.entity is not None:
             sprite = self.entity.getComponent(id)
             if sprite is not None and isinstance(sprite, Sprite):
+                # Overlays are animated and composed by their parent
+                self._leaveClock()
+                (<_SpriteComponent>sprite)._leaveClock()
 
                 iter = self._overlays.find(z)
                 if iter != self._overlays.end():
@@ -402,10 +541,22 @@ cdef class _SpriteComponent:
 
     cpdef reload(self, url):
         # The Canvas was reloaded before we get here
-        if self._visible:
+        if self._blurred is not None:
+            # The blur cache dropped the frames blurred from the old texture, blur the new one
+            self._blurred = None
+            self._lastBlurAmount = -1
+            self._doCompositing()
+        elif self.sprite is None and self._tmpcanvas is None:
+            # Showing the atlas as is, the renderer already follows its new texture
+            self.canvasChanged()
+        elif self._visible:
             self.hide()
             self.show()
 
+    cpdef canvasChanged(self):
+        """ The canvas contents were replaced in place (the renderer already follows the new texture), refresh our size """
+        self._updateSize()
+
     cpdef event(self, action, sx, sy):
         """ Event processing """
         ret = super(Sprite, self).event(action, sx, sy)
@@ -457,8 +608,14 @@ cdef class _SpriteComponent:
         cdef overlay_iterator iter
         cdef SPRITE_OVERLAY *_sprite
 
+        if self.clock is not None:
+            # Seeking takes the sprite out of lockstep for good
+            self.synced = False
+            self._leaveClock()
+
         if self.sprite != None:
             self.sprite.frame(frame)
+            self._frameChanged()
 
         if frame == 0:
             self._started = False
@@ -484,6 +641,8 @@ cdef class _SpriteComponent:
             inc(iter)
 
         self._paused = value
+        if value:
+            self._leaveClock()
 
     cpdef setOverlays(self, overlays):
         """ Overlays should have the format [(id, x, y, z, r, g, a, op), (id, x, y, z, r, g, a, op), ...]
@@ -560,6 +719,7 @@ cdef class _SpriteComponent:
             else:
                 # Create a temporal canvas
                 value = int(value)
+                self._leaveClock()
             self._blur = value
 
             if self._static:
@@ -570,7 +730,7 @@ class Sprite(Viewable, _SpriteComponent):
     """ Sprite component class, viewable, potentially animated
     """
     PROPERTIES = Viewable.PROPERTIES + ['frame', 'frameCount', 'forward', 'blur', 'overlays', 'addOverlay', 'removeOverlay', 'clearOverlays', 'updateRenderer']
-    PROPERTIES_PERSIST = Viewable.PROPERTIES_PERSIST + ['forward', 'blur']
+    PROPERTIES_PERSIST = Viewable.PROPERTIES_PERSIST + ['forward', 'blur', 'synced', 'phase']
 
     def __init__(self, id=None, entity=None, active=True, frequency=15.0, loop=-1, **data):
         # Default values
@@ -580,6 +740,12 @@ class Sprite(Viewable, _SpriteComponent):
         _SpriteComponent.__init__(self)
         super(Sprite, self).__init__(id, entity, active, frequency, **data)
 
+    @classmethod
+    def assets(cls, data):
+        if data.get('file') is not None:
+            return [('image', data['file'], None)]
+        return []
+
     def init(self, **data):
         """ Initialize the required external data """
         _SpriteComponent.init(self)
@@ -657,6 +823,25 @@ class Sprite(Viewable, _SpriteComponent):
     def update(self, now, **data):
         self._update(now)
 
+cdef bint _rleHits(char_p hitmap, int height, int x, int y) nogil:
+    """ Test a point against a run length encoded hitmap. The format is a row index of height+1 little endian Uint32 (where each row
+    starts in the runs and where the last one ends), followed by the Uint16 runs of every row, alternating transparent and opaque
+    pixels and starting with a transparent run (which may be empty)
+    """
+    cdef Uint32 *rows = <Uint32*>hitmap
+    cdef Uint16 *runs = <Uint16*>(hitmap + (height+1)*4)
+    cdef Uint32 i = SDL_SwapLE32(rows[y]), end = SDL_SwapLE32(rows[y+1])
+    cdef int pos = 0
+    cdef bint opaque = False
+
+    while i < end:
+        pos += SDL_SwapLE16(runs[i])
+        if x < pos:
+            return opaque
+        opaque = not opaque
+        i += 1
+    return False
+
 cdef class _Sprite:
     """ Internal sprite implementation with animation"""
     def __init__(self, data, srcCanvas):
@@ -667,7 +852,7 @@ cdef class _Sprite:
                   deltap -> First frame is full, the rest are the difference boxes with the prior frame (it can include one or more keyframes)
                   NO LONGER SUPPORTED: deltak -> First frame is full, and every frame mentioned in "keyframes" is a full frame as well. The rest are difference boxes against the last keyframe.
 
-            keyframes: [0, ...] -> Keyframes (if type=atlas every frame is a keyframe)
+            keyframes: [0, ...] -> Keyframes, full frames seeking starts from (if type=atlas every frame is a keyframe)
             frames:
         [ /*Frames*/
             [/* Frame: contains changed boxes*/
@@ -686,7 +871,11 @@ cdef class _Sprite:
             [ 101010101010 hitmap for frame 0],
             [ 101010101010 hitmap for frame 1],
             etc
-        ]
+        ],
+        hitmapFormat: bits -> base64 encoded bitarrays, one bit per pixel (default)
+                      rle -> base64 encoded run length encoding, see _rleHits
+        hitmapFile: Sidecar file next to the atlas holding the hitmaps (raw, not base64 encoded), it's memory mapped.
+                    hitmap is then [[offset, size] for frame 0, [offset, size] for frame 1, ...]
 
         }
 
@@ -710,12 +899,14 @@ cdef class _Sprite:
         else:
             self.type = SPRITE_TYPE_ATLAS
 
+        # Sorted, so frame() can binary search the keyframe to seek from. Frame 0 is always a full frame
         self.keyframes = new deque[int]()
+        self.keyframes.push_back(0)
         if 'keyframes' in data:
-            for keyf in data['keyframes']:
-                self.keyframes.push_back(<int>keyf)
-        else:
-            self.keyframes.push_back(0)
+            for keyf in sorted(set(data['keyframes'])):
+                if 0 < keyf < self.numFrames:
+                    self.keyframes.push_back(<int>keyf)
+        self.blits = 0
 
         self.frames = new map[int,deque[SPRITE_FRAME]]()
 
@@ -745,26 +936,6 @@ cdef class _Sprite:
             return
 
 
-        self._hitmap = []
-        self.hitmap = new map[int,char_p]()
-        if 'hitmap' in data:
-            # We need to keep the hitmap stored as a Python string, even though we never use it as such
-            for frameHitmap in data['hitmap']:
-                self._hitmap.append(b64decode(frameHitmap))
-
-            # Map the strings to char* which we will actually use
-            nframe = 0
-            for frameHitmap in self._hitmap:
-                self.hitmap.insert(pair[int, char_p](nframe, <char_p>frameHitmap))
-                nframe+=1
-
-
-        hiter = self.hitmap.find(0)
-        if hiter != self.hitmap.end():
-            self.current_hitmap = deref(hiter).second
-        else:
-            self.current_hitmap = NULL
-
         # Frame width and height
         self.width = w
         self.height = h
@@ -773,7 +944,21 @@ cdef class _Sprite:
         # We need two canvas, the source canvas and the "presentation" canvas
         self.canvas = Canvas(width=w, height=h, isRenderTarget = True)
         self.srcCanvas = <Canvas>srcCanvas
+
+        # Hitmaps are decoded (or paged in from the sidecar file) when a frame is first hit tested
+        self.hitmap = new map[int,char_p]()
+        self._hitmap = list(data['hitmap']) if 'hitmap' in data else []
+        self._hitmapDecoded = {}
+        self._hitmapFile = None
+        self._hitmapBase = NULL
+        self.rleHitmaps = data.get('hitmapFormat') == 'rle'
+        if 'hitmapFile' in data:
+            self._mapHitmaps(data['hitmapFile'])
+        self.current_hitmap = NULL
         self.canvas.blitCanvas(self.srcCanvas, dx, dy, w, h, sx, sy, w, h, self.canvas.BLENDMODE_NONE)
+        self._composed = 0
+        self.current = self.canvas
+        self.cache = (<Renderer>Gilbert().renderer).frameCache
 
     def __dealloc__(self):
         self.free()
@@ -784,36 +969,102 @@ cdef class _Sprite:
             del self.frames
             del self.hitmap
             self._hitmap = None
+            self._hitmapDecoded = None
+            self._hitmapBase = NULL
+            self._hitmapFile = None
             self.canvas = None
+            self.current = None
+            self.cache = None
             self.srcCanvas = None
             self.released = True
 
-    cdef bint nextFrame(self):
-        """ Forward to next frame or restart loop"""
+    cdef bint _blitFrame(self, int frame):
+        """ Consolidate the boxes of a frame from srcCanvas into canvas """
         cdef frame_iterator iter
         cdef deque[SPRITE_FRAME] *boxes
         cdef deque[SPRITE_FRAME].iterator box_iter
         cdef SPRITE_FRAME *sf
 
-        self._frame+=1
-        if self._frame >= self.numFrames:
-            self._frame=0
-
-        iter = self.frames.find(self._frame)
+        iter = self.frames.find(frame)
         if iter == self.frames.end():
             return False
 
         boxes = &deref(iter).second
         box_iter = boxes.begin()
-
-        # Consolidate the new sprite frame from srcCanvas into canvas
         while box_iter != boxes.end():
             sf = &deref(box_iter)
             self.canvas.blitCanvas(self.srcCanvas, sf.dst_x, sf.dst_y, sf.w, sf.h, sf.src_x, sf.src_y, sf.w, sf.h, self.canvas.BLENDMODE_NONE)
+            self.blits += 1
             inc(box_iter)
 
         return True
 
+    cdef int _keyframeBefore(self, int frame):
+        """ Nearest keyframe at or before the given frame """
+        cdef int lo = 0, hi = self.keyframes.size() - 1, mid, keyframe = 0
+        while lo <= hi:
+            mid = (lo + hi) / 2
+            if self.keyframes[0][mid] <= frame:
+                keyframe = self.keyframes[0][mid]
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return keyframe
+
+    cdef bint _compose(self, int frame):
+        """ Bring canvas to the given frame. Delta frames are rebuilt from the nearest preceding keyframe (or from the frame already composed if it's closer) """
+        cdef int start, f
+        cdef bint composed = True
+
+        if frame == self._composed:
+            return True
+
+        # Every box of every frame replayed goes to the sprite canvas
+        self.canvas.beginBatch()
+        try:
+            if self.type == SPRITE_TYPE_ATLAS:
+                # Every frame is a full frame
+                composed = self._blitFrame(frame)
+            elif self.type == SPRITE_TYPE_DELTAP:
+                start = self._keyframeBefore(frame)
+                if start <= self._composed <= frame:
+                    start = self._composed
+                else:
+                    composed = self._blitFrame(start)
+                if composed:
+                    for f in range(start+1, frame+1):
+                        self._blitFrame(f)
+        finally:
+            self.canvas.endBatch()
+
+        if composed:
+            self._composed = frame
+        return composed
+
+    cdef bint _show(self, int frame):
+        """ Make frame the current one, taking it from the frame cache when possible """
+        cdef Canvas cached = None
+
+        if self.cache is not None and self.numFrames > 1:
+            cached = self.cache.get(self.srcCanvas, frame)
+        if cached is None:
+            if not self._compose(frame):
+                return False
+            if self.cache is not None and self.numFrames > 1:
+                cached = self.cache.put(self.srcCanvas, frame, self.canvas)
+        self.current = cached if cached is not None else self.canvas
+        self._frame = frame
+        self.current_hitmap = NULL
+        return True
+
+    cdef bint nextFrame(self):
+        """ Forward to next frame or restart loop"""
+        cdef int frame = self._frame + 1
+        if frame >= self.numFrames:
+            frame = 0
+
+        return self._show(frame)
+
     cdef bint prevFrame(self):
         """ Back to prev frame or restart loop"""
         cdef int prevFrame
@@ -826,36 +1077,9 @@ cdef class _Sprite:
         return True
 
     cdef frame(self, int frame):
-        cdef frame_iterator iter
-        cdef deque[SPRITE_FRAME] *boxes
-        cdef deque[SPRITE_FRAME].iterator box_iter
-        cdef SPRITE_FRAME *sf
-        cdef hitmap_iterator hiter
-
-        if frame < self.numFrames:
-            if self.type == SPRITE_TYPE_ATLAS or self.type == SPRITE_TYPE_DELTAP:
-                iter = self.frames.find(0)
-                if iter == self.frames.end():
-                    return False
-
-                boxes = &deref(iter).second
-                box_iter = boxes.begin()
-                if box_iter != boxes.end():
-                    sf = &deref(box_iter)
-                    self.canvas.blitCanvas(self.srcCanvas, sf.dst_x, sf.dst_y, sf.w, sf.h, sf.src_x, sf.src_y, sf.w, sf.h, self.canvas.BLENDMODE_NONE)
-                self._frame = frame
-
-            if self.type == SPRITE_TYPE_DELTAP:
-                # The first frame is in place, render every frame from the second one onwards
-                for f in range(1,frame):
-                    self.nextFrame()
-
-            hiter = self.hitmap.find(frame)
-            if hiter != self.hitmap.end():
-                self.current_hitmap = deref(hiter).second
-            else:
-                self.current_hitmap = NULL
-            return True
+        """ Seek to any frame """
+        if 0 <= frame < self.numFrames:
+            return self._show(frame)
 
         return False
 
@@ -865,13 +1089,174 @@ cdef class _Sprite:
             error('Tried to check %d,%d coords in a %d,%d sprite ' % (x,y, self.width, self.height))
             return False
 
-        if self.current_hitmap == NULL:
+        if y == self.height or x == self.width:
+            # On the far edges, outside the hitmap
             return False
 
+        if self.current_hitmap == NULL:
+            self.current_hitmap = self._frameHitmap(self._frame)
+            if self.current_hitmap == NULL:
+                return False
+
+        if self.rleHitmaps:
+            return _rleHits(self.current_hitmap, self.height, x, y)
+
         # See _bitarray.c -> getbit(bitarrayobject *self, idx_t i)
         cdef int ndx = y*self.width+x
         return self.current_hitmap[ndx / 8] & (1 << ndx % 8)
 
+    cdef char_p _frameHitmap(self, int frame):
+        """ The hitmap of a frame, decoding it if it's the first time it's needed """
+        cdef hitmap_iterator hiter = self.hitmap.find(frame)
+        cdef char_p hitmap = NULL
+
+        if hiter != self.hitmap.end():
+            return deref(hiter).second
+        if frame >= len(self._hitmap):
+            return NULL
+
+        if self._hitmapBase != NULL:
+            offset, size = self._hitmap[frame]
+            if 0 <= offset and 0 <= size and offset + size <= len(self._hitmapFile) and self._validHitmap(self._hitmapBase + <size_t>offset, size):
+                hitmap = self._hitmapBase + <size_t>offset
+        else:
+            # We need to keep the hitmap stored as a Python string, even though we never use it as such
+            decoded = b64decode(self._hitmap[frame])
+            if self._validHitmap(<char_p>decoded, len(decoded)):
+                self._hitmapDecoded[frame] = decoded
+                hitmap = <char_p>decoded
+
+        if hitmap == NULL:
+            # Bad hitmaps are remembered as missing, the frame never hits
+            error('Sprite hitmap for frame %d is invalid, ignoring it' % frame)
+        self.hitmap.insert(pair[int, char_p](frame, hitmap))
+        return hitmap
+
+    cdef bint _validHitmap(self, char_p hitmap, size_t size):
+        """ Check a hitmap covers the whole frame, so hit testing never reads past its end """
+        cdef Uint32 *rows
+        cdef size_t runs
+        cdef int y
+
+        if not self.rleHitmaps:
+            return size >= <size_t>(self.width * self.height + 7) / 8
+
+        if size < <size_t>(self.height + 1) * 4:
+            return False
+        rows = <Uint32*>hitmap
+        runs = (size - (self.height + 1) * 4) / 2
+        for y in range(self.height):
+            if SDL_SwapLE32(rows[y]) > SDL_SwapLE32(rows[y+1]):
+                return False
+        return SDL_SwapLE32(rows[self.height]) <= runs
+
+    cdef _mapHitmaps(self, name):
+        """ Map the hitmaps sidecar file that sits next to the atlas, pages are only read in as frames are hit tested.
+        If the atlas came from an asset pack, the sidecar is read from it too
+        """
+        cdef const void *base
+        cdef Py_ssize_t size
+
+        if self.srcCanvas._srcURL is None:
+            error('Sprite hitmaps are in %s, but the atlas has no location to find it' % name)
+            self._hitmap = []
+            return
+
+        path = os.path.join(os.path.dirname(self.srcCanvas._srcURL), name)
+        if self.srcCanvas._pack is not None:
+            self._hitmapFile = self.srcCanvas._pack.read(path)
+            if self._hitmapFile is None:
+                error('Could not find sprite hitmaps %s in the asset pack' % path)
+                self._hitmap = []
+                return
+        else:
+            try:
+                with open(path, 'rb') as fp:
+                    self._hitmapFile = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                error('Could not map sprite hitmaps from %s' % path)
+                self._hitmap = []
+                return
+
+        PyObject_AsReadBuffer(self._hitmapFile, &base, &size)
+        self._hitmapBase = <char_p>base
+
+
+cdef class AnimationClock:
+    """ Plays one animation for every synced sprite component showing it in lockstep (same atlas, frequency and phase).
+    The members share the clock's frames, the clock runs from the game loop tick queue and stops once it has no members left.
+    """
+    def __init__(self, key, spriteData, Canvas atlas, double frequency, int phase):
+        self.released = False
+        self.key = key
+        self.renderer = <Renderer>Gilbert().renderer
+        self.sprite = _Sprite(spriteData, atlas)
+        if phase != 0 and self.sprite.numFrames > 0:
+            self.sprite.frame(phase % self.sprite.numFrames)
+        self.period = 1000.0 / frequency
+        self.lastUpdate = 0
+        self.members = new vector[PyObject_p]()
+
+    def __dealloc__(self):
+        self.free()
+
+    cdef add(self, _SpriteComponent member):
+        self.members.push_back(<PyObject*>member)
+        member.clock = self
+        member.sprite = self.sprite
+        member._canvas = self.sprite.current
+
+    cdef remove(self, _SpriteComponent member):
+        cdef size_t i
+        for i in range(self.members.size()):
+            if self.members[0][i] == <PyObject*>member:
+                self.members[0][i] = self.members.back()
+                self.members.pop_back()
+                break
+        member.clock = None
+
+    def tick(self, unsigned long now):
+        """ Advance the animation and point every member to the new frame """
+        cdef size_t i
+        cdef _SpriteComponent member
+        cdef Canvas current
+
+        if self.members.empty():
+            if _clocks.get(self.key) is self:
+                del _clocks[self.key]
+            self.free()
+            return TASK_REQUEST_STOP
+
+        if now - self.lastUpdate <= self.period or not self.sprite.nextFrame():
+            return
+        self.lastUpdate = now
+
+        current = self.sprite.current
+        looped = [] if self.sprite._frame == 0 else None
+        for i in range(self.members.size()):
+            member = <_SpriteComponent>self.members[0][i]
+            if member._canvas is not current:
+                member._canvas = current
+            if member._rendererSprite != NULL and not self.renderer._spriteTexture(member._rendererSprite, current._surfacehw):
+                # The frame was composed in place
+                self.renderer._spriteDamage(member._rendererSprite)
+            if looped is not None:
+                looped.append(member)
+
+        # Every member counts the loop, as unsynced sprites do. Callbacks run once the members are updated, they may remove sprites from the clock
+        if looped:
+            for member in looped:
+                member.loop += 1
+                if member.onLoop is not None:
+                    member.run(member.onLoop)
+
+    cpdef free(self):
+        if not self.released:
+            del self.members
+            self.sprite = None
+            self.renderer = None
+            self.released = True
+
 
 
 
@@ -0,0 +1,26 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Pooled surfaces for software blitting
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.backends.sdl.SDL cimport *
+from libcpp.map cimport *
+from libcpp.vector cimport *
+
+ctypedef SDL_Surface* Surface_p
+
+cdef class SurfacePool:
+    cdef bint released
+    # (w << 32 | h) -> idle surfaces of that size
+    cdef map[Uint64, vector[Surface_p]] *buckets
+    cdef public int bucketSize
+    cdef readonly unsigned long created, reused
+
+    cdef SDL_Surface *acquire(self, int w, int h, void *pixels, int pitch)
+    cdef void release(self, SDL_Surface *surface)
+    cpdef clear(self)
+    cpdef free(self)
@@ -0,0 +1,81 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# Pooled surfaces for software blitting
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from cython.operator cimport dereference as deref, preincrement as inc
+
+cdef class SurfacePool:
+    """ RGBA surface headers used to wrap pixels that belong to someone else (ie a locked texture), bucketed by size so
+    software blits don't allocate a surface every time. Up to bucketSize idle surfaces are kept per size.
+    """
+    def __init__(self, int bucketSize=4):
+        self.released = False
+        self.buckets = new map[Uint64, vector[Surface_p]]()
+        self.bucketSize = bucketSize
+        self.created = self.reused = 0
+
+    def __dealloc__(self):
+        self.free()
+
+    cdef SDL_Surface *acquire(self, int w, int h, void *pixels, int pitch):
+        """ Get a w x h surface pointing at pixels, return it with release when done """
+        cdef SDL_Surface *surface
+        cdef map[Uint64, vector[Surface_p]].iterator iter = self.buckets.find((<Uint64>w << 32) | <Uint32>h)
+
+        if iter != self.buckets.end() and not deref(iter).second.empty():
+            surface = deref(iter).second.back()
+            deref(iter).second.pop_back()
+            self.reused += 1
+        else:
+            # Created without pixels of its own (SDL_PREALLOC), so freeing it never touches the wrapped memory
+            #if BIG_ENDIAN
+            surface = SDL_CreateRGBSurfaceFrom(NULL, w, h, 32, w*4, 0xFF000000, 0x00FF0000, 0x0000FF00, 0x000000FF)
+            #else
+            surface = SDL_CreateRGBSurfaceFrom(NULL, w, h, 32, w*4, 0x000000FF, 0x0000FF00, 0x00FF0000, 0xFF000000 )
+            #endif
+            if surface == NULL:
+                return NULL
+            self.created += 1
+
+        surface.pixels = pixels
+        surface.pitch = pitch
+        return surface
+
+    cdef void release(self, SDL_Surface *surface):
+        """ Give a surface back to the pool """
+        cdef vector[Surface_p] *bucket
+        surface.pixels = NULL
+        if self.released:
+            SDL_FreeSurface(surface)
+            return
+        bucket = &deref(self.buckets)[(<Uint64>surface.w << 32) | <Uint32>surface.h]
+        if bucket.size() < self.bucketSize:
+            SDL_SetSurfaceBlendMode(surface, SDL_BLENDMODE_BLEND)
+            bucket.push_back(surface)
+        else:
+            SDL_FreeSurface(surface)
+
+    cpdef clear(self):
+        """ Free the idle surfaces """
+        cdef map[Uint64, vector[Surface_p]].iterator iter = self.buckets.begin()
+        cdef size_t i
+        while iter != self.buckets.end():
+            for i in range(deref(iter).second.size()):
+                SDL_FreeSurface(deref(iter).second[i])
+            inc(iter)
+        self.buckets.clear()
+
+    property stats:
+        def __get__(self):
+            return {'created': self.created, 'reused': self.reused}
+
+    cpdef free(self):
+        if not self.released:
+            self.clear()
+            del self.buckets
+            self.released = True
@@ -0,0 +1,32 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# LRU cache of textures derived from atlases
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from ignifuga.backends.sdl.SDL cimport *
+from ignifuga.backends.sdl.Canvas cimport Canvas
+
+cdef class TextureCache:
+    cdef bint released
+    # (atlas texture, ...) -> (atlas, canvas, bytes), least recently used first
+    cdef object frames
+    # (w, h) -> [Canvas], textures of dropped entries waiting to be reused (they count as used)
+    cdef object spare
+    cdef Uint64 _budget
+    cdef readonly Uint64 used
+    cdef readonly unsigned long hits, misses, evictions, reuses
+
+    cdef Canvas _lookup(self, key)
+    cdef Canvas _store(self, key, Canvas atlas, int w, int h)
+    cdef Canvas _canvas(self, int w, int h)
+    cdef _spare(self, Canvas canvas)
+    cpdef drop(self, Canvas atlas)
+    cdef _invalidate(self, SDL_Texture *texture)
+    cdef _evict(self, int w=*, int h=*)
+    cdef dict _stats(self)
+    cpdef clear(self)
+    cpdef free(self)
@@ -0,0 +1,136 @@
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+# Ignifuga Game Engine
+# LRU cache of textures derived from atlases
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+from collections import OrderedDict
+
+cdef class TextureCache:
+    """ Render targets derived from atlases (composed or blurred frames), kept up to a VRAM budget (in bytes, 0 disables
+    the cache) and evicted in LRU order. The textures of evicted entries are reused for new entries of the same size instead
+    of being destroyed and created again.
+    Keys start with the atlas texture pointer. Entries keep their atlas alive so the pointer can't be reused while they
+    exist, the data manager drops them when it lets go of the atlas.
+    """
+    def __init__(self, Uint64 budget=0):
+        self.released = False
+        self.frames = OrderedDict()
+        self.spare = {}
+        self._budget = budget
+        self.used = 0
+        self.hits = self.misses = self.evictions = self.reuses = 0
+
+    def __dealloc__(self):
+        TextureCache.free(self)
+
+    cdef Canvas _lookup(self, key):
+        """ Get the canvas of an entry, or None if it's not cached """
+        if self._budget == 0:
+            return None
+        entry = self.frames.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        # Move it to the most recently used end
+        self.frames[key] = entry
+        self.hits += 1
+        return entry[1]
+
+    cdef Canvas _store(self, key, Canvas atlas, int w, int h):
+        """ Make a w x h entry derived from atlas, returns its canvas for the caller to fill (or None if it doesn't fit in the budget) """
+        cdef Canvas canvas
+        cdef Uint64 size = <Uint64>w * h * 4
+
+        if self._budget == 0 or size == 0 or size > self._budget:
+            return None
+        entry = self.frames.pop(key, None)
+        if entry is not None:
+            self._spare(entry[1])
+
+        canvas = self._canvas(w, h)
+        self.frames[key] = (atlas, canvas, size)
+        return canvas
+
+    cdef Canvas _canvas(self, int w, int h):
+        """ A render target for a new entry, the texture of a dropped or evicted entry of the same size if there is one """
+        cdef Canvas canvas
+        if (w, h) not in self.spare:
+            self._evict(w, h)
+        spare = self.spare.get((w, h))
+        if not spare:
+            self.used += <Uint64>w * h * 4
+            return Canvas(width=w, height=h, isRenderTarget = True)
+        self.reuses += 1
+        canvas = spare.pop()
+        if not spare:
+            del self.spare[(w, h)]
+        return canvas
+
+    cdef _spare(self, Canvas canvas):
+        """ Keep the texture of a dropped entry to reuse it """
+        key = (canvas._width, canvas._height)
+        if key not in self.spare:
+            self.spare[key] = []
+        self.spare[key].append(canvas)
+
+    cpdef drop(self, Canvas atlas):
+        """ Drop the entries derived from an atlas, so they don't keep it alive """
+        if not self.released and atlas._surfacehw != NULL:
+            self._invalidate(atlas._surfacehw)
+
+    cdef _invalidate(self, SDL_Texture *texture):
+        """ Drop the entries derived from an atlas texture that's going away """
+        for key in [key for key in self.frames if key[0] == <size_t>texture]:
+            self._spare(self.frames.pop(key)[1])
+
+    cdef _evict(self, int w=0, int h=0):
+        """ Make room in the budget for a w x h entry (none by default). Spare textures of other sizes go first, then the least
+        recently used entries. An evicted entry of the same size is left as a spare for the new entry to take over
+        """
+        cdef Uint64 size = <Uint64>w * h * 4
+        cdef Canvas canvas
+        while self.used + size > self._budget:
+            other = [wh for wh in self.spare if wh != (w, h)]
+            if other:
+                self.used -= <Uint64>other[0][0] * other[0][1] * 4 * len(self.spare.pop(other[0]))
+            elif self.frames:
+                key, entry = self.frames.popitem(last=False)
+                self.evictions += 1
+                canvas = entry[1]
+                if size > 0 and canvas._width == w and canvas._height == h:
+                    self._spare(canvas)
+                    return
+                self.used -= entry[2]
+            else:
+                break
+
+    cdef dict _stats(self):
+        return {'frames': len(self.frames), 'spare': sum(len(spare) for spare in self.spare.itervalues()), 'used': self.used, 'budget': self._budget,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'reuses': self.reuses}
+
+    cpdef clear(self):
+        self.frames.clear()
+        self.spare.clear()
+        self.used = 0
+
+    property budget:
+        def __get__(self):
+            return self._budget
+        def __set__(self, Uint64 budget):
+            self._budget = budget
+            self._evict()
+
+    property stats:
+        def __get__(self):
+            return self._stats()
+
+    cpdef free(self):
+        if not self.released:
+            TextureCache.clear(self)
+            self.frames = None
+            self.spare = None
+            self.released = True
@@ -10,7 +10,8 @@
 from ignifuga.Log import error, debug
 from ignifuga.Gilbert import Gilbert
 import traceback
-from copy import copy, deepcopy
+from copy import copy
+from ignifuga.SceneData import CowDict, thaw
 
 class Component(object):
     TYPE = None
@@ -35,6 +36,13 @@ class Component(object):
             return component
         return None
 
+    @classmethod
+    def assets(cls, data):
+        """ The assets a component created from data loads when it's initialized, as (kind, url, size) tuples.
+        kind is 'image', 'chunk', 'music' or 'font' (size only matters for fonts). Used to prefetch scenes
+        """
+        return []
+
     def __init__(self, id=None, entity=None, active=True, frequency=15.0, **data):
         self._id = id if id != None else hash(self)
         self.released = False
@@ -69,9 +77,10 @@ class Component(object):
     def load(self, data):
         #Load data into the current instance
         for key,value in data.iteritems():
-            setattr(self, key, value)
+            # Attributes are the instance's own, modifiable all the way down and made of plain dicts and lists
+            setattr(self, key, thaw(value))
 
-        self._data = deepcopy(data)
+        self._data = CowDict(data)
 
     @property
     def id(self):
@@ -38,6 +38,13 @@ class Text(Sprite):
 
         super(Text, self).__init__(id, entity, active, frequency, **data)
 
+    @classmethod
+    def assets(cls, data):
+        assets = super(Text, cls).assets(data)
+        if data.get('font') is not None:
+            assets.append(('font', data['font'], data.get('size', 16)))
+        return assets
+
     def init(self, **data):
         """ Initialize the required external data """
         self._atlas = self._canvas = Canvas()(width=1, height=1)
@@ -107,12 +114,9 @@ class Text(Sprite):
 
     def _updateCanvas(self):
         if self._canvas != None and self._font != None:
+            # The renderer sprite follows the new canvas texture, only the size needs updating
             self._canvas.text(self._text,self._color, self._font, self._size)
-            self._updateSize()
-            if self._rendererSpriteId:
-                # The canvas surface changed, remove and add it to the renderer
-                self.hide()
-                self.show()
+            self.canvasChanged()
 
     def hits(self, x, y):
         """ x,y are in sprite coords"""
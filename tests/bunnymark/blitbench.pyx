@@ -0,0 +1,69 @@
+#!./ignifuga-python
+# Ignifuga Game Engine software blit benchmark
+# Does 10k small blits between streaming canvases, which lock both textures and wrap their pixels in pooled surfaces on every blit
+# This code is licensed under MIT License
+# Cython version
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.backends.sdl.Renderer cimport Renderer
+from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.SDL cimport *
+
+from _random import Random
+
+# cython: boundscheck=False
+# cython: wraparound=False
+
+DEF NUM_BLITS = 10000
+DEF BLIT_SIZE = 16
+
+cdef double _timeBlits(Canvas dst, Canvas src, list points):
+    cdef Uint64 start = SDL_GetPerformanceCounter()
+    cdef int x, y
+    for x, y in points:
+        dst.blitCanvas(src, x, y, BLIT_SIZE, BLIT_SIZE, 0, 0, BLIT_SIZE, BLIT_SIZE, Canvas.BLENDMODE_BLEND)
+    return (SDL_GetPerformanceCounter() - start) * 1000.0 / SDL_GetPerformanceFrequency()
+
+class BlitBench(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(BlitBench, self).__init__(**data)
+
+    def sceneInit(self):
+        cdef Renderer renderer = Gilbert().renderer
+        # Streaming textures, blits between them go through the software path
+        cdef Canvas dst = Canvas(512, 512)
+        cdef Canvas src = Canvas(BLIT_SIZE, BLIT_SIZE)
+        cdef int i
+        super(BlitBench, self).sceneInit()
+
+        r = Random()
+        points = [(<int>(r.random()*(512-BLIT_SIZE)), <int>(r.random()*(512-BLIT_SIZE))) for i in range(NUM_BLITS)]
+
+        elapsed = _timeBlits(dst, src, points)
+
+        debug('%d blits of %dx%d' % (NUM_BLITS, BLIT_SIZE, BLIT_SIZE))
+        debug('Blits:          %.2f ms' % elapsed)
+        debug('Surface pool:   %s' % renderer.surfacePool.stats)
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    Gilbert().init(BACKENDS.sdl, BlitBench())
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,110 @@
+#!./ignifuga-python
+# Ignifuga Game Engine blur benchmark
+# Blurs 100 sprites cycling through 8 frames for 60 frames, with the offset blits blur and through the blur cache
+# This code is licensed under MIT License
+# Cython version
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.backends.sdl.Renderer cimport Renderer
+from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.BlurCache cimport BlurCache
+from ignifuga.backends.sdl.SDL cimport *
+
+# cython: boundscheck=False
+# cython: wraparound=False
+
+DEF NUM_SPRITES = 100
+DEF NUM_FRAMES = 60
+DEF SPRITE_FRAMES = 8
+DEF BLUR = 8
+
+cdef _offsetBlur(Canvas tmp, Canvas source, int blur):
+    """ The blits _SpriteComponent._doBluring does when the blur cache is disabled """
+    cdef int b, w, h
+    source.mod(1.0,1.0,1.0,1.0)
+    tmp.blitCanvas(source, 0, 0, tmp._width, tmp._height, 0,0,source._width,source._height, tmp.BLENDMODE_NONE)
+    source.mod(1.0,1.0,1.0,0.2)
+    b = blur / 2
+    w = tmp._width-b
+    h = tmp._height-b
+    tmp.blitCanvas(source,0,0,w,h,b,b,w,h, tmp.BLENDMODE_BLEND)
+    tmp.blitCanvas(source,b, b, w, h, 0,0,w,h, tmp.BLENDMODE_BLEND)
+    tmp.blitCanvas(source,0,b,w,h,b,0,w,h, tmp.BLENDMODE_BLEND)
+    tmp.blitCanvas(source,b,0,w,h,0,b,w,h, tmp.BLENDMODE_BLEND)
+    b = blur
+    w = tmp._width-b
+    h = tmp._height-b
+    source.mod(1.0,1.0,1.0,0.1)
+    tmp.blitCanvas(source,0,0,w,h,b,b,w,h, tmp.BLENDMODE_BLEND)
+    tmp.blitCanvas(source,b, b, w, h, 0,0,w,h, tmp.BLENDMODE_BLEND)
+    tmp.blitCanvas(source,0,b,w,h,b,0,w,h, tmp.BLENDMODE_BLEND)
+    tmp.blitCanvas(source,b,0,w,h,0,b,w,h, tmp.BLENDMODE_BLEND)
+    source.mod(0.0,0.0,0.0,1.0)
+    tmp.blitCanvas(source, 0, 0, tmp._width, tmp._height, 0,0,tmp._width,tmp._height, tmp.BLENDMODE_ADD)
+    source.mod(1.0,1.0,1.0,1.0)
+
+cdef double _timeOffsetBlur(list tmps, Canvas atlas):
+    cdef Uint64 start = SDL_GetPerformanceCounter()
+    cdef int f, i
+    for f in range(NUM_FRAMES):
+        for i in range(NUM_SPRITES):
+            # Animated sprites are blurred again on every frame change
+            _offsetBlur(tmps[i], atlas, BLUR)
+    return (SDL_GetPerformanceCounter() - start) * 1000.0 / SDL_GetPerformanceFrequency()
+
+cdef double _timeBlurCache(BlurCache cache, Canvas atlas):
+    cdef Uint64 start = SDL_GetPerformanceCounter()
+    cdef int f, i, frame
+    for f in range(NUM_FRAMES):
+        for i in range(NUM_SPRITES):
+            frame = (f + i) % SPRITE_FRAMES
+            if cache.get(atlas, frame, BLUR, atlas._width, atlas._height) is None:
+                cache.put(atlas, frame, BLUR, atlas, atlas._width, atlas._height)
+    return (SDL_GetPerformanceCounter() - start) * 1000.0 / SDL_GetPerformanceFrequency()
+
+class BlurBench(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(BlurBench, self).__init__(**data)
+
+    def sceneInit(self):
+        cdef Renderer renderer = Gilbert().renderer
+        cdef Canvas atlas = Gilbert().dataManager.getImage('images/wabbit_alpha.png')
+        cdef BlurCache cache = renderer.blurCache
+        cdef int i
+        super(BlurBench, self).sceneInit()
+
+        tmps = [Canvas(atlas._width, atlas._height, isRenderTarget = True) for i in range(NUM_SPRITES)]
+        offset = _timeOffsetBlur(tmps, atlas)
+
+        cache.clear()
+        cache.budget = 8 * 1024 * 1024
+        blurs = cache.blurs
+        cached = _timeBlurCache(cache, atlas)
+
+        debug('%d sprites blurred by %d px over %d frames (%d different frames)' % (NUM_SPRITES, BLUR, NUM_FRAMES, SPRITE_FRAMES))
+        debug('Offset blits: %.2f ms' % offset)
+        debug('Blur cache:   %.2f ms (%d box blurs)' % (cached, cache.blurs - blurs))
+        debug('Blur cache stats: %s' % cache.stats)
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    Gilbert().init(BACKENDS.sdl, BlurBench())
+
+if __name__ == '__main__':
+    run()
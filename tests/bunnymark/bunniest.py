@@ -0,0 +1,156 @@
+#!./ignifuga-python
+# Ignifuga Game Engine "Bunnymark" benchmark clone - Tick vs Greenlet scheduling version
+# Original version: http://blog.iainlobb.com/2010/11/display-list-vs-blitting-results.html
+# See http://philippe.elsass.me/2011/11/nme-ready-for-the-show/ for a HaxeNME version
+# This code is licensed under MIT License
+# Every bunny is moved by its own component. By default the component declares a plain tick(now) method and is driven
+# by the game loop tick queue, with --greenlets it declares update(now) instead and gets its own greenlet.
+# Compare the amount of bunnies each mode sustains at 30 fps.
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.components.Component import Component
+from ignifuga.Scene import Scene
+from ignifuga.Entity import Entity
+from _random import Random
+
+GRAVITY = 2
+
+class _BunnyMover(Component):
+    """ Bunny movement shared by both scheduling modes """
+    def __init__(self, id=None, entity=None, active=True, frequency=15.0, **data):
+        self.speedx = 0
+        self.speedy = 0
+        super(_BunnyMover, self).__init__(id, entity, active, frequency, **data)
+
+    def move(self):
+        bunny = self.entity
+        if not bunny._initialized:
+            return
+        maxx, maxy = Gilbert().renderer.screenSize
+        self.speedy += GRAVITY
+        bunny.x += self.speedx
+        bunny.y += self.speedy
+        bunny.alpha = 0.3 + 0.7 * bunny.y / maxy
+        if bunny.x > maxx:
+            bunny.x = maxx
+            self.speedx = -self.speedx
+        elif bunny.x <= 0:
+            bunny.x = 0
+            self.speedx = -self.speedx
+        if bunny.y > maxy:
+            bunny.y = maxy
+            self.speedy = -self.speedy
+        elif bunny.y <= 0:
+            bunny.y = 0
+            self.speedy = 0
+        bunny.updateRenderer()
+
+class TickBunny(_BunnyMover):
+    """ Called from the game loop tick queue, no greenlet involved """
+    def tick(self, now):
+        self.move()
+
+class GreenletBunny(_BunnyMover):
+    """ Called through a greenlet switch every frame """
+    def update(self, now, **data):
+        self.move()
+
+class Bunnies(Scene):
+    def __init__(self, mover='TickBunny', **data):
+        self.mover = mover
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                },
+                "components":[
+                        {
+                        "id": "fps",
+                        "type":"Text",
+                        "font": u"images/teenbold.ttf",
+                        "htmlColor": u"#ffffff",
+                        "text":u"0",
+                        "size": 48,
+                        "x": 0,
+                        "y": 0,
+                        "z": 1000
+                    }
+                ]
+        }
+        super(Bunnies, self).__init__(**data)
+
+    def sceneInit(self):
+        self.nBunnies = 0
+        super(Bunnies, self).sceneInit()
+        maxx, maxy = Gilbert().renderer.screenSize
+        self.size = {'width': maxx, 'height': maxy}
+        self.resolution = {'width': maxx, 'height': maxy}
+        Gilbert().renderer.scrollTo(0,0)
+        self.addBunnies()
+
+    def addBunnies(self, num=500):
+        r = Random()
+        for x in range(0,num):
+            data = {"components":[
+                    {
+                    "type":"Sprite",
+                    "file":u"images/wabbit_alpha.png",
+                    "x": 0,
+                    "y": 0
+                },
+                {
+                    "type": self.mover,
+                    "speedx": int(r.random()*70.0) - 35,
+                    "speedy": int(r.random()*70.0)
+                }
+            ]}
+            bunny = Entity.create(id = 'bunny %d' % (self.nBunnies+x), scene=self, **data)
+            bunny.x = r.random()*self.size['width']
+            bunny.y = self.size['height']
+            bunny.z = int(r.random()*100)
+            self.entities[bunny.id] = bunny
+            Gilbert().startEntity(bunny)
+
+        self.nBunnies+=num
+        fps = self.getComponent("fps")
+        if fps != None:
+            fps.text = '%s %d' % (self.mover, self.nBunnies)
+        debug("%s: %d bunnies" % (self.mover, self.nBunnies))
+
+    def update(self, data):
+        """ Add bunnies while we can keep up with 30 fps, the bunnies move themselves """
+        ft = Gilbert().gameLoop.frame_time
+        if ft < Gilbert().gameLoop.ticks_second / 100:
+            self.addBunnies(1500)
+        elif ft < Gilbert().gameLoop.ticks_second / 30:
+            self.addBunnies(500)
+
+def run(mover):
+    try:
+        Log(0)
+        bunnies = Bunnies(mover)
+        Gilbert().init(BACKENDS.sdl, bunnies)
+    except:
+        pass
+
+if __name__ == '__main__':
+    parser = Gilbert().parser
+    parser.add_option("--greenlets", action="store_true", dest="greenlets", default=False,help="Move bunnies from greenlet driven update(now) instead of tick(now)")
+    (options, args) = parser.parse_args()
+    mover = 'GreenletBunny' if options.greenlets else 'TickBunny'
+
+    if options.profile:
+        import cProfile, pstats
+        profileFileName = 'profile_data.pyprof'
+        cProfile.runctx("run(mover)", globals(), locals(), profileFileName)
+        pstats.Stats(profileFileName).strip_dirs().sort_stats("time").print_stats()
+    else:
+        run(mover)
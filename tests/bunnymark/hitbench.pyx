@@ -0,0 +1,93 @@
+#!./ignifuga-python
+# Ignifuga Game Engine hit testing benchmark
+# Adds 10k interactive sprites and times Renderer.processEvent with the spatial hash and with the full z order walk
+# This code is licensed under MIT License
+# Cython version
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.backends.sdl.Renderer cimport Renderer
+from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.SDL cimport *
+from ignifuga.backends.GameLoopBase cimport EVENT_TOUCH_DOWN
+
+from _random import Random
+
+# cython: boundscheck=False
+# cython: wraparound=False
+
+DEF NUM_SPRITES = 10000
+DEF NUM_EVENTS = 1000
+
+class Target(object):
+    """ Stands in for a component, counts how many events it gets """
+    calls = 0
+    def event(self, action, sx, sy):
+        Target.calls += 1
+        return True, False
+
+cdef double _timeEvents(Renderer renderer, list points):
+    cdef Uint64 start = SDL_GetPerformanceCounter()
+    for x, y in points:
+        renderer.processEvent(EVENT_TOUCH_DOWN, x, y)
+    return (SDL_GetPerformanceCounter() - start) * 1000.0 / SDL_GetPerformanceFrequency()
+
+class HitBench(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(HitBench, self).__init__(**data)
+
+    def sceneInit(self):
+        cdef Renderer renderer = Gilbert().renderer
+        cdef Canvas canvas = Gilbert().dataManager.getImage('images/wabbit_alpha.png')
+        cdef int i, x, y
+        super(HitBench, self).sceneInit()
+        maxx, maxy = renderer.screenSize
+        renderer.scrollTo(0,0)
+
+        r = Random()
+        self.targets = []
+        for i in range(NUM_SPRITES):
+            target = Target()
+            self.targets.append(target)
+            x = <int>(r.random()*maxx)
+            y = <int>(r.random()*maxy)
+            renderer._addSprite(target, True, canvas, <int>(r.random()*100), 0, 0, canvas._width, canvas._height, x, y, canvas._width, canvas._height, 0, 0, 0, 0, 1.0, 1.0, 1.0, 1.0)
+
+        points = [(<int>(r.random()*maxx), <int>(r.random()*maxy)) for i in range(NUM_EVENTS)]
+
+        renderer.spatialHashing = False
+        Target.calls = 0
+        linear = _timeEvents(renderer, points)
+        linearCalls = Target.calls
+
+        renderer.spatialHashing = True
+        Target.calls = 0
+        # The first query files every sprite in the hash
+        hashed = _timeEvents(renderer, points)
+        hashedCalls = Target.calls
+
+        debug('%d interactive sprites, %d events' % (NUM_SPRITES, NUM_EVENTS))
+        debug('Full walk:    %.2f ms (%d event calls)' % (linear, linearCalls))
+        debug('Spatial hash: %.2f ms (%d event calls)' % (hashed, hashedCalls))
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    Gilbert().init(BACKENDS.sdl, HitBench())
+
+if __name__ == '__main__':
+    run()
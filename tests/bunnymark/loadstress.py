@@ -0,0 +1,128 @@
+#!./ignifuga-python
+# Ignifuga Game Engine image loading stress test
+# Loads hundreds of different atlases while the scene is running and reports the worst frame time seen while loading.
+# Run with --syncimages to decode in the render thread (the old behavior) and compare.
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.Entity import Entity
+from _random import Random
+import os, shutil
+
+STRESS_DIR = os.path.join('images', 'stress')
+
+def makeAtlases(src, num):
+    """ Every atlas gets its own file, so every one of them has to be decoded """
+    if os.path.isdir(STRESS_DIR):
+        shutil.rmtree(STRESS_DIR)
+    os.makedirs(STRESS_DIR)
+    ext = os.path.splitext(src)[1]
+    urls = []
+    for x in range(0, num):
+        url = os.path.join(STRESS_DIR, 'atlas_%d%s' % (x, ext))
+        shutil.copy(src, url)
+        urls.append(url)
+    return urls
+
+class LoadStress(Scene):
+    def __init__(self, urls, perFrame=10, **data):
+        self.urls = urls
+        self.perFrame = perFrame
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                },
+                "components":[
+                        {
+                        "id": "fps",
+                        "type":"Text",
+                        "font": u"images/teenbold.ttf",
+                        "htmlColor": u"#ffffff",
+                        "text":u"0",
+                        "size": 48,
+                        "x": 0,
+                        "y": 0,
+                        "z": 1000
+                    }
+                ]
+        }
+        super(LoadStress, self).__init__(**data)
+
+    def sceneInit(self):
+        self.next = 0
+        self.entitiesAdded = []
+        self.frames = 0
+        self.worstFrame = 0
+        self.reported = False
+        super(LoadStress, self).sceneInit()
+        maxx, maxy = Gilbert().renderer.screenSize
+        self.size = {'width': maxx, 'height': maxy}
+        self.resolution = {'width': maxx, 'height': maxy}
+        Gilbert().renderer.scrollTo(0,0)
+        self.random = Random()
+
+    def update(self, data):
+        """ Add a few atlases per frame and keep track of the worst frame time until all of them are on screen """
+        gameLoop = Gilbert().gameLoop
+        if self.frames > 0:
+            self.worstFrame = max(self.worstFrame, gameLoop.frame_time)
+        self.frames += 1
+
+        for url in self.urls[self.next:self.next+self.perFrame]:
+            data = {"components":[
+                    {
+                    "type":"Sprite",
+                    "file":unicode(url),
+                    "x": 0,
+                    "y": 0
+                },
+            ]}
+            entity = Entity.create(id = url, scene=self, **data)
+            entity.x = self.random.random()*self.size['width']
+            entity.y = self.random.random()*self.size['height']
+            entity.z = 0
+            self.entities[entity.id] = entity
+            self.entitiesAdded.append(entity)
+            Gilbert().startEntity(entity)
+        self.next += self.perFrame
+
+        if not self.reported and self.next >= len(self.urls):
+            loaded = len([e for e in self.entitiesAdded if e._initialized])
+            worst = self.worstFrame * 1000.0 / gameLoop.ticks_second
+            fps = self.getComponent("fps")
+            if fps != None:
+                fps.text = '%d/%d %.1fms' % (loaded, len(self.urls), worst)
+            if loaded == len(self.urls):
+                debug('Loaded %d atlases in %d frames, worst frame time: %.2f ms' % (loaded, self.frames, worst))
+                self.reported = True
+
+def run(urls, perFrame):
+    try:
+        Log(0)
+        scene = LoadStress(urls, perFrame)
+        Gilbert().init(BACKENDS.sdl, scene)
+    except:
+        pass
+
+if __name__ == '__main__':
+    parser = Gilbert().parser
+    parser.add_option("--atlases", dest="atlases", default=500,help="Amount of atlases to load (default: 500)")
+    parser.add_option("--perframe", dest="perframe", default=10,help="Amount of atlases requested per frame (default: 10)")
+    parser.add_option("--image", dest="image", default='images/wabbit_alpha.png',help="Source image for the atlases")
+    parser.add_option("--syncimages", action="store_true", dest="syncimages", default=False,help="Decode images in the render thread")
+    (options, args) = parser.parse_args()
+    urls = makeAtlases(options.image, int(options.atlases))
+    if options.syncimages:
+        from ignifuga.backends.sdl.DataManager import DataManager
+        DataManager.asyncImages = False
+    run(urls, int(options.perframe))
@@ -0,0 +1,95 @@
+#!./ignifuga-python
+# Ignifuga Game Engine asset pack loading benchmark
+# Copies an image and a font into hundreds of loose files, packs them and times loading all of them from the loose files and from the pack
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.PackFile import writePack
+from ignifuga.backends.sdl.SDL import readFile
+import os, shutil, time
+
+NUM_ASSETS = 500
+PACK_DIR = os.path.join('images', 'pack')
+PACK_FILE = 'packload.pack'
+
+def makeAssets(num):
+    """ Every asset gets its own file, as a game without a pack would have them """
+    if os.path.isdir(PACK_DIR):
+        shutil.rmtree(PACK_DIR)
+    os.makedirs(PACK_DIR)
+    images, fonts = [], []
+    for x in range(0, num):
+        url = os.path.join(PACK_DIR, 'wabbit_%d.png' % x)
+        shutil.copy(os.path.join('images', 'wabbit_alpha.png'), url)
+        images.append(url)
+        if x % 10 == 0:
+            url = os.path.join(PACK_DIR, 'font_%d.ttf' % x)
+            shutil.copy(os.path.join('images', 'teenbold.ttf'), url)
+            fonts.append(url)
+    writePack(PACK_FILE, [(url, url) for url in images + fonts])
+    return images, fonts
+
+def load(dataManager, images, fonts):
+    """ Load (and give back) every asset, then drop them all so the next run starts cold """
+    start = time.time()
+    for url in images:
+        dataManager.release(dataManager.getImage(url))
+    for url in fonts:
+        dataManager.release(dataManager.getFont(url, 24))
+    elapsed = time.time() - start
+    dataManager.cleanup(True)
+    return elapsed
+
+def read(urls, reader):
+    start = time.time()
+    size = 0
+    for url in urls:
+        size += len(reader(url))
+    return time.time() - start, size
+
+class PackLoad(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(PackLoad, self).__init__(**data)
+
+    def sceneInit(self):
+        super(PackLoad, self).sceneInit()
+        dataManager = Gilbert().dataManager
+        images, fonts = makeAssets(NUM_ASSETS)
+
+        dataManager.pack = None
+        loose = load(dataManager, images, fonts)
+        looseRead, size = read(images + fonts, readFile)
+
+        start = time.time()
+        dataManager.openPack(PACK_FILE)
+        opened = time.time() - start
+        packed = load(dataManager, images, fonts)
+        packedRead, size = read(images + fonts, dataManager.pack.read)
+
+        debug('%d images, %d fonts (%d bytes)' % (len(images), len(fonts), size))
+        debug('Loose files:  %.2f ms (reading %.2f ms)' % (loose*1000.0, looseRead*1000.0))
+        debug('Asset pack:   %.2f ms (reading %.2f ms, mapping %.2f ms)' % (packed*1000.0, packedRead*1000.0, opened*1000.0))
+        debug('Pack lookups: %s' % dataManager.pack.stats)
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    Gilbert().init(BACKENDS.sdl, PackLoad())
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,113 @@
+#!./ignifuga-python
+# Ignifuga Game Engine scene prefetching benchmark
+# A loading scene prefetches a scene with hundreds of different atlases while showing the progress, then changes to it
+# and reports how long the change took and the worst frame time until the new scene is fully loaded.
+# Run with --noprefetch to change scenes right away and compare.
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from _random import Random
+import os, shutil, time
+
+STRESS_DIR = os.path.join('images', 'prefetch')
+RESOLUTION = {"width":1920, "height":1200}
+
+def makeAtlases(src, num):
+    """ Every atlas gets its own file, so every one of them has to be decoded """
+    if os.path.isdir(STRESS_DIR):
+        shutil.rmtree(STRESS_DIR)
+    os.makedirs(STRESS_DIR)
+    ext = os.path.splitext(src)[1]
+    urls = []
+    for x in range(0, num):
+        url = os.path.join(STRESS_DIR, 'atlas_%d%s' % (x, ext))
+        shutil.copy(src, url)
+        urls.append(url)
+    return urls
+
+def targetSceneData(urls):
+    random = Random()
+    entities = {}
+    for url in urls:
+        entities[url] = {"components": {
+            "sprite": {"type": "Sprite", "file": unicode(url), "x": random.random()*RESOLUTION['width'], "y": random.random()*RESOLUTION['height']}
+        }}
+    return {"entities": entities, "resolution": RESOLUTION, "size": RESOLUTION, "autoScale": False, "autoCenter": True}
+
+class TargetScene(Scene):
+    def update(self, data):
+        """ Track the worst frame until every entity finished loading """
+        gameLoop = Gilbert().gameLoop
+        loading = Gilbert().loading
+        loading.frames += 1
+        loading.worstFrame = max(loading.worstFrame, gameLoop.frame_time)
+        if not loading.reported and len([e for e in self.entities.itervalues() if e._initialized]) == len(self.entities):
+            worst = loading.worstFrame * 1000.0 / gameLoop.ticks_second
+            debug('Changed scene in %.2f ms, %d entities loaded in %d frames, worst frame time: %.2f ms' % (loading.changeTime*1000.0, len(self.entities), loading.frames, worst))
+            loading.reported = True
+            Gilbert().endLoop()
+
+class LoadingScene(Scene):
+    def __init__(self, urls, prefetch=True, **data):
+        self.urls = urls
+        self.prefetch = prefetch
+        data = {"resolution": RESOLUTION,
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size": RESOLUTION,
+                "components":[
+                        {
+                        "id": "progress",
+                        "type":"Text",
+                        "font": u"images/teenbold.ttf",
+                        "htmlColor": u"#ffffff",
+                        "text":u"0%",
+                        "size": 48,
+                        "x": 0,
+                        "y": 0,
+                        "z": 1000
+                    }
+                ]
+        }
+        super(LoadingScene, self).__init__(**data)
+
+    def sceneInit(self):
+        super(LoadingScene, self).sceneInit()
+        self.frames = 0
+        self.worstFrame = 0
+        self.reported = False
+        self.changeTime = 0
+        Gilbert().loading = self
+        Gilbert().scenes['target'] = TargetScene(id='target', **targetSceneData(self.urls))
+
+    def update(self, data):
+        gilbert = Gilbert()
+        if self.prefetch:
+            prefetch = gilbert.prefetchScene('target')
+            progress = self.getComponent("progress")
+            if progress != None:
+                progress.text = '%d%%' % (prefetch.progress * 100)
+            if not prefetch.done:
+                return
+        start = time.time()
+        gilbert.changeScene('target')
+        self.changeTime = time.time() - start
+
+def run(urls, prefetch):
+    try:
+        Log(0)
+        Gilbert().init(BACKENDS.sdl, LoadingScene(urls, prefetch))
+    except:
+        pass
+
+if __name__ == '__main__':
+    parser = Gilbert().parser
+    parser.add_option("--atlases", dest="atlases", default=500,help="Amount of atlases in the scene (default: 500)")
+    parser.add_option("--image", dest="image", default='images/wabbit_alpha.png',help="Source image for the atlases")
+    parser.add_option("--noprefetch", action="store_false", dest="prefetch", default=True,help="Change scenes without prefetching")
+    (options, args) = parser.parse_args()
+    run(makeAtlases(options.image, int(options.atlases)), options.prefetch)
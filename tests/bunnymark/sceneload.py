@@ -0,0 +1,106 @@
+#!./ignifuga-python
+# Ignifuga Game Engine scene loading benchmark
+# Writes a scene with 5k entities (as JSON and precompiled) and times loading it and building its entities and components
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.components.Component import Component
+from ignifuga.Scene import Scene
+from ignifuga.Entity import Entity
+from ignifuga.SceneData import sanitizeData, compileData, freeze
+from copy import deepcopy
+import os, json, time
+
+NUM_ENTITIES = 5000
+SCENES_DIR = os.path.join('data', 'scenes')
+
+def writeScene(name):
+    """ A scene with NUM_ENTITIES entities, each one with a couple of components """
+    entities = {}
+    for i in range(NUM_ENTITIES):
+        entities['entity_%d' % i] = {
+            "tags": ["bench", "entity"],
+            "components": {
+                "position": {"type": "Component", "x": i % 100, "y": i / 100, "z": 0, "frequency": 15.0},
+                "info": {"type": "Component", "label": u"Entity %d" % i, "values": [1, 2, 3, {"nested": True}]}
+            }
+        }
+    data = {name: {"entities": entities, "resolution": {"width": 1920, "height": 1200}}}
+    if not os.path.isdir(SCENES_DIR):
+        os.makedirs(SCENES_DIR)
+    with open(os.path.join(SCENES_DIR, name + '.json'), 'wb') as f:
+        json.dump(data, f)
+    sanitized = dict(sanitizeData(k,v) for k,v in data.items())
+    with open(os.path.join(SCENES_DIR, name + '.scene'), 'wb') as f:
+        f.write(compileData(sanitized))
+
+def build(scenes, copier):
+    """ Build the entities and their components as loadScenes, Entity.setup and Component.load would """
+    count = 0
+    for scene_id, scene_data in copier(scenes).iteritems():
+        for entity_id, entity_data in scene_data['entities'].iteritems():
+            entity = Entity.create(id=entity_id, **entity_data)
+            for c_id, c_data in entity._data['components'].iteritems():
+                Component.create(**dict(c_data, id=c_id))
+                count += 1
+            entity.free()
+    return count
+
+class SceneLoad(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(SceneLoad, self).__init__(**data)
+
+    def sceneInit(self):
+        super(SceneLoad, self).sceneInit()
+        dataManager = Gilbert().dataManager
+        name = 'sceneload'
+        writeScene(name)
+        jsonURL = os.path.join(SCENES_DIR, name + '.json')
+
+        start = time.time()
+        scenes = dataManager.loadJsonFile(jsonURL)
+        parsed = time.time()
+        # The pipeline before precompiled scenes, deepcopying the data for the scene, each entity and each component
+        components = build(scenes, deepcopy)
+        deepcopied = time.time()
+        dataManager.cache.clear()
+
+        start2 = time.time()
+        scenes = dataManager.loadJsonFile(jsonURL)
+        parsed2 = time.time()
+        build(scenes, freeze)
+        copied = time.time()
+        dataManager.cache.clear()
+
+        start3 = time.time()
+        url, scenes = dataManager.loadSceneData(name)
+        loaded = time.time()
+        build(scenes, freeze)
+        shared = time.time()
+
+        debug('%d entities, %d components' % (NUM_ENTITIES, components))
+        debug('JSON + deepcopies:  %.2f ms (parse %.2f ms)' % ((deepcopied-start)*1000.0, (parsed-start)*1000.0))
+        debug('JSON + freeze:      %.2f ms (parse %.2f ms)' % ((copied-start2)*1000.0, (parsed2-start2)*1000.0))
+        debug('Precompiled:        %.2f ms (load %.2f ms)' % ((shared-start3)*1000.0, (loaded-start3)*1000.0))
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    Gilbert().init(BACKENDS.sdl, SceneLoad())
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,87 @@
+#!./ignifuga-python
+# Ignifuga Game Engine sprite seeking benchmark
+# Builds a 500 frame deltap sprite and times random access seeks with and without periodic keyframes
+# This code is licensed under MIT License
+# Cython version
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.backends.sdl.Sprite cimport _Sprite
+from ignifuga.backends.sdl.Canvas cimport Canvas
+from ignifuga.backends.sdl.SDL cimport *
+
+from _random import Random
+
+# cython: boundscheck=False
+# cython: wraparound=False
+
+DEF NUM_FRAMES = 500
+DEF NUM_SEEKS = 1000
+DEF KEYFRAME_INTERVAL = 25
+DEF DELTA_SIZE = 8
+
+def spriteData(Canvas canvas, int keyframeInterval):
+    """ Sprite data as grossman would emit it: a full first frame, small delta boxes, and a full frame every keyframeInterval frames """
+    cdef int i, x, y
+    r = Random()
+    r.seed(NUM_FRAMES)
+    full = [(0, 0, 0, 0, canvas._width, canvas._height)]
+    frames = [full]
+    keyframes = [0]
+    for i in range(1, NUM_FRAMES):
+        if keyframeInterval > 0 and i % keyframeInterval == 0:
+            frames.append(full)
+            keyframes.append(i)
+        else:
+            x = <int>(r.random()*(canvas._width-DELTA_SIZE))
+            y = <int>(r.random()*(canvas._height-DELTA_SIZE))
+            frames.append([(x, y, x, y, DELTA_SIZE, DELTA_SIZE)])
+    return {'type': 'deltap', 'frames': frames, 'keyframes': keyframes}
+
+cdef double _timeSeeks(_Sprite sprite, list seeks):
+    cdef Uint64 start = SDL_GetPerformanceCounter()
+    for frame in seeks:
+        sprite.frame(frame)
+    return (SDL_GetPerformanceCounter() - start) * 1000.0 / SDL_GetPerformanceFrequency()
+
+class SeekBench(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(SeekBench, self).__init__(**data)
+
+    def sceneInit(self):
+        cdef Canvas canvas = Gilbert().dataManager.getImage('images/wabbit_alpha.png')
+        cdef _Sprite sprite
+        super(SeekBench, self).sceneInit()
+
+        r = Random()
+        seeks = [<int>(r.random()*NUM_FRAMES) for i in range(NUM_SEEKS)]
+
+        debug('%d frames, %d random seeks' % (NUM_FRAMES, NUM_SEEKS))
+        for interval in (0, KEYFRAME_INTERVAL):
+            sprite = _Sprite(spriteData(canvas, interval), canvas)
+            sprite.blits = 0
+            elapsed = _timeSeeks(sprite, seeks)
+            debug('Keyframe interval %3d: %.2f ms, %.1f blits per seek' % (interval, elapsed, float(sprite.blits)/NUM_SEEKS))
+            sprite.free()
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    Gilbert().init(BACKENDS.sdl, SeekBench())
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,69 @@
+#!./ignifuga-python
+# Ignifuga Game Engine sound loading benchmark
+# Loads a long track (a ten minute OGG works best) as streamed music, as a lazy chunk and as a fully decoded chunk,
+# and reports how long each one takes to load and how much memory it takes.
+# Usage: ./com.mdqinc.soundload [track.ogg] (sounds/track.ogg by default)
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.backends.sdl.Sound import MixChunk, MixMusic
+import sys, os, time
+
+def memory():
+    """ Resident and peak resident memory in KB (Linux only) """
+    rss = hwm = 0
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+            elif line.startswith('VmHWM:'):
+                hwm = int(line.split()[1])
+    return rss, hwm
+
+def measure(label, loader):
+    rss, hwm = memory()
+    start = time.time()
+    asset = loader()
+    elapsed = time.time() - start
+    rss2, hwm2 = memory()
+    debug('%-14s load %8.2f ms, RSS +%6d KB, peak RSS %6d KB (+%d KB)' % (label, elapsed*1000.0, rss2-rss, hwm2, hwm2-hwm))
+    return asset
+
+class SoundLoad(Scene):
+    def __init__(self, url, **data):
+        self.url = url
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(SoundLoad, self).__init__(**data)
+
+    def sceneInit(self):
+        super(SoundLoad, self).sceneInit()
+        debug('Loading %s' % self.url)
+        # Decoded chunks take the most memory and the peak never goes back down, so they go last
+        music = measure('Music', lambda: MixMusic(srcURL=self.url))
+        lazy = measure('Lazy chunk', lambda: MixChunk(srcURL=self.url, lazy=True))
+        measure('Lazy decode', lambda: lazy.decode())
+        chunk = measure('Chunk', lambda: MixChunk(srcURL=self.url))
+        debug('Decoded chunk: %d KB' % (chunk.size / 1024))
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    args = [arg for arg in sys.argv[1:] if os.path.isfile(arg)]
+    Gilbert().init(BACKENDS.sdl, SoundLoad(args[0] if args else 'sounds/track.ogg'))
+
+if __name__ == '__main__':
+    run()
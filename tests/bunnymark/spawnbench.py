@@ -0,0 +1,86 @@
+#!./ignifuga-python
+# Ignifuga Game Engine entity spawning benchmark
+# Spawns 10k entities (and their components) from one template, first from a plain template that every entity copies
+# and then from a frozen template that all of them share until they write to it, and reports time and memory taken
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.components.Component import Component
+from ignifuga.Scene import Scene
+from ignifuga.Entity import Entity
+from ignifuga.SceneData import freeze
+import gc, time
+
+NUM_ENTITIES = 10000
+
+TEMPLATE = {
+    "tags": ["bench", "enemy"],
+    "components": {
+        "position": {"type": "Component", "x": 0, "y": 0, "z": 0, "frequency": 15.0},
+        "info": {"type": "Component", "label": u"Enemy", "values": [1, 2, 3, {"nested": True}]},
+        "path": {"type": "Component", "points": [[x, x*2] for x in range(20)], "loop": True, "speed": {"x": 1.0, "y": 0.5}}
+    }
+}
+
+def memory():
+    """ Resident memory in KB (Linux only) """
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+def spawn(template):
+    """ Spawn the entities and their components as Entity.init would, keeping them all alive """
+    gc.collect()
+    rss = memory()
+    start = time.time()
+    spawned = []
+    for i in xrange(NUM_ENTITIES):
+        entity = Entity.create(id='enemy_%d' % i, **template)
+        spawned.append(entity)
+        for c_id, c_data in entity._data['components'].iteritems():
+            spawned.append(Component.create(**dict(c_data, id=c_id)))
+    elapsed = time.time() - start
+    rss = memory() - rss
+    # Writing to the data of a spawned entity doesn't touch the template or the other entities
+    spawned[0]._data['tags'] = ['bench', 'boss']
+    spawned[0]._data.mutable('components').mutable('position')['x'] = 100
+    assert spawned[len(template['components'])+1]._data['tags'] == template['tags']
+    for obj in spawned:
+        obj.free()
+    return elapsed, rss
+
+class SpawnBench(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(SpawnBench, self).__init__(**data)
+
+    def sceneInit(self):
+        super(SpawnBench, self).sceneInit()
+        copied, copiedRSS = spawn(TEMPLATE)
+        shared, sharedRSS = spawn(freeze(TEMPLATE))
+        debug('%d entities, %d components each' % (NUM_ENTITIES, len(TEMPLATE['components'])))
+        debug('Plain template:  %.2f ms, RSS +%d KB' % (copied*1000.0, copiedRSS))
+        debug('Frozen template: %.2f ms, RSS +%d KB' % (shared*1000.0, sharedRSS))
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    Gilbert().init(BACKENDS.sdl, SpawnBench())
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,98 @@
+#!./ignifuga-python
+# Ignifuga Game Engine synced sprite start test
+# Shows the same small animation on synced and unsynced sprites, and checks every one of them ran its onStart and onLoop callbacks
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug, error
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.Entity import Entity
+import os, json, struct, zlib
+
+SPRITE_FILE = os.path.join('images', 'syncstart.png')
+NUM_SPRITES = 50
+NUM_FRAMES = 4
+FRAME_SIZE = 32
+TEST_FRAMES = 120
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+def makeSprite(path):
+    """ A horizontal strip of solid frames with its sprite data in a zTXt chunk, as grossman stores it """
+    w, h = FRAME_SIZE * NUM_FRAMES, FRAME_SIZE
+    rows = ''
+    for y in range(h):
+        rows += '\0' + ''.join(struct.pack('BBBB', 64 * (x / FRAME_SIZE), 255, 255 - 64 * (x / FRAME_SIZE), 255) for x in range(w))
+    data = {'type': 'atlas', 'frames': [[[f * FRAME_SIZE, 0, 0, 0, FRAME_SIZE, FRAME_SIZE]] for f in range(NUM_FRAMES)], 'keyframes': []}
+    with open(path, 'wb') as f:
+        f.write('\x89PNG\r\n\x1a\n')
+        f.write(_chunk('IHDR', struct.pack('>IIBBBBB', w, h, 8, 6, 0, 0, 0)))
+        f.write(_chunk('zTXt', 'SPRITE\0\0' + zlib.compress(json.dumps(data))))
+        f.write(_chunk('IDAT', zlib.compress(rows)))
+        f.write(_chunk('IEND', ''))
+
+class SyncStart(Scene):
+    def __init__(self,**data):
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                }
+        }
+        super(SyncStart, self).__init__(**data)
+
+    def sceneInit(self):
+        super(SyncStart, self).sceneInit()
+        self.frames = 0
+        self.started = {True: 0, False: 0}
+        self.looped = {True: set(), False: set()}
+        for i in range(NUM_SPRITES * 2):
+            synced = i % 2 == 0
+            data = {"components":[
+                    {
+                    "type":"Sprite",
+                    "file":unicode(SPRITE_FILE),
+                    "synced": synced,
+                    "frequency": 30.0,
+                    "onStart": lambda sprite, synced=synced: self._started(synced),
+                    "onLoop": lambda sprite, synced=synced: self.looped[synced].add(id(sprite)),
+                    "x": (i % 40) * FRAME_SIZE,
+                    "y": (i / 40) * FRAME_SIZE
+                },
+            ]}
+            entity = Entity.create(id = 'sprite_%d' % i, scene=self, **data)
+            self.entities[entity.id] = entity
+            Gilbert().startEntity(entity)
+
+    def _started(self, synced):
+        self.started[synced] += 1
+
+    def update(self, data):
+        self.frames += 1
+        if self.frames < TEST_FRAMES:
+            return
+        ok = True
+        for synced in (True, False):
+            kind = 'synced' if synced else 'unsynced'
+            if self.started[synced] != NUM_SPRITES or len(self.looped[synced]) != NUM_SPRITES:
+                error('FAIL: %d/%d %s sprites started, %d looped' % (self.started[synced], NUM_SPRITES, kind, len(self.looped[synced])))
+                ok = False
+        if ok:
+            debug('PASS: every synced and unsynced sprite started and looped')
+        Gilbert().endLoop()
+
+def run():
+    Log(0)
+    makeSprite(SPRITE_FILE)
+    Gilbert().init(BACKENDS.sdl, SyncStart())
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,104 @@
+#!./ignifuga-python
+# Ignifuga Game Engine text stress test
+# Rewrites the text of every label on screen in every frame, each rewrite replaces the label canvas texture.
+# This code is licensed under MIT License
+
+from ignifuga.Gilbert import Gilbert, BACKENDS
+from ignifuga.Log import Log, debug
+from ignifuga.components import *
+from ignifuga.Scene import Scene
+from ignifuga.Entity import Entity
+from _random import Random
+
+class TextStress(Scene):
+    def __init__(self, labels=1000, **data):
+        self.labels = labels
+        data = {"resolution":{
+                    "width":1920,
+                    "height":1200
+                },
+                "keepAspect":True,
+                "autoScale": False,
+                "autoCenter": True,
+                "size":{
+                    "width":1920,
+                    "height":1200
+                },
+                "components":[
+                        {
+                        "id": "fps",
+                        "type":"Text",
+                        "font": u"images/teenbold.ttf",
+                        "htmlColor": u"#ffffff",
+                        "text":u"0",
+                        "size": 48,
+                        "x": 0,
+                        "y": 0,
+                        "z": 1000
+                    }
+                ]
+        }
+        super(TextStress, self).__init__(**data)
+
+    def sceneInit(self):
+        self.entitiesAdded = []
+        self.frames = 0
+        self.totalTime = 0
+        super(TextStress, self).sceneInit()
+        maxx, maxy = Gilbert().renderer.screenSize
+        self.size = {'width': maxx, 'height': maxy}
+        self.resolution = {'width': maxx, 'height': maxy}
+        Gilbert().renderer.scrollTo(0,0)
+        self.random = Random()
+
+        for x in range(0, self.labels):
+            data = {"components":[
+                    {
+                    "id": "label",
+                    "type":"Text",
+                    "font": u"images/teenbold.ttf",
+                    "htmlColor": u"#ffffff",
+                    "text":u"0",
+                    "size": 16
+                },
+            ]}
+            entity = Entity.create(id = 'label_%d' % x, scene=self, **data)
+            entity.x = self.random.random()*self.size['width']
+            entity.y = self.random.random()*self.size['height']
+            entity.z = 0
+            self.entities[entity.id] = entity
+            self.entitiesAdded.append(entity)
+            Gilbert().startEntity(entity)
+
+    def update(self, data):
+        """ Give every label a new text, and report the average frame time every 100 frames """
+        gameLoop = Gilbert().gameLoop
+        if self.frames > 0:
+            self.totalTime += gameLoop.frame_time
+        self.frames += 1
+
+        for entity in self.entitiesAdded:
+            label = entity.getComponent('label')
+            if label != None:
+                label.text = '%d' % self.frames
+
+        if self.frames % 100 == 0:
+            avg = self.totalTime * 1000.0 / gameLoop.ticks_second / (self.frames - 1)
+            fps = self.getComponent("fps")
+            if fps != None:
+                fps.text = '%d labels %.2fms' % (len(self.entitiesAdded), avg)
+            debug('%d labels rewritten per frame, average frame time: %.2f ms' % (len(self.entitiesAdded), avg))
+
+def run(labels):
+    try:
+        Log(0)
+        scene = TextStress(labels)
+        Gilbert().init(BACKENDS.sdl, scene)
+    except:
+        pass
+
+if __name__ == '__main__':
+    parser = Gilbert().parser
+    parser.add_option("--labels", dest="labels", default=1000,help="Amount of text labels to rewrite per frame (default: 1000)")
+    (options, args) = parser.parse_args()
+    run(int(options.labels))
@@ -19,7 +19,7 @@ from optparse import OptionParser
 import numpy as np
 import scipy as sp
 import scipy.ndimage.morphology
-import bitarray, base64, zlib
+import bitarray, base64, zlib, struct
 
 class NoFilesFound(Exception):
     pass
@@ -41,6 +41,8 @@ class Grossman:
         self.savediff = False
         self.groupFactor = 5
         self.keyframes = 0
+        self.rleHitmaps = False
+        self.hitmapFile = False
         
         nf = len(files)
         if nf == 0:
@@ -295,7 +297,27 @@ class Grossman:
                 frames.append(boxes)
 
 
-        jsondata = { 'type': self.compress if self.compress != None else 'atlas', 'frames': frames, 'hitmap': hitmaps, 'keyframes': keyframes }
+        jsondata = { 'type': self.compress if self.compress != None else 'atlas', 'frames': frames, 'keyframes': keyframes,
+                     'hitmapFormat': 'rle' if self.rleHitmaps else 'bits' }
+
+        if self.hitmapFile:
+            # Store the hitmaps raw in a sidecar file (so the engine can map it), the sprite data only keeps where each one is
+            name = os.path.splitext(os.path.basename(self.output))[0] + '.hitmap'
+            spans = []
+            offset = 0
+            fp = open(os.path.join(os.path.dirname(self.output), name), 'wb')
+            for hitmap in hitmaps:
+                # Keep every hitmap 4 byte aligned
+                padding = (4 - len(hitmap) % 4) % 4
+                fp.write(hitmap + '\0' * padding)
+                spans.append((offset, len(hitmap)))
+                offset += len(hitmap) + padding
+            fp.close()
+            self.report('Saved hitmaps to %s (%d bytes)' % (name, offset))
+            jsondata['hitmapFile'] = name
+            jsondata['hitmap'] = spans
+        else:
+            jsondata['hitmap'] = [base64.b64encode(hitmap) for hitmap in hitmaps]
         #json.dump(jsondata, fp, indent=2)
 
         #target.convert('RGB').save(self.output+'.rgb.png', "PNG")
@@ -308,6 +330,9 @@ class Grossman:
         target.save(self.output, "PNG", pnginfo=meta)
     
     def createHitmap (self, im):
+        if self.rleHitmaps:
+            return self.createRLEHitmap(im)
+
         r,g,b,a = im.split()
         # Traverse the alpha map
         alpha = a.getdata()
@@ -320,8 +345,34 @@ class Grossman:
                 hitmap[k] = 1
                 
                 
-        #return base64.b64encode(zlib.compress(hitmap.tostring()))
-        return base64.b64encode(hitmap.tostring())
+        #return zlib.compress(hitmap.tostring())
+        return hitmap.tostring()
+
+    def createRLEHitmap (self, im):
+        """ Run length encoded hitmap: a row index of height+1 uint32 (where the runs of each row start, and where the last one ends)
+        followed by uint16 runs alternating transparent and opaque pixels, every row starts with a (possibly empty) transparent run """
+        w,h = im.size
+        alpha = im.split()[3].getdata()
+        rows = []
+        runs = []
+        for y in range(0, h):
+            rows.append(len(runs))
+            opaque = False
+            run = 0
+            for x in range(0, w):
+                if (alpha[y*w+x] != 0) != opaque:
+                    runs.append(run)
+                    opaque = not opaque
+                    run = 0
+                if run == 0xFFFF:
+                    # Too long for a run, continue it after an empty one of the opposite kind
+                    runs += [run, 0]
+                    run = 0
+                run += 1
+            runs.append(run)
+        rows.append(len(runs))
+
+        return struct.pack('<%dI' % len(rows), *rows) + struct.pack('<%dH' % len(runs), *runs)
         
     def getOptimalSize(self, iw, ih, num):
         """ Get the optimal texture size for a num of iw x ih sprites"""
@@ -611,9 +662,8 @@ if __name__ == '__main__':
     parser.add_option("--deltap",
                   action="store_true", dest="deltap", default=False,
                   help="Use difference against previous frame compression")
-    parser.add_option("-k", "--keyframes",
-                  action="store_true", dest="keyframes", default=0,
-                  help="Number of frames between each keyframe")
+    parser.add_option("-k", "--keyframes", dest="keyframes", default=0, type="int",
+                  help="Number of frames between each keyframe (deltap only), seeking replays at most this many deltas. Default: 0 (only the first frame)")
     parser.add_option("-d", "--boxes",
                   action="store_true", dest="boxes", default=False,
                   help="Draw boxes around the sprites")
@@ -625,6 +675,12 @@ if __name__ == '__main__':
                       help="Fit factor, default: 1.1")
     parser.add_option("--groupfactor", dest="groupfactor", default=5.0, type='float',
                       help="Grouping factor, default: 5.0")
+    parser.add_option("--rlehitmaps",
+                  action="store_true", dest="rlehitmaps", default=False,
+                  help="Run length encode the hitmaps (smaller, and tested without decoding)")
+    parser.add_option("--hitmapfile",
+                  action="store_true", dest="hitmapfile", default=False,
+                  help="Save the hitmaps to a .hitmap file next to the sprite instead of embedding them")
     parser.add_option("--savediff",
                   action="store_true", dest="savediff", default=False,
                   help="Save the inter frame differences as images")
@@ -668,5 +724,7 @@ if __name__ == '__main__':
     t.savediff = options.savediff
     t.groupFactor = options.groupfactor
     t.keyframes = options.keyframes
+    t.rleHitmaps = options.rlehitmaps
+    t.hitmapFile = options.hitmapfile
     t.convert(chroma)
     
\ No newline at end of file
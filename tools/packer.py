@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+
+# Packer - The Ignifuga Game Engine asset packing utility
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+# Packs asset files into a single file the engine maps at startup (assets.pack next to the game), see PackFile.py for the format
+# Files are stored under their path relative to the root directory, which is how the game refers to them (data/images/...)
+# Arguments of the form name=path store a file under an arbitrary name, embedded:name stands in for an embedded asset
+
+import os, sys
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from PackFile import writePack, normalizeURL
+
+def collect(root, args, exclude):
+    """ List the (url, path) of the assets to pack """
+    assets = []
+    for arg in args:
+        if '=' in arg:
+            url, path = arg.split('=', 1)
+            assets.append((url, path))
+            continue
+        path = os.path.join(root, arg)
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+                for filename in filenames:
+                    if not filename.startswith('.'):
+                        filepath = os.path.join(dirpath, filename)
+                        assets.append((normalizeURL(os.path.relpath(filepath, root)), filepath))
+        else:
+            assets.append((normalizeURL(os.path.relpath(path, root)), path))
+    return [(url, path) for url, path in assets if os.path.abspath(path) != exclude]
+
+if __name__ == '__main__':
+    usage = "packer.py data [more files or directories, or name=file ...] [--root=.] [--output=assets.pack]"
+    parser = OptionParser(usage=usage, version="Packer - Asset packing utility 1.0")
+    parser.add_option("-r", "--root", dest="root", default='.',
+                  help="Directory the asset urls are relative to (default: current directory)", metavar="DIR")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                  help="Output file (default: assets.pack in the root directory)", metavar="FILE")
+    parser.add_option("-q", "--quiet", action="store_false", dest="verbose", default=True,
+                  help="Don't print status messages to stdout")
+    (options, args) = parser.parse_args()
+
+    if len(args) < 1:
+        parser.print_help()
+        exit()
+
+    output = options.output if options.output is not None else os.path.join(options.root, 'assets.pack')
+    assets = collect(options.root, args, os.path.abspath(output))
+    try:
+        size = writePack(output, assets)
+    except (IOError, OSError, ValueError), ex:
+        print "ERROR: Could not write %s: %s" % (output, ex)
+        exit(1)
+    if options.verbose:
+        for url, path in assets:
+            print "%s <- %s" % (url, path)
+        print "%s: %d assets, %d bytes" % (output, len(assets), size)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#Copyright (c) 2010-2012, Gabriel Jacobo
+#All rights reserved.
+#Permission to use this file is granted under the conditions of the Ignifuga Game Engine License
+#whose terms are available in the LICENSE file or at http://www.ignifuga.org/license
+
+
+# Scene compiler - The Ignifuga Game Engine scene precompiling utility
+# Author: Gabriel Jacobo <gabriel@mdqinc.com>
+
+# Converts scene JSON files (data/scenes/*.json) into the sanitized binary form the engine loads without parsing (data/scenes/*.scene)
+# See SceneData.py for the format
+
+import os, sys, json
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'src'))
+from SceneData import sanitizeData, compileData
+
+def compileScene(src, dst):
+    """ Compile a scene JSON file, returns the number of top level entries (scenes) in it """
+    with open(src, 'rb') as f:
+        data = json.load(f)
+    sanitized = {}
+    for k,v in data.items():
+        key, value = sanitizeData(k,v)
+        sanitized[key] = value
+    with open(dst, 'wb') as f:
+        f.write(compileData(sanitized))
+    return len(sanitized)
+
+if __name__ == '__main__':
+    usage = "scenecompiler.py scenes.json [more.json ...] [--output=scenes.scene]"
+    parser = OptionParser(usage=usage, version="Scene compiler - Scene precompiling utility 1.0")
+    parser.add_option("-o", "--output", dest="output", default=None,
+                  help="Output file (only with a single input file, by default the input name with a .scene extension)", metavar="FILE")
+    parser.add_option("-q", "--quiet", action="store_false", dest="verbose", default=True,
+                  help="Don't print status messages to stdout")
+    (options, args) = parser.parse_args()
+
+    if len(args) < 1 or (options.output is not None and len(args) > 1):
+        parser.print_help()
+        exit()
+
+    for src in args:
+        dst = options.output if options.output is not None else os.path.splitext(src)[0] + '.scene'
+        try:
+            count = compileScene(src, dst)
+        except (IOError, ValueError), ex:
+            print "ERROR: Could not compile %s: %s" % (src, ex)
+            exit(1)
+        if options.verbose:
+            print "%s -> %s (%d scenes)" % (src, dst, count)